@@ -3,18 +3,29 @@ import time
 import aiohttp
 import cloudscraper
 from typing import Dict, Any, List
+from urllib.parse import urlparse
 from agents.base_agent import BaseAgent
+from infrastructure.host_health import HostHealth, backoff, is_failure
 from infrastructure.message_queue import MessageQueue
 from infrastructure.raw_db import RawDB
 
 class CrawlAgent(BaseAgent):
     """
     Responsible for fetching URLs, storing raw HTML, and triggering the Clean Agent.
+    Messages are handled concurrently, so a HostHealth caps the fetches in
+    flight per host. Failed fetches are retried with jittered exponential
+    backoff, and URLs for a host whose circuit breaker is open are parked
+    until it may be probed again.
     """
-    def __init__(self, mq: MessageQueue, raw_db: RawDB):
+    def __init__(self, mq: MessageQueue, raw_db: RawDB, health: HostHealth = None, max_retries: int = 3):
         super().__init__(mq, "CrawlAgent")
         self.raw_db = raw_db
         # In a real system, respect robots.txt and store crawl delays natively mapped per domain.
+        self.health = health or HostHealth()
+        self.owns_health = health is None # A HostHealth shared with other agents is closed by its owner
+        self.max_retries = max_retries
+        self.parked = {} # host -> messages waiting for its breaker to half-open
+        self._tasks = set() # Unpark and retry timers, cancelled by close()
 
     def get_listen_topic(self) -> str:
         return "crawl_targets"
@@ -42,14 +53,61 @@ class CrawlAgent(BaseAgent):
         """Async wrapper for the blocking cloudscraper."""
         return await asyncio.to_thread(self._sync_fetch_url, url)
 
+    def _spawn(self, coro):
+        # The event loop only keeps a weak reference to tasks, so hold one until it finishes
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def park(self, host: str, message: Dict[str, Any]):
+        """Hold a message until the host's breaker half-opens, then re-publish everything parked for it."""
+        self.parked.setdefault(host, []).append(message)
+        if len(self.parked[host]) == 1:
+            self._spawn(self._unpark(host))
+
+    async def _unpark(self, host: str):
+        await asyncio.sleep(self.health.reopens_in(host))
+        messages = self.parked.pop(host, [])
+        self.logger.info(f"Retrying {host} with {len(messages)} parked URLs.")
+        for message in messages:
+            await self.mq.publish(self.get_listen_topic(), message)
+
+    async def _retry_later(self, message: Dict[str, Any], delay: float):
+        await asyncio.sleep(delay)
+        await self.mq.publish(self.get_listen_topic(), message)
+
     async def process_message(self, message: Dict[str, Any]):
         url = message.get("url")
         if not url:
             return
-            
+
+        host = urlparse(url).netloc
+        if not await self.health.acquire(host):
+            if self.health.is_dead(host):
+                print(f"[CrawlAgent] Skipped {url}: {host} keeps failing")
+            else:
+                self.park(host, message)
+            return
+
         print(f"[CrawlAgent] Crawling: {url}")
-        result = await self.fetch_url(url)
-        
+        start = time.perf_counter()
+        result = None
+        try:
+            result = await self.fetch_url(url)
+        finally:
+            status = result["status"] if result else None
+            if self.health.record(host, status, (time.perf_counter() - start) * 1000):
+                self.logger.warning(f"Circuit open for {host} for {self.health.reopens_in(host):.0f}s.")
+            await self.health.release(host)
+
+        if is_failure(status):
+            attempt = message.get("attempt", 0)
+            if attempt < self.max_retries and not self.health.is_dead(host):
+                delay = max(backoff(attempt), self.health.retry_after(host))
+                print(f"[CrawlAgent] Retrying {url} in {delay:.1f}s (status: {status or 'Failed'})")
+                self._spawn(self._retry_later({**message, "attempt": attempt + 1}, delay))
+                return
+
         if result and result["status"] == 200:
             html = result["html"]
             headers = result["headers"]
@@ -70,6 +128,14 @@ class CrawlAgent(BaseAgent):
             status = result["status"] if result else "Failed"
             print(f"[CrawlAgent] Skipped {url} due to bad status: {status}")
 
+    def close(self):
+        """Cancel pending retries and unparks (their messages are dropped)."""
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        if self.owns_health:
+            self.health.close()
+
     async def submit_target(self, url: str):
         """Helper to programmatically push a URL to crawl."""
         await self.mq.publish(self.get_listen_topic(), {"url": url})
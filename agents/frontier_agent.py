@@ -1,41 +1,80 @@
 import asyncio
 import hashlib
+import time
+from collections import Counter
 from urllib.parse import urlparse, urljoin
 from typing import Dict, Any
 
 from agents.base_agent import BaseAgent
 from infrastructure.message_queue import MessageQueue
+from infrastructure.seen_store import SeenURLStore
+from infrastructure.url_classifier import URLClassifier, DROP
+from infrastructure.url_normalizer import URLNormalizer
 
 class FrontierAgent(BaseAgent):
     """
     Manages the URL boundary. Listens for newly discovered links.
-    Filters out duplicates or off-domain links.
-    Pushes valid, unseen links back into the crawl_targets queue.
+    Filters out duplicates, off-domain links and spider traps (see URLClassifier).
+    Pushes valid, unseen links back into the crawl_targets queue. A page's
+    canonical URL is marked as seen, so its aliases aren't crawled twice.
     """
-    def __init__(self, mq: MessageQueue, allowed_domains: list = None):
+    def __init__(self, mq: MessageQueue, allowed_domains: list = None, seen_path: str = "frontier_agent_seen",
+                 classifier: URLClassifier = None, normalizer: URLNormalizer = None,
+                 flush_every: int = 5000, flush_interval: float = 60.0):
         super().__init__(mq, "FrontierAgent")
-        self.seen_urls = set()
+        # Persisted to disk so a restarted spider doesn't re-crawl everything it already queued
+        self.seen_urls = SeenURLStore(seen_path)
+        # The store only writes itself out when its buffer fills, so flush after this many new URLs or seconds
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
         self.allowed_domains = allowed_domains or []
+        # The crawl_targets queue has no priorities, so demoted URLs are still passed on
+        self.classifier = classifier or URLClassifier()
+        self.normalizer = normalizer or URLNormalizer()
+        self.dedup = Counter() # links, rewritten, collapsed, canonical_aliases
 
     def get_listen_topic(self) -> str:
         return "extracted_links_queue"
         
     def normalize_url(self, url: str) -> str:
-        """Standardize URL to prevent duplicate crawls of the same page."""
+        """Standardize URL to prevent duplicate crawls of the same page (see URLNormalizer for the rules)."""
         try:
-            parsed = urlparse(url)
-            netloc = parsed.netloc.lower()
-            if netloc.startswith("www."):
-                netloc = netloc[4:]
-                
-            normalized = f"{parsed.scheme}://{netloc}{parsed.path}"
-            if parsed.query:
-                query = "&".join(sorted(parsed.query.split("&")))
-                normalized = f"{normalized}?{query}"
-            return normalized
-        except Exception:
+            return self.normalizer(url)
+        except ValueError:
             return url
 
+    def get_url_hash(self, normalized: str) -> str:
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def dedup_rate(self) -> float:
+        """Share of links that only turned out to be duplicates after normalization."""
+        return self.dedup["collapsed"] / self.dedup["links"] if self.dedup["links"] else 0.0
+
+    def add_canonical(self, url: str, canonical_url: str) -> bool:
+        """Mark a page's canonical URL as seen, so links to it aren't crawled again. Returns whether it differed."""
+        canonical = self.normalize_url(canonical_url)
+        if canonical == self.normalize_url(url) or not canonical.startswith(("http://", "https://")):
+            return False
+        self.seen_urls.add_url_hashes([self.get_url_hash(canonical)])
+        self.dedup["canonical_aliases"] += 1
+        return True
+
+    def flush(self):
+        """Write the seen URLs to disk."""
+        self.seen_urls.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """Flush if enough new URLs or time have piled up since the last flush."""
+        if self.unflushed >= self.flush_every or (self.unflushed and time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self.flush()
+
     def is_allowed(self, url: str) -> bool:
         """Check if URL belongs to the target domain."""
         if not url.startswith(("http://", "https://")):
@@ -60,7 +99,14 @@ class FrontierAgent(BaseAgent):
         base_url = message.get("base_url")
         links = message.get("links", [])
         
-        added_count = 0
+        canonical_url = message.get("canonical_url")
+        if base_url and canonical_url:
+            self.add_canonical(base_url, canonical_url)
+
+        candidates = []
+        rewritten = []
+        dropped = 0
+        self.dedup["links"] += len(links)
         for link in links:
             # Resolve relative links
             absolute_url = urljoin(base_url, link)
@@ -69,16 +115,35 @@ class FrontierAgent(BaseAgent):
             if not self.is_allowed(absolute_url):
                 continue
                 
-            # Normalize and Deduplicate
             normalized = self.normalize_url(absolute_url)
-            url_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+            action, reason = self.classifier.classify(normalized)
+            if action == DROP:
+                self.logger.debug(f"Dropped {normalized}: {reason}")
+                dropped += 1
+                continue
+            candidates.append(normalized)
+            rewritten.append(normalized != absolute_url)
+            self.dedup["rewritten"] += normalized != absolute_url
+
+        if dropped:
+            self.logger.info(f"Dropped {dropped} trap/low-value URLs from {base_url}.")
+        if not candidates:
+            return
             
-            if url_hash not in self.seen_urls:
-                self.seen_urls.add(url_hash)
-                
+        # Deduplicate the whole link list in one batch lookup
+        url_hashes = [self.get_url_hash(normalized) for normalized in candidates]
+        is_new = self.seen_urls.add_url_hashes(url_hashes)
+        self.dedup["collapsed"] += sum(1 for new, changed in zip(is_new, rewritten) if changed and not new)
+        
+        added_count = 0
+        for normalized, new in zip(candidates, is_new):
+            if new:
                 # Push back into the crawler queue
                 await self.mq.publish("crawl_targets", {"url": normalized})
                 added_count += 1
                 
+        self.unflushed += added_count
+        self.maybe_flush()
         if added_count > 0:
-            self.logger.info(f"Added {added_count} new distinct URLs from {base_url} to crawl queue.")
+            self.logger.info(f"Added {added_count} new distinct URLs from {base_url} to crawl queue "
+                             f"(dedup rate so far {self.dedup_rate():.1%}).")
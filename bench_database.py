@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from crawler.db import init_sqlite_db
+from infrastructure.database import Database
+
+PAGE_SQL = """
+    INSERT OR REPLACE INTO pages (url_hash, url, domain, title, content_hash, last_crawled_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+def page_row(url_hash, i):
+    return (url_hash, f"https://example{i % 50}.com/{url_hash}", f"example{i % 50}.com", f"Page {url_hash}", f"{i:016x}")
+
+LINKS_SQL = "INSERT OR IGNORE INTO discovered_links (source_url_hash, target_url_hash, anchor_text) VALUES (?, ?, ?)"
+
+class LegacyWrites:
+    """
+    How StorageHelper used to write: a fresh aiosqlite connection and a commit
+    per call, with "database is locked" errors logged and the row dropped.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    async def save_page(self, url_hash, i):
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute(PAGE_SQL, page_row(url_hash, i))
+                await db.commit()
+            return True
+        except aiosqlite.OperationalError:
+            return False
+
+    async def save_links(self, url_hash, targets):
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany(LINKS_SQL, [(url_hash, t, "") for t in targets])
+                await db.commit()
+        except aiosqlite.OperationalError:
+            pass
+
+    async def count(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("SELECT COUNT(*) FROM pages") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def close(self):
+        pass
+
+class SharedWrites:
+    def __init__(self, db_path):
+        self.db = Database(db_path)
+
+    async def save_page(self, url_hash, i):
+        await self.db.execute(PAGE_SQL, page_row(url_hash, i))
+        return True
+
+    async def save_links(self, url_hash, targets):
+        await self.db.executemany(LINKS_SQL, [(url_hash, t, "") for t in targets])
+
+    async def count(self):
+        return (await self.db.fetchone("SELECT COUNT(*) FROM pages"))[0]
+
+    async def close(self):
+        await self.db.close()
+
+async def measure(store, workers, pages, links):
+    """`workers` concurrent crawl workers, each saving a page row and the page's links."""
+    latencies = []
+    saved = []
+    per_worker = pages // workers
+
+    async def worker(w):
+        for i in range(per_worker):
+            url_hash = f"{w:04d}-{i:06d}"
+            t = time.perf_counter()
+            saved.append(await store.save_page(url_hash, i))
+            await store.save_links(url_hash, [f"{url_hash}-{j}" for j in range(links)])
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(workers)))
+    elapsed = time.perf_counter() - start
+
+    assert await store.count() == sum(saved)
+    await store.close()
+    latencies.sort()
+    lost = len(saved) - sum(saved)
+    return len(saved) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], lost
+
+async def main():
+    parser = argparse.ArgumentParser(description="Page writes/s of per-call aiosqlite connections vs the shared batching writer.")
+    parser.add_argument("--workers", type=int, default=50, help="concurrent crawl workers")
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--links", type=int, default=30, help="links saved per page")
+    args = parser.parse_args()
+
+    print(f"{args.pages} pages from {args.workers} workers, {args.links} links each\n")
+    print(f"{'':32}{'pages/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'locked':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in [("aiosqlite connect+commit (old)", LegacyWrites), ("shared Database writer", SharedWrites)]:
+            path = os.path.join(tmp, f"{factory.__name__}.db")
+            await init_sqlite_db(path)
+            rate, p50, p95, lost = await measure(factory(path), args.workers, args.pages, args.links)
+            print(f"{name:32}{rate:>10.0f}{p50:>10.2f}{p95:>10.2f}{lost:>8}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
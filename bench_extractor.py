@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlparse, urljoin
+
+from bs4 import BeautifulSoup
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from crawler.parser import parse_html
+from infrastructure.raw_db import SQLiteRawDB
+
+def parse_html_bs4(html, base_url):
+    """The previous BeautifulSoup implementation of parse_html, kept here as the reference."""
+    soup = BeautifulSoup(html, 'lxml')
+    for element in soup(["script", "style", "nav", "footer", "aside", "header", "noscript", "iframe"]):
+        element.decompose()
+
+    title = soup.title.string.strip() if soup.title and soup.title.string else "No Title"
+
+    canonical_tag = soup.find('link', rel='canonical')
+    canonical_url = base_url
+    if canonical_tag and canonical_tag.has_attr('href'):
+        canonical_url = urljoin(base_url, canonical_tag['href'].strip())
+
+    og_image = soup.find('meta', property='og:image')
+    thumbnail_url = og_image['content'] if og_image and og_image.has_attr('content') else ""
+    if not thumbnail_url:
+        img = soup.find('img', src=True)
+        if img:
+            thumbnail_url = urljoin(base_url, img['src'])
+
+    og_type_tag = soup.find('meta', property='og:type')
+    page_type = og_type_tag['content'] if og_type_tag and og_type_tag.has_attr('content') else "website"
+    if 'youtube.com/watch' in base_url or 'vimeo.com' in base_url or 'video' in page_type.lower():
+        page_type = "video"
+    elif 'article' in page_type.lower() or 'news' in page_type.lower():
+        page_type = "article"
+
+    text = soup.get_text(separator=' ', strip=True)
+
+    links = set()
+    for a_tag in soup.find_all('a', href=True):
+        href = a_tag['href'].strip()
+        if not href or href.startswith('#') or href.startswith('javascript:'):
+            continue
+        full_url = urljoin(base_url, href)
+        if full_url.startswith(('http://', 'https://')):
+            parsed = urlparse(full_url)
+            clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+            if parsed.query:
+                clean_url += f"?{parsed.query}"
+            links.add(clean_url)
+
+    return title, text, canonical_url, list(links), thumbnail_url, page_type
+
+def make_page(rng, i, paragraphs=40):
+    """A synthetic but realistically shaped article page: head metadata, boilerplate, body text, many links."""
+    words = [f"term{rng.randrange(5000)}" for _ in range(paragraphs * 60)]
+    body = "".join(
+        f"<p>{' '.join(words[p * 60:(p + 1) * 60])} <a href='/article/{rng.randrange(10**6)}?ref=body#s{p}'>read more</a>"
+        f" &amp; <b>bold {p}</b><!-- note {p} --></p>\n"
+        for p in range(paragraphs)
+    )
+    nav = "".join(f"<li><a href='/section/{n}'>Section {n}</a></li>" for n in range(30))
+    return f"""<!DOCTYPE html>
+<html><head>
+<title> Article {i} &mdash; Example News </title>
+<link rel="canonical" href="/article/{i}">
+<meta property="og:type" content="article">
+<meta property="og:image" content="https://cdn.example.com/img/{i}.jpg">
+<style>body {{ font-family: sans-serif; }}</style>
+<script>var tracking = {{"id": {i}}};</script>
+</head><body>
+<header><a href="/">Home</a><img src="/logo.png"></header>
+<nav><ul>{nav}</ul></nav>
+<main><h1>Headline {i}</h1>{body}
+<img src="/img/inline-{i}.png" alt="figure">
+<a href="javascript:void(0)">share</a> <a href="#top">top</a> <a href="mailto:desk@example.com">mail</a>
+<a href="https://other{i % 50}.example.org/path?q={i}">external</a></main>
+<aside><a href="/ad/{i}">Sponsored</a></aside>
+<footer>&copy; Example <a href="/about">About</a></footer>
+<noscript><img src="/pixel.gif"></noscript>
+</body></html>"""
+
+async def load_raw_pages(db_path, limit):
+    raw_db = SQLiteRawDB(db_path)
+    await raw_db.initialize()
+    return [(page["url"], page["html"]) async for page in raw_db.iter_pages(limit=limit)]
+
+def load_corpus(args):
+    if args.db:
+        # Real crawled pages from SQLiteRawDB
+        rows = asyncio.run(load_raw_pages(args.db, args.pages))
+        if rows:
+            return rows
+        print(f"No raw_pages in {args.db}, using synthetic pages.")
+    rng = random.Random(7)
+    return [(f"https://news.example.com/article/{i}", make_page(rng, i)) for i in range(args.pages)]
+
+def run(fn, corpus):
+    start = time.perf_counter()
+    results = [fn(html, url) for url, html in corpus]
+    elapsed = time.perf_counter() - start
+
+    # Peak extra heap while parsing a single page, on a separate pass so tracing doesn't skew the timing
+    tracemalloc.start()
+    peak = 0
+    for url, html in corpus:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(html, url)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return results, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Pages/sec and peak memory of the lxml extractor vs the BeautifulSoup parse_html.")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--db", help="SQLite database with a raw_pages table to use as the corpus")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    size_mb = sum(len(html) for _, html in corpus) / 2**20
+    print(f"{len(corpus)} pages, {size_mb:.1f} MB of HTML\n")
+
+    old, old_time, old_peak = run(parse_html_bs4, corpus)
+    new, new_time, new_peak = run(parse_html, corpus)
+
+    mismatches = 0
+    for a, b in zip(old, new):
+        if a[:3] + a[4:] != b[:3] + b[4:] or set(a[3]) != set(b[3]):
+            mismatches += 1
+
+    print(f"{'':22}{'pages/s':>10}{'peak KB/page':>14}")
+    print(f"{'BeautifulSoup':22}{len(corpus) / old_time:>10.1f}{old_peak / 2**10:>14.0f}")
+    print(f"{'lxml single pass':22}{len(corpus) / new_time:>10.1f}{new_peak / 2**10:>14.0f}")
+    print(f"\nSpeedup {old_time / new_time:.1f}x, {mismatches} of {len(corpus)} pages differ from the BeautifulSoup output.")
+    print("(peak is the Python heap per page via tracemalloc; libxml2's own C buffers are not counted)")
+
+if __name__ == "__main__":
+    main()
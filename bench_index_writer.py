@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from whoosh.index import create_in, open_dir
+from crawler.db import build_schema
+from crawler.index_writer import IndexWriterService
+
+WORDS = [f"word{i}" for i in range(5000)]
+
+def make_docs(n, words_per_doc=400):
+    rng = random.Random(42)
+    return [
+        dict(
+            url_hash=f"{i:064x}",
+            url=f"https://example.com/page/{i}",
+            title=" ".join(rng.choices(WORDS, k=8)),
+            content=" ".join(rng.choices(WORDS, k=words_per_doc)),
+            thumbnail_url="",
+            page_type="website",
+            crawled_at=datetime.utcnow()
+        )
+        for i in range(n)
+    ]
+
+def index_per_doc(index_dir, docs):
+    """
+    The old StorageHelper behaviour: open, write and commit once per page.
+    Run sequentially; with concurrent workers most of these commits just fail on the write lock.
+    """
+    for doc in docs:
+        ix = open_dir(index_dir)
+        writer = ix.writer()
+        writer.update_document(**doc)
+        writer.commit()
+
+def index_batched(index_dir, docs, batch_docs):
+    async def run():
+        service = IndexWriterService(index_dir, batch_docs=batch_docs)
+        queue = list(docs)
+        async def worker():
+            while queue:
+                await service.add_document(**queue.pop())
+        await asyncio.gather(*(worker() for _ in range(8)))
+        await service.close()
+        return service.stats
+    return asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description="Whoosh indexing throughput: per-document commits vs IndexWriterService.")
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--batch-docs", type=int, default=500)
+    args = parser.parse_args()
+
+    docs = make_docs(args.docs)
+    with tempfile.TemporaryDirectory() as tmp:
+        per_doc_dir = os.path.join(tmp, "per_doc")
+        batched_dir = os.path.join(tmp, "batched")
+        for d in (per_doc_dir, batched_dir):
+            os.mkdir(d)
+            create_in(d, build_schema())
+
+        start = time.perf_counter()
+        index_per_doc(per_doc_dir, docs)
+        per_doc_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = index_batched(batched_dir, docs, args.batch_docs)
+        batched_s = time.perf_counter() - start
+
+        per_doc_ix, batched_ix = open_dir(per_doc_dir), open_dir(batched_dir)
+        print(f"{'':22}{'per-doc commit':>16}{'batched writer':>16}")
+        print(f"{'docs/s':22}{args.docs / per_doc_s:>16.1f}{args.docs / batched_s:>16.1f}")
+        print(f"{'docs in index':22}{per_doc_ix.doc_count():>16}{batched_ix.doc_count():>16}")
+        print(f"{'segments':22}{len(per_doc_ix._segments()):>16}{len(batched_ix._segments()):>16}")
+        print(f"\nBatched writer stats: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from infrastructure.compression import HAS_ZSTD
+from infrastructure.raw_db import SQLiteRawDB
+
+class LegacyRawDB:
+    """The previous raw_pages layout (uncompressed TEXT, overwritten on every crawl), kept here as the reference."""
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    async def initialize(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS raw_pages (
+                    url TEXT PRIMARY KEY,
+                    html TEXT NOT NULL,
+                    headers TEXT,
+                    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.commit()
+
+    async def save_html(self, url, html, headers):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT INTO raw_pages (url, html, headers)
+                VALUES (?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    html=excluded.html,
+                    headers=excluded.headers,
+                    crawled_at=CURRENT_TIMESTAMP
+            """, (url, html, json.dumps(headers)))
+            await db.commit()
+        return True
+
+    async def get_html(self, url):
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("SELECT * FROM raw_pages WHERE url = ?", (url,))
+            row = await cursor.fetchone()
+            if row:
+                return {"url": row["url"], "html": row["html"], "headers": json.loads(row["headers"]), "crawled_at": row["crawled_at"]}
+            return None
+
+def make_site(rng, domain):
+    """Per-site template: head assets, navigation and footer shared by every page of the domain."""
+    sections = [f"section-{rng.randrange(10**4)}" for _ in range(40)]
+    script = "".join(f"function f{i}(a){{return a*{rng.randrange(1000)}+{i};}}\n" for i in range(80))
+    style = "".join(f".c{i}{{margin:{rng.randrange(40)}px;color:#{rng.randrange(16**6):06x}}}\n" for i in range(120))
+    nav = "".join(f"<li class='nav-item'><a href='https://{domain}/{s}/'>{s.title()}</a></li>" for s in sections)
+    footer = "".join(f"<a href='https://{domain}/legal/{i}'>Legal {i}</a> " for i in range(30))
+    head = f"<head><meta charset='utf-8'><style>{style}</style><script>{script}</script>"
+    return head, f"<header><nav><ul>{nav}</ul></nav></header>", f"<footer>{footer}&copy; {domain}</footer>"
+
+def make_article(rng, vocab, weights, domain, i):
+    paragraphs = "".join(
+        "<p>" + " ".join(rng.choices(vocab, weights, k=rng.randrange(40, 120)))
+        + f" <a href='https://{domain}/article/{rng.randrange(10**6)}'>more</a></p>\n"
+        for _ in range(rng.randrange(5, 30))
+    )
+    return f"<title>Article {i} | {domain}</title></head><body><main><h1>Article {i}</h1>{paragraphs}</main>"
+
+def synthetic_crawls(domains, pages_per_domain, rounds, seed=7):
+    """
+    Every page crawled `rounds` times. Between rounds about a third of the
+    pages change; the rest come back byte-identical. A few URLs per site
+    (print views, tracking-parameter variants) serve the same body as another.
+    """
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(20000)]
+    weights = [1 / (i + 1) for i in range(len(vocab))] # Zipf-like word frequencies
+    sites = {}
+    for d in range(domains):
+        domain = f"site{d}.example.com"
+        sites[domain] = (make_site(rng, domain), [make_article(rng, vocab, weights, domain, i) for i in range(pages_per_domain)])
+
+    crawls = []
+    for r in range(rounds):
+        for domain, ((head, header, footer), articles) in sites.items():
+            for i in range(pages_per_domain):
+                if r and rng.random() < 0.33:
+                    articles[i] = make_article(rng, vocab, weights, domain, i)
+                html = f"<!DOCTYPE html><html>{head}{articles[i]}{header}{footer}</html>"
+                crawls.append((f"https://{domain}/article/{i}", html))
+                if i % 10 == 0:
+                    crawls.append((f"https://{domain}/article/{i}?print=1", html))
+    return crawls
+
+async def db_corpus(db_path, limit):
+    """Pages from an existing database (old or new raw_pages layout), as a single crawl."""
+    raw_db = SQLiteRawDB(db_path)
+    await raw_db.initialize()
+    return [(page["url"], page["html"]) async for page in raw_db.iter_pages(limit=limit)]
+
+def file_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+async def measure(name, store, path, crawls, reads):
+    await store.initialize()
+    headers = {"Content-Type": "text/html"}
+    start = time.perf_counter()
+    for url, html in crawls:
+        await store.save_html(url, html, headers)
+    write_time = time.perf_counter() - start
+
+    async with aiosqlite.connect(path) as db:
+        await db.execute("VACUUM")
+        await db.execute("PRAGMA wal_checkpoint(TRUNCATE)") # WAL-mode stores: fold the WAL back into the main file
+
+    latencies = []
+    for url in reads:
+        t = time.perf_counter()
+        page = await store.get_html(url)
+        latencies.append((time.perf_counter() - t) * 1000)
+        assert page is not None, url
+    latencies.sort()
+    return {
+        "name": name,
+        "size_mb": file_size(path) / 2**20,
+        "writes_per_s": len(crawls) / write_time,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Database size and get_html latency of the compressed raw store vs the old raw_pages table.")
+    parser.add_argument("--domains", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=100, help="pages per domain")
+    parser.add_argument("--rounds", type=int, default=3, help="times every page is recrawled")
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--db", help="use the raw pages of this crawler database (one crawl) instead of the synthetic corpus")
+    args = parser.parse_args()
+
+    if args.db:
+        crawls = await db_corpus(args.db, args.domains * args.pages)
+    else:
+        crawls = synthetic_crawls(args.domains, args.pages, args.rounds)
+    urls = sorted({url for url, _ in crawls})
+    rng = random.Random(1)
+    reads = [rng.choice(urls) for _ in range(args.reads)]
+    raw_mb = sum(len(html.encode()) for _, html in crawls) / 2**20
+    print(f"{len(crawls)} crawls of {len(urls)} URLs, {raw_mb:.1f} MB of HTML fetched in total")
+    print(f"Codec: {'zstd' if HAS_ZSTD else 'zlib (zstandard not installed, no dictionaries)'}\n")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [
+            ("raw_pages TEXT (old)", LegacyRawDB),
+            ("compressed", lambda path: SQLiteRawDB(path, dict_samples=0)),
+            ("compressed + dicts", SQLiteRawDB),
+        ]
+        for name, factory in stores:
+            path = os.path.join(tmp, f"{len(results)}.db")
+            store = factory(path)
+            results.append(await measure(name, store, path, crawls, reads))
+            if isinstance(store, SQLiteRawDB):
+                stats = await store.storage_stats()
+                results[-1]["note"] = f"{stats['versions']} versions, {stats['blobs']} blobs, {stats['dictionaries']} dicts"
+            else:
+                results[-1]["note"] = "latest version only"
+
+    print(f"{'':22}{'DB MB':>8}{'writes/s':>10}{'read p50 ms':>13}{'read p95 ms':>13}")
+    for r in results:
+        print(f"{r['name']:22}{r['size_mb']:>8.1f}{r['writes_per_s']:>10.0f}{r['p50_ms']:>13.3f}{r['p95_ms']:>13.3f}  {r['note']}")
+    base = results[0]["size_mb"]
+    print(f"\nCompressed store with history is {base / results[-1]['size_mb']:.1f}x smaller than the old table without it.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from infrastructure.seen_store import SeenURLStore, fingerprints
+
+def make_url_hashes(n, offset=0):
+    return [hashlib.sha256(f"https://example{i % 5000}.com/page/{i}".encode()).hexdigest() for i in range(offset, offset + n)]
+
+def bench_set(n):
+    # Hash inside the traced region so the 64-char strings the set keeps alive are counted
+    tracemalloc.start()
+    seen = set()
+    start = time.perf_counter()
+    for h in make_url_hashes(n):
+        seen.add(h)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, elapsed
+
+def bench_store(url_hashes, path, batch=100):
+    fps = fingerprints(url_hashes)
+    tracemalloc.start()
+    store = SeenURLStore(path, capacity=len(fps))
+    start = time.perf_counter()
+    # Insert in page-sized batches, the way the frontier calls it
+    for i in range(0, len(fps), batch):
+        store.add_many(fps[i:i + batch])
+    store.flush()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, current, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory/throughput of SeenURLStore vs a Python set of sha256 hex strings.")
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"Generating {args.urls:,} url hashes...")
+    url_hashes = make_url_hashes(args.urls)
+
+    set_bytes, set_time = bench_set(args.urls)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store, store_bytes, store_time = bench_store(url_hashes, os.path.join(tmp, "seen"))
+        disk_bytes = os.path.getsize(store.fp_path) + os.path.getsize(store.bloom_path)
+
+        # Lookups: half seen, half unseen, checked a page (100 links) at a time
+        probe = fingerprints(url_hashes[:50_000] + make_url_hashes(50_000, offset=args.urls))
+        start = time.perf_counter()
+        hits = 0
+        for i in range(0, len(probe), 100):
+            hits += int(store.contains_many(probe[i:i + 100]).sum())
+        lookup_time = time.perf_counter() - start
+
+    per_million = 1_000_000 / args.urls
+    print(f"\n{'':28}{'python set':>14}{'SeenURLStore':>14}")
+    print(f"{'heap MB / 1M URLs':28}{set_bytes * per_million / 2**20:>14.1f}{store_bytes * per_million / 2**20:>14.1f}")
+    print(f"{'bytes / URL (heap)':28}{set_bytes / args.urls:>14.1f}{store_bytes / args.urls:>14.1f}")
+    print(f"{'disk MB / 1M URLs':28}{'-':>14}{disk_bytes * per_million / 2**20:>14.1f}")
+    print(f"{'build s (set hashes too)':28}{set_time:>14.2f}{store_time:>14.2f}")
+    print(f"\nBatched lookups: {len(probe) / lookup_time:,.0f} URLs/s ({hits:,} of {len(probe):,} seen, expected 50,000)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from crawler.parser import simhash, simhash_many
+
+def simhash_loop(text, weighted=False):
+    """The original per-word, per-bit Python loop, kept here as the reference."""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return "0" * 16
+
+    counts = Counter(words) if weighted else dict.fromkeys(words, 1)
+    v = [0] * 64
+    for word, weight in counts.items():
+        h = int(hashlib.md5(word.encode('utf-8')).hexdigest()[:16], 16)
+        for i in range(64):
+            if h & (1 << i):
+                v[i] += weight
+            else:
+                v[i] -= weight
+
+    fingerprint = 0
+    for i in range(64):
+        if v[i] > 0:
+            fingerprint |= (1 << i)
+    return f"{fingerprint:016x}"
+
+def make_docs(n, words_per_doc, vocab_size=50_000, seed=42):
+    # Zipf-ish word frequencies so term-frequency weighting actually matters
+    rng = random.Random(seed)
+    vocab = [f"word{i}" for i in range(vocab_size)]
+    weights = [1 / (i + 1) for i in range(vocab_size)]
+    return [" ".join(rng.choices(vocab, weights, k=words_per_doc)) for _ in range(n)]
+
+def timed(fn, docs):
+    start = time.perf_counter()
+    result = fn(docs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the vectorized SimHash against the original Python loop.")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=5000, help="words per document")
+    args = parser.parse_args()
+
+    docs = make_docs(args.docs, args.words)
+    docs.append("") # empty documents must still map to the zero fingerprint
+
+    print(f"{args.docs} docs x {args.words} words\n")
+    print(f"{'':24}{'docs/s':>10}{'speedup':>10}")
+    for weighted in (False, True):
+        label = "tf-weighted" if weighted else "unweighted"
+        reference, loop_time = timed(lambda d: [simhash_loop(t, weighted) for t in d], docs)
+        single, single_time = timed(lambda d: [simhash(t, weighted) for t in d], docs)
+        batch, batch_time = timed(lambda d: simhash_many(d, weighted), docs)
+        assert single == reference and batch == reference, f"{label} fingerprints differ from the reference loop"
+
+        print(f"{label + ' loop':24}{len(docs) / loop_time:>10.1f}{1.0:>10.1f}")
+        print(f"{label + ' simhash':24}{len(docs) / single_time:>10.1f}{loop_time / single_time:>10.1f}")
+        print(f"{label + ' simhash_many':24}{len(docs) / batch_time:>10.1f}{loop_time / batch_time:>10.1f}")
+    print("\nAll fingerprints match the reference loop.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Ensure imports work from the root dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_raw_store import synthetic_crawls
+from infrastructure.raw_db import SQLiteRawDB
+from infrastructure.warc_archive import WarcArchive
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+async def bench_sqlite(path, crawls, reads):
+    raw_db = SQLiteRawDB(path)
+    await raw_db.initialize()
+    for url, html in crawls:
+        await raw_db.save_html(url, html, {"Content-Type": "text/html"})
+
+    start = time.perf_counter()
+    scanned = sum([len(page["html"]) async for page in raw_db.iter_pages()])
+    scan_time = time.perf_counter() - start
+
+    latencies = []
+    for url in reads:
+        t = time.perf_counter()
+        await raw_db.get_html(url)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return scanned, scan_time, latencies
+
+def bench_archive(directory, crawls, reads):
+    with WarcArchive(directory) as archive:
+        for url, html in crawls:
+            archive.append(url, html.encode(), {"Content-Type": "text/html"})
+        archive.flush()
+
+        start = time.perf_counter()
+        scanned = sum(len(record.payload) for record in archive.scan())
+        full_scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        latest = sum(len(record.payload) for record in archive.iter_latest())
+        latest_time = time.perf_counter() - start
+
+        latencies = []
+        for url in reads:
+            t = time.perf_counter()
+            archive.get(url).text()
+            latencies.append((time.perf_counter() - t) * 1000)
+        size = archive.stats()["bytes"]
+    return (scanned, full_scan), (latest, latest_time), latencies, size
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk scan throughput and single-page lookups: WARC archive vs the SQLite raw store.")
+    parser.add_argument("--domains", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=100, help="pages per domain")
+    parser.add_argument("--rounds", type=int, default=3, help="times every page is recrawled")
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    crawls = synthetic_crawls(args.domains, args.pages, args.rounds)
+    urls = sorted({url for url, _ in crawls})
+    rng = random.Random(1)
+    reads = [rng.choice(urls) for _ in range(args.reads)]
+    print(f"{len(crawls)} crawls of {len(urls)} URLs\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scanned, scan_time, sqlite_latencies = await bench_sqlite(os.path.join(tmp, "raw.db"), crawls, reads)
+        (all_bytes, full_scan), (latest_bytes, latest_time), archive_latencies, size = bench_archive(os.path.join(tmp, "archive"), crawls, reads)
+
+    mb = 2**20
+    print(f"{'':34}{'MB/s':>8}{'get p50 ms':>12}{'get p95 ms':>12}")
+    print(f"{'SQLite raw store, iter_pages':34}{scanned / mb / scan_time:>8.0f}" + "".join(f"{v:>12.3f}" for v in percentiles(sqlite_latencies)))
+    print(f"{'WARC archive, iter_latest':34}{latest_bytes / mb / latest_time:>8.0f}" + "".join(f"{v:>12.3f}" for v in percentiles(archive_latencies)))
+    print(f"{'WARC archive, scan (all versions)':34}{all_bytes / mb / full_scan:>8.0f}")
+    print(f"\nArchive: {size / mb:.1f} MB of segments for {len(crawls)} records (uncompressed)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,8 @@
 import asyncio
 import aiosqlite
 
+from crawler.telemetry import TelemetryStore, telemetry_dir
+
 async def check_db():
     async with aiosqlite.connect('crawler_data.db') as db:
         async with db.execute('SELECT COUNT(*) FROM pages') as cursor:
@@ -11,8 +13,10 @@ async def check_db():
             links = await cursor.fetchone()
             print(f'Links: {links[0]}')
             
-        async with db.execute('SELECT COUNT(*) FROM crawl_logs') as cursor:
-            logs = await cursor.fetchone()
-            print(f'Logs: {logs[0]}')
+    # Fetch logs are in the telemetry store now, not the crawl database
+    totals = TelemetryStore(telemetry_dir('crawler_data.db')).summary(window=7 * 86400, by="total")
+    if totals:
+        print(f'Fetches (last 7 days): {totals[0]["fetches"]}, p95 {totals[0]["p95_ms"]} ms')
+        print(f'Truncated bodies: {totals[0]["truncated"]}, Aborted reads: {totals[0]["aborted"]}')
 
 asyncio.run(check_db())
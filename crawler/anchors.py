@@ -0,0 +1,62 @@
+from collections import defaultdict
+
+SEARCH_BOOST = 2.0 # Query-time weight of the anchor field relative to title and content
+MAX_PHRASES = 50 # Distinct anchor texts kept per page, most common first
+MAX_FIELD_CHARS = 5000
+
+def aggregate_anchors(conn, url_hashes, batch_size=500):
+    """
+    The anchor field text for each of url_hashes: the distinct anchor texts of
+    links pointing at it, most used first. Pages nobody links to with text get "".
+    Runs on a sqlite3 connection (e.g. through Database.read).
+    """
+    counts = defaultdict(list)
+    for i in range(0, len(url_hashes), batch_size):
+        chunk = url_hashes[i:i + batch_size]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"""
+            SELECT target_url_hash, anchor_text, COUNT(*) AS links FROM discovered_links
+            WHERE target_url_hash IN ({placeholders}) AND anchor_text != ''
+            GROUP BY target_url_hash, anchor_text
+            """,
+            chunk
+        ).fetchall()
+        for url_hash, text, links in rows:
+            counts[url_hash].append((links, text))
+
+    fields = {}
+    for url_hash in url_hashes:
+        phrases, size = [], 0
+        for _, text in sorted(counts.get(url_hash, ()), key=lambda entry: -entry[0])[:MAX_PHRASES]:
+            if size + len(text) > MAX_FIELD_CHARS:
+                break
+            phrases.append(text)
+            size += len(text) + 1
+        fields[url_hash] = "\n".join(phrases)
+    return fields
+
+def save_anchor_edges(conn, source_url_hash, anchor_texts):
+    """
+    Write a page's outgoing edges with their anchor text (target_url_hash -> text)
+    and queue every target whose incoming anchor text changed for reindexing.
+    Returns how many targets were queued.
+    """
+    previous = dict(conn.execute(
+        "SELECT target_url_hash, anchor_text FROM discovered_links WHERE source_url_hash = ?", (source_url_hash,)
+    ))
+    rows = [
+        (source_url_hash, target, text) for target, text in anchor_texts.items()
+        if target not in previous or (previous[target] or "") != text
+    ]
+    conn.executemany(
+        """
+        INSERT INTO discovered_links (source_url_hash, target_url_hash, anchor_text) VALUES (?, ?, ?)
+        ON CONFLICT (source_url_hash, target_url_hash) DO UPDATE SET anchor_text = excluded.anchor_text
+        """,
+        rows
+    )
+    # A new edge without text doesn't change what the target is called
+    changed = [(target,) for _, target, text in rows if text or previous.get(target)]
+    conn.executemany("INSERT OR IGNORE INTO anchor_queue (url_hash) VALUES (?)", changed)
+    return len(changed)
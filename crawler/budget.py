@@ -0,0 +1,118 @@
+from collections import Counter
+
+MAX_PAGES = 100_000 # Per domain, fetched + queued, at weight 1
+MAX_QUEUED = 10_000 # Per domain, waiting in the frontier, at weight 1
+
+class DomainBudget:
+    """
+    Per-domain crawl budgets for URLFrontier: at most `max_pages` URLs ever
+    taken on (fetched plus queued) and at most `max_queued` waiting at once.
+
+    `weights` gives domains a bigger or smaller fair share, e.g.
+    {"wikipedia.org": 5, "example.com": 0.1}; a weight applies to the domain
+    and its subdomains and scales both caps as well as the domain's share
+    of the frontier's hot window. Checks are in-memory counter lookups, so
+    admission costs nothing on the add_urls path.
+    """
+    def __init__(self, max_pages=MAX_PAGES, max_queued=MAX_QUEUED, weights=None):
+        self.max_pages = max_pages # None for no cap
+        self.max_queued = max_queued
+        self.weights = {domain.lower(): weight for domain, weight in (weights or {}).items()}
+        self._weight_cache = {}
+        self.queued = Counter() # Not done yet (on disk, in the hot window or being fetched)
+        self.done = Counter()
+        self.rejected = Counter() # New URLs turned away since startup
+
+    def weight(self, domain):
+        weight = self._weight_cache.get(domain)
+        if weight is None:
+            weight = 1.0
+            host = domain.split(":")[0]
+            parts = host.split(".")
+            # Most specific match wins: a.b.example.com, b.example.com, example.com, com
+            for i in range(len(parts)):
+                if ".".join(parts[i:]) in self.weights:
+                    weight = self.weights[".".join(parts[i:])]
+                    break
+            self._weight_cache[domain] = weight
+        return weight
+
+    def limits(self, domain):
+        """(max pages, max queued) for a domain; None means uncapped."""
+        weight = self.weight(domain)
+        max_pages = None if self.max_pages is None else int(self.max_pages * weight)
+        max_queued = None if self.max_queued is None else int(self.max_queued * weight)
+        return max_pages, max_queued
+
+    def room(self, domain):
+        """How many more new URLs the domain may take on right now."""
+        max_pages, max_queued = self.limits(domain)
+        room = float("inf")
+        if max_pages is not None:
+            room = min(room, max_pages - self.done[domain] - self.queued[domain])
+        if max_queued is not None:
+            room = min(room, max_queued - self.queued[domain])
+        return max(room, 0)
+
+    def admit(self, domains):
+        """
+        Given the domain of each new URL in a batch, return a mask of the ones
+        within budget. Turned-away URLs are counted in `rejected`; the caller
+        adds admitted ones to `queued` once they are actually inserted.
+        """
+        left = {}
+        admitted = []
+        for domain in domains:
+            if domain not in left:
+                left[domain] = self.room(domain)
+            ok = left[domain] > 0
+            if ok:
+                left[domain] -= 1
+            else:
+                self.rejected[domain] += 1
+            admitted.append(ok)
+        return admitted
+
+    def load(self, rows):
+        """Start the counters from the frontier table: (domain, not done, done) rows."""
+        self.queued.clear()
+        self.done.clear()
+        for domain, queued, done in rows:
+            if queued:
+                self.queued[domain] = queued
+            if done:
+                self.done[domain] = done
+
+    def report(self, rows, rejected=None, limit=100):
+        """
+        Budget use per domain from (domain, not done, done) rows, busiest first.
+        `rejected` (domain -> count) defaults to the ones counted since startup.
+        """
+        rejected = self.rejected if rejected is None else rejected
+        report = []
+        for domain, queued, done in rows:
+            max_pages, max_queued = self.limits(domain)
+            report.append({
+                "domain": domain,
+                "weight": self.weight(domain),
+                "done": done,
+                "queued": queued,
+                "rejected": rejected.get(domain, 0),
+                "max_pages": max_pages,
+                "max_queued": max_queued,
+                "pages_used": round((done + queued) / max_pages, 4) if max_pages else None,
+                "queue_used": round(queued / max_queued, 4) if max_queued else None,
+            })
+        report.sort(key=lambda r: r["done"] + r["queued"], reverse=True)
+        return report[:limit] if limit else report
+
+def domain_counts(conn):
+    """(domain, not done, done) per domain from the frontier table, on a sqlite3 connection."""
+    # state 2 = done (see frontier.py)
+    return conn.execute("SELECT domain, SUM(state != 2), SUM(state = 2) FROM frontier GROUP BY domain").fetchall()
+
+def budget_report(conn, budget=None, limit=100):
+    """Budget use per domain straight from the database, e.g. for the API (see DomainBudget.report)."""
+    budget = budget or DomainBudget()
+    rejected = dict(conn.execute("SELECT domain, rejected FROM domain_budget").fetchall())
+    return budget.report(domain_counts(conn), rejected, limit)
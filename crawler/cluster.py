@@ -0,0 +1,375 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from .db import DB_PATH, INDEX_DIR, init_db
+from .main import CrawlerManager
+from .sharding import host_key
+from .storage import StorageHelper
+
+DEFAULT_PARTITIONS = 256
+LINE_LIMIT = 16 * 2**20 # Link batches travel as one JSON line each
+
+def partition_for(host, partitions=DEFAULT_PARTITIONS):
+    """Stable partition of a host. Partitions, not hosts, are what get assigned to nodes."""
+    return int.from_bytes(hashlib.md5(host.encode()).digest()[:8], "big") % partitions
+
+def rebalance(assignment, nodes, partitions=DEFAULT_PARTITIONS):
+    """
+    Spread partitions evenly over nodes, moving as few as possible.
+    Partitions of departed nodes and the excess of overloaded nodes go to the
+    least loaded nodes; everything else stays where it is.
+    """
+    if not nodes:
+        return {}
+    owned = {node: [] for node in nodes}
+    orphans = []
+    for partition in range(partitions):
+        node = assignment.get(partition)
+        (owned[node] if node in owned else orphans).append(partition)
+
+    # The nodes that already hold the most keep the extra partition when it doesn't divide evenly
+    base, extra = divmod(partitions, len(nodes))
+    by_load = sorted(nodes, key=lambda n: (-len(owned[n]), n))
+    quota = {node: base + (i < extra) for i, node in enumerate(by_load)}
+    for node in nodes:
+        while len(owned[node]) > quota[node]:
+            orphans.append(owned[node].pop())
+    for node in nodes:
+        while len(owned[node]) < quota[node]:
+            owned[node].append(orphans.pop())
+    return {partition: node for node, parts in owned.items() for partition in parts}
+
+async def send(writer, message):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+class Coordinator:
+    """
+    Hands host partitions to crawler nodes over a JSON-lines TCP protocol.
+
+    Nodes connect and say hello; every join or leave triggers a rebalance, and
+    each node is told which partitions it owns. Nodes forward links for hosts
+    they don't own here in batches, and the coordinator routes them to the
+    owner (buffering them while no node is connected). Nodes also report their
+    crawl stats, which are merged for `stats` requests. With exit_when_idle the
+    cluster is stopped once every node is idle and all routed batches arrived.
+    """
+    def __init__(self, host="127.0.0.1", port=9400, seed_urls=(), partitions=DEFAULT_PARTITIONS,
+                 exit_when_idle=False, quiet_period=2.0):
+        self.host = host
+        self.port = port
+        self.partitions = partitions
+        self.exit_when_idle = exit_when_idle
+        self.quiet_period = quiet_period
+        self.nodes = {} # node_id -> StreamWriter
+        self.assignment = {} # partition -> node_id
+        self.epoch = 0
+        self.unrouted = [[url, 0, False] for url in seed_urls] # [url, priority, handoff] waiting for an owner
+        self.node_stats = {}
+        self.delivered = {} # node_id -> link batches sent to it
+        self.last_change = time.monotonic()
+        self.server = None
+        self.done = asyncio.Event()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=LINE_LIMIT)
+        print(f"[Coordinator] Listening on {self.host}:{self.port} with {self.partitions} partitions")
+
+    async def serve(self):
+        await self.start()
+        watcher = asyncio.create_task(self.watch())
+        try:
+            await self.done.wait()
+        finally:
+            watcher.cancel()
+            for writer in list(self.nodes.values()):
+                try:
+                    await send(writer, {"type": "stop"})
+                except ConnectionError:
+                    pass
+            self.server.close()
+            await self.server.wait_closed()
+            print(f"[Coordinator] Final stats: {json.dumps(self.merged_stats())}")
+
+    def merged_stats(self):
+        totals = {}
+        for stats in self.node_stats.values():
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return {"nodes": len(self.nodes), "epoch": self.epoch, "totals": totals, "per_node": self.node_stats}
+
+    async def handle(self, reader, writer):
+        line = await reader.readline()
+        if not line:
+            writer.close()
+            return
+        hello = json.loads(line)
+
+        if hello.get("type") == "stats":
+            # One-off stats request from the CLI or an API
+            await send(writer, self.merged_stats())
+            writer.close()
+            return
+
+        node_id = hello["node_id"]
+        if node_id in self.nodes:
+            # A restarted node reconnecting before we noticed the old connection drop
+            self.nodes[node_id].close()
+        self.nodes[node_id] = writer
+        self.delivered[node_id] = 0
+        print(f"[Coordinator] Node {node_id} joined ({len(self.nodes)} nodes)")
+        await self.rebalance()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message["type"] == "links":
+                    await self.route(message["links"], message.get("handoff", False))
+                elif message["type"] == "stats":
+                    previous = self.node_stats.get(node_id, {})
+                    stats = message["stats"]
+                    if (previous.get("idle"), previous.get("links_received")) != (stats.get("idle"), stats.get("links_received")):
+                        self.last_change = time.monotonic()
+                    self.node_stats[node_id] = stats
+        except (ConnectionError, json.JSONDecodeError) as e:
+            print(f"[Coordinator] Lost node {node_id}: {e}")
+        finally:
+            if self.nodes.get(node_id) is writer:
+                del self.nodes[node_id]
+                self.delivered.pop(node_id, None)
+                print(f"[Coordinator] Node {node_id} left ({len(self.nodes)} nodes)")
+                await self.rebalance()
+
+    async def rebalance(self):
+        self.assignment = rebalance(self.assignment, list(self.nodes), self.partitions)
+        self.epoch += 1
+        self.last_change = time.monotonic()
+        owned = {node: [] for node in self.nodes}
+        for partition, node in self.assignment.items():
+            owned[node].append(partition)
+        for node, writer in list(self.nodes.items()):
+            try:
+                await send(writer, {"type": "assign", "epoch": self.epoch, "partitions": self.partitions, "owned": owned[node]})
+            except ConnectionError:
+                pass # Its handler will notice and rebalance again
+        if self.unrouted:
+            pending, self.unrouted = self.unrouted, []
+            for handoff in (False, True):
+                await self.route([entry[:2] for entry in pending if entry[2] == handoff], handoff)
+
+    async def route(self, links, handoff=False):
+        """Send [url, priority] pairs to the nodes owning their hosts, one batch per node."""
+        batches = {}
+        for url, priority in links:
+            node = self.assignment.get(partition_for(host_key(url), self.partitions))
+            if node is None:
+                self.unrouted.append([url, priority, handoff])
+            else:
+                batches.setdefault(node, []).append([url, priority])
+        for node, batch in batches.items():
+            try:
+                await send(self.nodes[node], {"type": "links", "links": batch, "handoff": handoff})
+                self.delivered[node] += 1
+            except (ConnectionError, KeyError):
+                self.unrouted.extend([url, priority, handoff] for url, priority in batch)
+        if batches:
+            self.last_change = time.monotonic()
+
+    async def watch(self, interval=1.0):
+        """Log merged stats, and end the crawl once the whole cluster has run dry."""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.nodes:
+                continue
+            print(f"[Coordinator] {json.dumps(self.merged_stats()['totals'])}")
+            if not self.exit_when_idle or self.unrouted:
+                continue
+            settled = all(
+                self.node_stats.get(node, {}).get("idle") and self.node_stats[node].get("links_received") == self.delivered[node]
+                for node in self.nodes
+            )
+            if settled and time.monotonic() - self.last_change >= self.quiet_period:
+                print("[Coordinator] All nodes idle, stopping the cluster.")
+                self.done.set()
+                return
+
+class ClusterNodeManager(CrawlerManager):
+    """
+    A CrawlerManager that crawls the host partitions the coordinator assigns it.
+    Links for other partitions are batched to the coordinator; URLs for hosts
+    this node loses in a rebalance are handed off the same way.
+    Each node keeps its own database and Whoosh index.
+    """
+    def __init__(self, node_id, coordinator_host="127.0.0.1", coordinator_port=9400, db_path=DB_PATH,
+                 index_dir=INDEX_DIR, concurrency=5, recrawl=False, batch_size=500, flush_interval=0.2, stats_interval=1.0):
+        super().__init__([], db_path=db_path, concurrency=concurrency, recrawl=recrawl)
+        self.node_id = node_id
+        self.coordinator_host = coordinator_host
+        self.coordinator_port = coordinator_port
+        self.index_dir = index_dir
+        self.storage = StorageHelper(db_path, index_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        self.partitions = DEFAULT_PARTITIONS
+        self.owned = set()
+        self.outbox = []
+        self.stats.update({"links_forwarded": 0, "links_received": 0, "handed_off": 0, "adopted": 0})
+        self.writer = None
+        self.assigned = None
+        self.stopping = None
+        self._rebalance_lock = None
+
+    def owns(self, url):
+        return partition_for(host_key(url), self.partitions) in self.owned
+
+    async def add_links(self, links, priority, cash=None):
+        local, remote = [], []
+        for link in links:
+            (local if self.owns(link) else remote).append(link)
+        self.outbox.extend([link, priority] for link in remote)
+        if len(self.outbox) >= self.batch_size:
+            await self.flush_outbox()
+        # Cash isn't forwarded: the owning node estimates it from the depth
+        added = await self.frontier.add_urls(local, priority=priority, cash=cash)
+        # We can't know whether the owning node had already seen the remote links, so count them as added
+        return added + [self.frontier.normalize_url(link) for link in remote]
+
+    async def flush_outbox(self):
+        if not self.outbox or self.writer is None:
+            return
+        batch, self.outbox = self.outbox, []
+        self.stats["links_forwarded"] += len(batch)
+        await send(self.writer, {"type": "links", "links": batch})
+
+    async def apply_assignment(self, message):
+        async with self._rebalance_lock:
+            self.partitions = message["partitions"]
+            self.owned = set(message["owned"])
+            # Anything queued for hosts we don't own (lost partitions, or leftovers from an earlier run) moves on
+            # (frontier domains are already normalized like host_key)
+            removed = await self.frontier.remove_hosts(lambda host: partition_for(host, self.partitions) not in self.owned)
+            if removed:
+                self.stats["handed_off"] += len(removed)
+                await send(self.writer, {"type": "links", "links": [[url, priority] for url, priority in removed], "handoff": True})
+            print(f"[Node {self.node_id}] Epoch {message['epoch']}: own {len(self.owned)} partitions, handed off {len(removed)} URLs")
+        self.assigned.set()
+
+    async def receive_links(self, message):
+        if message.get("handoff"):
+            self.stats["adopted"] += await self.frontier.adopt(message["links"])
+        else:
+            by_priority = {}
+            for url, priority in message["links"]:
+                by_priority.setdefault(priority, []).append(url)
+            for priority, urls in by_priority.items():
+                await self.frontier.add_urls(urls, priority=priority)
+        self.stats["links_received"] += 1 # Counted in batches, matching the coordinator's `delivered`
+
+    async def read_loop(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    print(f"[Node {self.node_id}] Coordinator closed the connection.")
+                    break
+                message = json.loads(line)
+                if message["type"] == "assign":
+                    await self.apply_assignment(message)
+                elif message["type"] == "links":
+                    await self.receive_links(message)
+                elif message["type"] == "stop":
+                    break
+        finally:
+            self.stopping.set()
+
+    async def report_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_outbox()
+            now = time.monotonic()
+            if now - self._last_report >= self.stats_interval:
+                self._last_report = now
+                stats = dict(self.stats, pending=self.frontier.pending, idle=self.frontier.pending == 0 and not self.outbox)
+                await send(self.writer, {"type": "stats", "stats": stats})
+
+    async def run(self):
+        self.assigned = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self._rebalance_lock = asyncio.Lock()
+        self._last_report = 0.0
+        await init_db(self.db_path, self.index_dir)
+        await self.initialize()
+
+        reader, self.writer = await asyncio.open_connection(self.coordinator_host, self.coordinator_port, limit=LINE_LIMIT)
+        await send(self.writer, {"type": "hello", "node_id": self.node_id})
+        tasks = [asyncio.create_task(self.read_loop(reader)), asyncio.create_task(self.report_loop())]
+        try:
+            # Don't crawl anything until we know which hosts are ours
+            await self.assigned.wait()
+            tasks += [asyncio.create_task(self.worker(i)) for i in range(self.concurrency)]
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.writer.close()
+            await self.fetcher.close()
+            await self.frontier.close()
+            await self.storage.close()
+
+async def fetch_cluster_stats(host="127.0.0.1", port=9400):
+    reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+    await send(writer, {"type": "stats"})
+    stats = json.loads(await reader.readline())
+    writer.close()
+    return stats
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-node crawl: one coordinator, any number of nodes.")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    coordinator = sub.add_parser("coordinator")
+    coordinator.add_argument("--listen", default="127.0.0.1:9400")
+    coordinator.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    coordinator.add_argument("--exit-when-idle", action="store_true")
+    coordinator.add_argument("seeds", nargs="*")
+
+    node = sub.add_parser("node")
+    node.add_argument("--node-id", required=True)
+    node.add_argument("--coordinator", default="127.0.0.1:9400")
+    node.add_argument("--db", help="defaults to <node-id>.db next to crawler_data.db")
+    node.add_argument("--index-dir", help="defaults to whoosh_index_<node-id>")
+    node.add_argument("--concurrency", type=int, default=5)
+    node.add_argument("--recrawl", action="store_true")
+
+    stats = sub.add_parser("stats")
+    stats.add_argument("--coordinator", default="127.0.0.1:9400")
+
+    args = parser.parse_args()
+    try:
+        if args.role == "coordinator":
+            host, port = parse_address(args.listen)
+            asyncio.run(Coordinator(host, port, args.seeds, args.partitions, args.exit_when_idle).serve())
+        elif args.role == "node":
+            host, port = parse_address(args.coordinator)
+            base_dir = os.path.dirname(DB_PATH)
+            db_path = args.db or os.path.join(base_dir, f"{args.node_id}.db")
+            index_dir = args.index_dir or f"{INDEX_DIR}_{args.node_id}"
+            asyncio.run(ClusterNodeManager(args.node_id, host, port, db_path, index_dir, args.concurrency, args.recrawl).run())
+        else:
+            host, port = parse_address(args.coordinator)
+            print(json.dumps(asyncio.run(fetch_cluster_stats(host, port)), indent=2))
+    except KeyboardInterrupt:
+        pass
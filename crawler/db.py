@@ -2,9 +2,11 @@ import asyncio
 import sqlite3
 import os
 from whoosh.index import create_in, exists_in, open_dir
-from whoosh.fields import Schema, TEXT, ID, DATETIME
+from whoosh.fields import Schema, TEXT, ID, DATETIME, NUMERIC
 from whoosh.analysis import StemmingAnalyzer
 
+from .telemetry import TelemetryStore, telemetry_dir
+
 import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -23,21 +25,23 @@ CREATE TABLE IF NOT EXISTS pages (
     language TEXT,
     first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_crawled_at TIMESTAMP,
-    next_crawl_at TIMESTAMP
+    next_crawl_at TIMESTAMP,
+    etag TEXT,
+    last_modified TEXT,
+    crawl_count INTEGER DEFAULT 0,
+    change_count INTEGER DEFAULT 0,
+    revisit_interval REAL
 );
 """
 
-CREATE_LOGS_TABLE = """
-CREATE TABLE IF NOT EXISTS crawl_logs (
-    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    url_hash TEXT,
-    fetch_time_ms INTEGER,
-    http_status INTEGER,
-    response_size_bytes INTEGER,
-    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(url_hash) REFERENCES pages(url_hash)
-);
-"""
+# Columns added after the first release, back-filled onto existing databases by add_missing_columns()
+PAGES_ADDED_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "crawl_count": "INTEGER DEFAULT 0",
+    "change_count": "INTEGER DEFAULT 0",
+    "revisit_interval": "REAL",
+}
 
 CREATE_LINKS_TABLE = """
 CREATE TABLE IF NOT EXISTS discovered_links (
@@ -50,6 +54,13 @@ CREATE TABLE IF NOT EXISTS discovered_links (
 );
 """
 
+# Pages whose incoming anchor text changed and whose index entry still has the old text (see anchors.py)
+CREATE_ANCHOR_QUEUE_TABLE = """
+CREATE TABLE IF NOT EXISTS anchor_queue (
+    url_hash TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
 CREATE_ERRORS_TABLE = """
 CREATE TABLE IF NOT EXISTS crawl_errors (
     error_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -60,19 +71,178 @@ CREATE TABLE IF NOT EXISTS crawl_errors (
 );
 """
 
+# Persistent crawl queue. state: 0 = queued on disk, 1 = leased into memory, 2 = done
+CREATE_FRONTIER_TABLE = """
+CREATE TABLE IF NOT EXISTS frontier (
+    url_hash TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 1,
+    state INTEGER NOT NULL DEFAULT 0,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Queued URLs get a priority bonus from their static rank; kept so the PageRank job can swap it for a new one.
+# depth and cash are what the priority policy scored the URL with (see priority.py).
+FRONTIER_ADDED_COLUMNS = {
+    "rank_bonus": "REAL DEFAULT 0",
+    "depth": "INTEGER DEFAULT 0",
+    "cash": "REAL DEFAULT 0",
+    "penalty": "REAL DEFAULT 0", # Added for URLs the classifier demoted (see url_classifier.py)
+}
+
+# Static rank of every URL in the link graph, written by pagerank.py
+CREATE_PAGE_RANK_TABLE = """
+CREATE TABLE IF NOT EXISTS page_rank (
+    url_hash TEXT PRIMARY KEY,
+    score REAL NOT NULL,
+    static_rank REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# static_rank (0..1) is indexed as an integer: Whoosh 2.7 can't store sortable float columns
+STATIC_RANK_SCALE = 10000
+
+# Fetched URLs whose page named a different canonical URL; the canonical counts as seen (see frontier.py)
+CREATE_CANONICAL_MAP_TABLE = """
+CREATE TABLE IF NOT EXISTS canonical_map (
+    alias_hash TEXT PRIMARY KEY,
+    alias_url TEXT NOT NULL,
+    canonical_hash TEXT NOT NULL,
+    canonical_url TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+CREATE_CANONICAL_MAP_INDEX = "CREATE INDEX IF NOT EXISTS idx_canonical_hash ON canonical_map(canonical_hash);"
+
+# Running totals of the frontier's URL dedup counters (see dedup_report in frontier.py)
+CREATE_DEDUP_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS dedup_stats (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+# URLs the classifier kept out of the frontier, and why (see infrastructure/url_classifier.py)
+CREATE_DROPPED_URLS_TABLE = """
+CREATE TABLE IF NOT EXISTS dropped_urls (
+    url_hash TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    dropped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+"""
+
+# URLs turned away by the per-domain crawl budgets (see budget.py)
+CREATE_DOMAIN_BUDGET_TABLE = """
+CREATE TABLE IF NOT EXISTS domain_budget (
+    domain TEXT PRIMARY KEY,
+    rejected INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+CREATE_ROBOTS_TABLE = """
+CREATE TABLE IF NOT EXISTS robots_cache (
+    domain TEXT PRIMARY KEY,
+    status INTEGER,
+    body TEXT,
+    fetched_at REAL,
+    expires_at REAL
+);
+"""
+
+# Permuted-band tables of the SimHash near-duplicate index (see simhash_index.py)
+CREATE_SIMHASH_TABLE = """
+CREATE TABLE IF NOT EXISTS simhash_bands (
+    table_id INTEGER NOT NULL,
+    band_key INTEGER NOT NULL,
+    url_hash TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (table_id, band_key, url_hash)
+) WITHOUT ROWID;
+"""
+
+CREATE_FRONTIER_INDEX = "CREATE INDEX IF NOT EXISTS idx_frontier_queue ON frontier(state, priority);"
+
+
+def backfill_simhash_index(db):
+    """Index the fingerprints of pages crawled before simhash_bands existed."""
+    from .simhash_index import SimHashIndex, EMPTY_SIMHASH
+    if db.execute("SELECT 1 FROM simhash_bands LIMIT 1").fetchone():
+        return
+    index = SimHashIndex()
+    cursor = db.execute("SELECT url_hash, content_hash FROM pages WHERE content_hash IS NOT NULL AND content_hash != ?", (EMPTY_SIMHASH,))
+    for url_hash, content_hash in cursor.fetchall():
+        db.executemany(
+            "INSERT OR IGNORE INTO simhash_bands (table_id, band_key, url_hash, fingerprint) VALUES (?, ?, ?, ?)",
+            index.band_rows(url_hash, content_hash)
+        )
 
-async def init_sqlite_db():
+
+def add_missing_columns(db, table, columns):
+    """ALTER an existing table to add any of `columns` (name -> type) it doesn't have yet."""
+    existing = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+    for name, col_type in columns.items():
+        if name not in existing:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+
+def migrate_crawl_logs(db, db_path, batch_size=100_000):
+    """Move an old crawl_logs table's rows into the telemetry store (see telemetry.py), then drop it."""
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'crawl_logs'").fetchone():
+        return
+    columns = {row[1] for row in db.execute("PRAGMA table_info(crawl_logs)")}
+    flags = ", ".join(f"COALESCE(l.{name}, 0)" if name in columns else "0" for name in ("truncated", "aborted"))
+    store = TelemetryStore(telemetry_dir(db_path))
+    count = 0
+    last_id = 0
+    while True:
+        # The host comes from the page, if it was saved; logs never recorded one
+        rows = db.execute(f"""
+            SELECT l.log_id, CAST(strftime('%s', COALESCE(l.crawled_at, 'now')) AS REAL), COALESCE(p.domain, ''),
+                   COALESCE(l.url_hash, ''), COALESCE(l.fetch_time_ms, 0), COALESCE(l.http_status, 0),
+                   COALESCE(l.response_size_bytes, 0), {flags}
+            FROM crawl_logs l LEFT JOIN pages p ON p.url_hash = l.url_hash
+            WHERE l.log_id > ? ORDER BY l.log_id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        store.import_rows([row[1:] for row in rows])
+        count += len(rows)
+    db.execute("DROP TABLE crawl_logs")
+    db.commit()
+    print(f"Moved {count} crawl log rows into the telemetry store.")
+
+
+async def init_sqlite_db(db_path=DB_PATH):
     print("Initializing SQLite database...")
-    db = sqlite3.connect(DB_PATH)
+    db = sqlite3.connect(db_path)
     try:
         db.execute(CREATE_PAGES_TABLE)
-        db.execute(CREATE_LOGS_TABLE)
         db.execute(CREATE_LINKS_TABLE)
+        db.execute(CREATE_ANCHOR_QUEUE_TABLE)
         db.execute(CREATE_ERRORS_TABLE)
+        db.execute(CREATE_FRONTIER_TABLE)
+        db.execute(CREATE_DOMAIN_BUDGET_TABLE)
+        db.execute(CREATE_DROPPED_URLS_TABLE)
+        db.execute(CREATE_CANONICAL_MAP_TABLE)
+        db.execute(CREATE_CANONICAL_MAP_INDEX)
+        db.execute(CREATE_DEDUP_STATS_TABLE)
+        db.execute(CREATE_ROBOTS_TABLE)
+        db.execute(CREATE_SIMHASH_TABLE)
+        add_missing_columns(db, "pages", PAGES_ADDED_COLUMNS)
+        add_missing_columns(db, "frontier", FRONTIER_ADDED_COLUMNS)
+        migrate_crawl_logs(db, db_path)
         
         # Create useful indexes for quick querying
         db.execute("CREATE INDEX IF NOT EXISTS idx_pages_domain ON pages(domain);")
         db.execute("CREATE INDEX IF NOT EXISTS idx_pages_next_crawl ON pages(next_crawl_at);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_links_target ON discovered_links(target_url_hash);")
+        db.execute(CREATE_FRONTIER_INDEX)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_simhash_url ON simhash_bands(url_hash);")
+        backfill_simhash_index(db)
         
         db.commit()
     finally:
@@ -80,31 +250,43 @@ async def init_sqlite_db():
     print("SQLite database initialized successfully.")
 
 
-def init_whoosh_index():
-    print("Initializing Whoosh search index...")
-    if not os.path.exists(INDEX_DIR):
-        os.mkdir(INDEX_DIR)
-        
-    schema = Schema(
+def build_schema():
+    return Schema(
         url_hash=ID(stored=True, unique=True),
         url=ID(stored=True),
         title=TEXT(stored=True, analyzer=StemmingAnalyzer()),
         content=TEXT(stored=True, analyzer=StemmingAnalyzer()), # Store content for snippets
+        anchor=TEXT(stored=True, analyzer=StemmingAnalyzer()), # What other pages call this one; stored so partial updates keep it
         thumbnail_url=ID(stored=True),
         page_type=ID(stored=True),
-        crawled_at=DATETIME(stored=True)
+        crawled_at=DATETIME(stored=True),
+        static_rank=NUMERIC(int, bits=16, signed=False, stored=True, sortable=True, default=0) # PageRank, see pagerank.py
     )
-    
-    if not exists_in(INDEX_DIR):
-        create_in(INDEX_DIR, schema)
+
+
+def init_whoosh_index(index_dir=INDEX_DIR):
+    print("Initializing Whoosh search index...")
+    if not os.path.exists(index_dir):
+        os.mkdir(index_dir)
+        
+    if not exists_in(index_dir):
+        create_in(index_dir, build_schema())
         print("Created new Whoosh index.")
     else:
         print("Whoosh index already exists.")
+        ix = open_dir(index_dir)
+        missing = [(name, field) for name, field in build_schema().items() if name not in ix.schema]
+        if missing:
+            writer = ix.writer()
+            for name, field in missing:
+                writer.add_field(name, field)
+            writer.commit()
+            print(f"Added fields to Whoosh index: {', '.join(name for name, _ in missing)}")
 
 
-async def init_db():
-    await init_sqlite_db()
-    init_whoosh_index()
+async def init_db(db_path=DB_PATH, index_dir=INDEX_DIR):
+    await init_sqlite_db(db_path)
+    init_whoosh_index(index_dir)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,81 @@
 import asyncio
+import codecs
+import re
 import aiohttp
-import urllib.robotparser
 from urllib.parse import urlparse
 import time
 
+from .robots import RobotsCache
+
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
 
+# Leading bytes of common binary formats served with misleading (or no) Content-Type
+BINARY_SIGNATURES = (
+    b"%PDF", b"PK\x03\x04", b"\x89PNG", b"GIF8", b"\xff\xd8\xff", b"\x1f\x8b", b"BZh",
+    b"RIFF", b"ID3", b"OggS", b"fLaC", b"\x00\x00\x01\x00", b"7z\xbc\xaf", b"Rar!", b"\x7fELF", b"MZ",
+)
+SNIFF_BYTES = 1024
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+def looks_binary(prefix):
+    """Guess from the first bytes of a body whether it's a binary file rather than markup/text."""
+    if prefix.startswith(BINARY_SIGNATURES) or prefix[4:8] == b"ftyp": # ftyp: MP4/MOV containers
+        return True
+    return b"\x00" in prefix[:SNIFF_BYTES] and not prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE))
+
+def valid_charset(name):
+    try:
+        return codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+def decode_body(body, content_type=""):
+    """
+    Decode an HTML body using, in order: a BOM, the Content-Type charset, a <meta> charset
+    in the first few KB, strict UTF-8, and finally statistical charset detection.
+    """
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return body.decode(encoding, errors="replace")
+
+    declared = re.search(r"charset=[\"']?([^\s;\"']+)", content_type, re.IGNORECASE)
+    charset = valid_charset(declared.group(1)) if declared else None
+    if not charset:
+        meta = META_CHARSET_RE.search(body[:4096])
+        charset = valid_charset(meta.group(1)) if meta else None
+    if charset:
+        return body.decode(charset, errors="replace")
+
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(body[:65536]).best()
+        if best:
+            return body.decode(best.encoding, errors="replace")
+    except ImportError:
+        pass
+    return body.decode("cp1252", errors="replace")
+
 class Fetcher:
-    def __init__(self, session_timeout=15, max_redirects=5):
-        self.robot_parsers = {}
-        self.last_fetch_time = {} # domain -> timestamp for crawl-delay
+    def __init__(self, session_timeout=15, max_redirects=5, default_crawl_delay=0.5, db_path=None,
+                 max_body_bytes=5 * 1024 * 1024, chunk_size=64 * 1024, limit_per_host=8):
+        self.robots = RobotsCache(db_path)
+        self.default_crawl_delay = default_crawl_delay
+        self.max_body_bytes = max_body_bytes
+        self.chunk_size = chunk_size
         self.timeout = aiohttp.ClientTimeout(total=session_timeout)
         self.max_redirects = max_redirects
+        # Backstop only: the frontier's HostHealth sets each host's actual (adaptive) concurrency
+        self.limit_per_host = limit_per_host
         self.session = None
 
     async def initialize(self):
         """Initialize the shared HTTP session for connection pooling."""
-        connector = aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=self.limit_per_host, ttl_dns_cache=300)
         self.session = aiohttp.ClientSession(
             connector=connector,
             timeout=self.timeout,
@@ -40,29 +99,18 @@ class Fetcher:
         """Gracefully close the session."""
         if self.session:
             await self.session.close()
+        await self.robots.close()
 
     async def get_robot_parser(self, url):
-        """Fetch and parse robots.txt for a given domain."""
-        domain = urlparse(url).netloc
-        if domain not in self.robot_parsers:
-            rp = urllib.robotparser.RobotFileParser()
-            robots_url = f"{urlparse(url).scheme}://{domain}/robots.txt"
-            try:
-                async with self.session.get(robots_url, timeout=5) as resp:
-                    if resp.status == 200:
-                        content = await resp.text()
-                        rp.parse(content.splitlines())
-                    else:
-                        print(f"[Robots] {domain} returned {resp.status} for robots.txt")
-                        rp.allow_all = True
-            except Exception as e:
-                print(f"[Robots] Exception fetching {robots_url}: {e}")
-                rp.allow_all = True # Default to allow all if robots.txt is unreachable
-            self.robot_parsers[domain] = rp
-        return self.robot_parsers[domain]
+        """Return the parsed robots.txt for the URL's domain (cached, and fetched once per host)."""
+        return await self.robots.get(url, self.session)
 
     async def enforce_politeness(self, url):
-        """Check robots.txt and delay if necessary to respect crawl-delay."""
+        """
+        Check robots.txt for permission to fetch the URL.
+        Crawl-delay is not slept on here: the frontier's HostScheduler only hands
+        out a URL once its host is eligible, using get_crawl_delay() on release.
+        """
         if url.endswith("/robots.txt"):
             return True
 
@@ -71,48 +119,88 @@ class Fetcher:
         if not rp.can_fetch(USER_AGENT, url):
             print(f"[Politeness] robots.txt explicitly blocked {USER_AGENT} from {url}")
             return False
-
-        # Use robots.txt crawl-delay if present, otherwise default to a polite 0.5s local delay
-        crawl_delay = rp.crawl_delay(USER_AGENT) or 0.5 
-        
-        last_time = self.last_fetch_time.get(domain, 0)
-        now = time.time()
-        time_since_last = now - last_time
-        
-        if time_since_last < crawl_delay:
-            await asyncio.sleep(crawl_delay - time_since_last)
-            
-        self.last_fetch_time[domain] = time.time()
         return True
 
-    async def fetch(self, url):
-        """Fetch the URL, returning (html_content, status_code, headers, fetch_time_ms)."""
+    def get_crawl_delay(self, url):
+        """Return the robots.txt crawl-delay for the URL's host, or a polite default if unknown."""
+        rp = self.robots.peek(urlparse(url).netloc)
+        delay = rp.crawl_delay(USER_AGENT) if rp else None
+        return delay or self.default_crawl_delay
+
+    async def read_body(self, resp):
+        """
+        Stream the response body up to max_body_bytes.
+        Returns (body_bytes, truncated, aborted). Aborts (body None) as soon as the
+        first bytes show a binary file, so we never download a whole video or zip.
+        """
+        body = bytearray()
+        sniffed = False
+        async for chunk in resp.content.iter_chunked(self.chunk_size):
+            body += chunk
+            if not sniffed and len(body) >= SNIFF_BYTES:
+                sniffed = True
+                if looks_binary(bytes(body[:SNIFF_BYTES])):
+                    return None, False, True
+            if len(body) >= self.max_body_bytes:
+                del body[self.max_body_bytes:]
+                return bytes(body), True, False
+
+        if not sniffed and looks_binary(bytes(body[:SNIFF_BYTES])):
+            return None, False, True
+        return bytes(body), False, False
+
+    async def fetch(self, url, etag=None, last_modified=None):
+        """
+        Fetch the URL, returning (html_content, status_code, headers, fetch_time_ms, body_info).
+        body_info is {"bytes": bytes read, "truncated": hit max_body_bytes, "aborted": not HTML, stopped early}.
+        Pass the validators from the previous crawl to make a conditional GET;
+        an unchanged page then comes back as status 304 with no content.
+        """
+        body_info = {"bytes": 0, "truncated": False, "aborted": False}
         if not await self.enforce_politeness(url):
-            return None, 403, None, 0 # Treated as forbidden by robots.txt
+            return None, 403, None, 0, body_info # Treated as forbidden by robots.txt
+            
+        conditional_headers = {}
+        if etag:
+            conditional_headers["If-None-Match"] = etag
+        if last_modified:
+            conditional_headers["If-Modified-Since"] = last_modified
             
         start_time = time.perf_counter()
         try:
-            async with self.session.get(url, allow_redirects=True, max_redirects=self.max_redirects) as resp:
+            async with self.session.get(url, allow_redirects=True, max_redirects=self.max_redirects, headers=conditional_headers) as resp:
                 status = resp.status
                 headers = resp.headers
                 fetch_time_ms = int((time.perf_counter() - start_time) * 1000)
                 
-                # We only want to process HTML pages
+                if status == 304:
+                    return None, status, headers, fetch_time_ms, body_info
+                    
+                # We only want to process HTML pages. A missing Content-Type is sniffed from the body instead.
                 content_type = headers.get("Content-Type", "").lower()
-                if "text/html" not in content_type and "text/plain" not in content_type:
+                if content_type and "text/html" not in content_type and "text/plain" not in content_type and "xhtml" not in content_type:
                     print(f"[{url}] Skipping non-html/plain content type: {content_type}")
-                    return None, status, headers, fetch_time_ms
+                    body_info["aborted"] = True
+                    return None, status, headers, fetch_time_ms, body_info
+                    
+                # Read content with a size limit to prevent OOM on huge pages
+                body, truncated, aborted = await self.read_body(resp)
+                body_info.update(bytes=len(body) if body else 0, truncated=truncated, aborted=aborted)
+                if aborted:
+                    print(f"[{url}] Aborted read: body looks binary")
+                    return None, status, headers, fetch_time_ms, body_info
+                if truncated:
+                    print(f"[{url}] Truncated body at {self.max_body_bytes} bytes")
                     
-                # Read content with a size limit (e.g., 5MB) to prevent OOM on huge pages
-                html = await resp.text()
-                return html, status, headers, fetch_time_ms
+                html = decode_body(body, content_type)
+                return html, status, headers, fetch_time_ms, body_info
                 
         except asyncio.TimeoutError:
             print(f"[Fetcher] Timeout fetching {url}")
-            return None, 408, None, int((time.perf_counter() - start_time) * 1000)
+            return None, 408, None, int((time.perf_counter() - start_time) * 1000), body_info
         except aiohttp.ClientError as e:
             print(f"[Fetcher] ClientError fetching {url}: {e}")
-            return None, 500, None, int((time.perf_counter() - start_time) * 1000)
+            return None, 500, None, int((time.perf_counter() - start_time) * 1000), body_info
         except Exception as e:
             print(f"[Fetcher] Exception fetching {url}: {e}")
-            return None, 500, None, int((time.perf_counter() - start_time) * 1000)
+            return None, 500, None, int((time.perf_counter() - start_time) * 1000), body_info
@@ -1,70 +1,746 @@
 import asyncio
 import hashlib
+import os
+import sqlite3
+from collections import Counter
 from urllib.parse import urlparse
-import aiosqlite
+
+from infrastructure.database import Database
+from infrastructure.host_health import HostHealth
+from infrastructure.seen_store import SeenURLStore
+from infrastructure.url_classifier import URLClassifier, DROP, DEMOTE
+from infrastructure.url_normalizer import URLNormalizer, RULES_VERSION
+from .budget import DomainBudget, domain_counts
+from .db import (
+    CREATE_FRONTIER_TABLE, CREATE_FRONTIER_INDEX, CREATE_DOMAIN_BUDGET_TABLE, CREATE_DROPPED_URLS_TABLE,
+    CREATE_CANONICAL_MAP_TABLE, CREATE_CANONICAL_MAP_INDEX, CREATE_DEDUP_STATS_TABLE, FRONTIER_ADDED_COLUMNS, add_missing_columns,
+)
+from .pagerank import PRIORITY_WEIGHT
+from .priority import OPICPolicy
+from .scheduler import HostScheduler
+from .telemetry import TelemetryStore, telemetry_dir
+
+HOST_HISTORY_WINDOW = 30 * 86400 # Fetch history that host quality starts from
+DEMOTE_PENALTY = 25.0 # Priority added to URLs the classifier demotes, about six link levels' worth
+DEDUP_FLUSH_EVERY = 10_000 # Links offered between writes of the dedup counters
+MAX_RETRIES = 3 # Extra attempts for a URL whose fetch timed out or failed on the server side
+
+QUEUED, LEASED, DONE = 0, 1, 2
 
 class URLFrontier:
-    def __init__(self, db_path):
+    """
+    Disk-backed crawl frontier. Every known URL lives in the `frontier` table,
+    and only a bounded hot window of the best-priority URLs is kept in memory.
+    The window is topped up from SQLite as workers drain it, so the queue
+    survives restarts and RSS stays flat on large crawls.
+    The hot window is held by a HostScheduler, which only hands out URLs whose
+    host is allowed to be fetched right now.
+    Dedup goes through a SeenURLStore first, so the SQLite lookup only runs
+    for links the compact store has never seen.
+    Queries go through the shared Database, so state changes from every
+    worker (mark_done in particular) are committed together once per tick.
+    The crawl order comes from a PriorityPolicy (see priority.py); each row
+    keeps the link depth and OPIC cash it was scored with, so a rediscovered
+    URL can be re-scored. A DomainBudget (see budget.py) caps how many URLs
+    each domain may have queued and fetched, and a URLClassifier drops spider
+    traps (logged in dropped_urls) and demotes low-value URLs before that.
+    URLs are normalized by a URLNormalizer, and a fetched page's canonical
+    URL is recorded in canonical_map and counts as seen from then on.
+    Fetch results go to a HostHealth: its AIMD limit caps each host's fetches
+    in flight, failed URLs are retried after a jittered backoff, and a host
+    whose circuit breaker opens has its URLs parked on disk until it may be
+    probed again.
+    """
+    def __init__(self, db_path, hot_window=1000, per_host_window=100, batch_size=500, policy=None, budget=None, classifier=None,
+                 normalizer=None, health=None):
         self.db_path = db_path
-        self.queue = None
-        self.seen_urls = set() # In-memory cache for fast dedup
-        
+        self.hot_window = hot_window
+        self.per_host_window = per_host_window # Cap per host so one site can't fill the window
+        self.batch_size = batch_size # Max SQL variables per IN (...) lookup
+        self.scheduler = None # Hot window
+        self.seen = None
+        self._db = None # Shared Database reference, taken on first use and given back by close()
+        self.policy = policy or OPICPolicy()
+        self.budget = budget or DomainBudget()
+        self.classifier = classifier or URLClassifier()
+        self.normalizer = normalizer or URLNormalizer()
+        self.dedup = Counter() # Dedup counters not yet added to dedup_stats (see dedup_report)
+        self.health = health or HostHealth()
+        self.attempts = {} # url -> failed fetches so far, for URLs being retried
+        self.leases = {} # url -> (depth, cash) of URLs in the hot window or being fetched
+        self.disk_queued = 0 # Rows still waiting on disk (state=0)
+        self.pending = 0 # URLs not yet marked done (on disk + hot window + in flight)
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = Database.shared(self.db_path)
+        return self._db
+
     async def initialize(self):
-        """Load already seen URLs from the database to avoid re-crawling on startup."""
-        if self.queue is None:
-            self.queue = asyncio.PriorityQueue()
-            
-        async with aiosqlite.connect(self.db_path) as db:
-            # Check if table exists first (in case init script wasn't run)
+        """Open the frontier table and recover any work left over from a previous run."""
+        if self.seen is not None:
+            return
+
+        self.scheduler = HostScheduler(limit=self.health.limit)
+        self._refill_lock = asyncio.Lock()
+        self._new_work = asyncio.Event()
+        self._idle = asyncio.Event()
+
+        renormalized = await self.db.write(self._setup)
+
+        seen = SeenURLStore(os.path.splitext(self.db_path)[0] + "_seen")
+        if not len(seen):
+            # Build the seen store once from the frontier table (first run or deleted store files)
+            await self.db.read(self._build_seen, seen)
+            seen.flush()
+        elif renormalized:
+            seen.add_url_hashes(renormalized)
+        self.seen = seen
+
+        self.disk_queued = (await self.db.fetchone("SELECT COUNT(*) FROM frontier WHERE state = ?", (QUEUED,)))[0]
+        self.pending = self.disk_queued
+        self._update_idle()
+        self.budget.load(await self.db.read(domain_counts))
+        await self._load_host_history()
+
+    async def _load_host_history(self):
+        """Start host quality from earlier crawls: fetches from telemetry, indexed pages from the pages table."""
+        try:
+            rows = await asyncio.to_thread(TelemetryStore(telemetry_dir(self.db_path)).summary, HOST_HISTORY_WINDOW, "host")
+            fetches = {row["host"]: row["fetches"] for row in rows}
+        except Exception as e:
+            print(f"Error loading host history: {e}")
+            fetches = {}
+        try:
+            indexed = dict(await self.db.fetchall("SELECT domain, COUNT(*) FROM pages GROUP BY domain"))
+        except sqlite3.OperationalError:
+            indexed = {} # Frontier-only database (crawler shards)
+        self.policy.load_history(fetches, indexed)
+
+    def _setup(self, conn):
+        conn.execute(CREATE_FRONTIER_TABLE)
+        conn.execute(CREATE_DOMAIN_BUDGET_TABLE)
+        conn.execute(CREATE_DROPPED_URLS_TABLE)
+        conn.execute(CREATE_CANONICAL_MAP_TABLE)
+        conn.execute(CREATE_CANONICAL_MAP_INDEX)
+        conn.execute(CREATE_DEDUP_STATS_TABLE)
+        add_missing_columns(conn, "frontier", FRONTIER_ADDED_COLUMNS)
+        conn.execute(CREATE_FRONTIER_INDEX)
+
+        # URLs leased by a crashed run were never finished, put them back on the queue
+        conn.execute("UPDATE frontier SET state = ? WHERE state = ?", (QUEUED, LEASED))
+
+        # First start against an existing crawl db: treat already crawled pages as done
+        if conn.execute("SELECT 1 FROM frontier LIMIT 1").fetchone() is None:
             try:
-                async with db.execute("SELECT url_hash FROM pages") as cursor:
-                    async for row in cursor:
-                        self.seen_urls.add(row[0])
-            except aiosqlite.OperationalError:
+                conn.execute(
+                    "INSERT OR IGNORE INTO frontier (url_hash, url, domain, state) SELECT url_hash, url, domain, ? FROM pages",
+                    (DONE,)
+                )
+            except sqlite3.OperationalError:
                 pass # Table doesn't exist yet
-                
+        return self._alias_renormalized(conn)
+
+    def _alias_renormalized(self, conn, batch_size=10_000):
+        """
+        URLs stored under older normalization rules hash differently now. Record
+        each one whose normalized spelling changed in canonical_map, with the new
+        spelling as its canonical, so links written the new way count as seen
+        instead of being fetched again. Runs once per RULES_VERSION (kept in
+        PRAGMA user_version); returns the new hashes.
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= RULES_VERSION:
+            return []
+        stats = self.normalizer.stats.copy() # Not rewrites of newly found links
+        renormalized = []
+        cursor = conn.execute("SELECT url_hash, url FROM frontier")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            aliases = []
+            for url_hash, url in rows:
+                try:
+                    normalized = self.normalize_url(url)
+                except ValueError:
+                    continue
+                new_hash = self.get_url_hash(normalized)
+                if new_hash != url_hash:
+                    aliases.append((url_hash, url, new_hash, normalized))
+            conn.executemany(
+                "INSERT OR IGNORE INTO canonical_map (alias_hash, alias_url, canonical_hash, canonical_url) VALUES (?, ?, ?, ?)",
+                aliases
+            )
+            renormalized.extend(alias[2] for alias in aliases)
+        self.normalizer.stats = stats
+        conn.execute(f"PRAGMA user_version = {RULES_VERSION}")
+        if renormalized:
+            print(f"[Frontier] {len(renormalized)} stored URLs are spelled differently under the current normalization rules; recorded them as aliases.")
+        return renormalized
+
+    def _build_seen(self, conn, seen):
+        cursor = conn.execute("SELECT url_hash FROM frontier UNION ALL SELECT canonical_hash FROM canonical_map")
+        while True:
+            rows = cursor.fetchmany(100_000)
+            if not rows:
+                break
+            seen.add_url_hashes([row[0] for row in rows])
+
+    async def close(self):
+        """Flush the seen store, the dedup counters and any queued frontier writes."""
+        await self._flush_dedup()
+        if self.seen is not None:
+            self.seen.flush()
+            self.seen = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
     def normalize_url(self, url):
-        """Standardize URL to prevent duplicate crawls of the same page."""
-        parsed = urlparse(url)
-        # Drop fragments, force lowercase domain, keep path
-        netloc = parsed.netloc.lower()
-        if netloc.startswith("www."):
-            netloc = netloc[4:] # normalize www to bare domain
-            
-        normalized = f"{parsed.scheme}://{netloc}{parsed.path}"
-        if parsed.query:
-            # Sort query params for consistent hashing
-            query = "&".join(sorted(parsed.query.split("&")))
-            normalized = f"{normalized}?{query}"
-        return normalized
+        """Standardize URL to prevent duplicate crawls of the same page (see URLNormalizer for the rules)."""
+        return self.normalizer(url)
 
     def get_url_hash(self, normalized_url):
         return hashlib.sha256(normalized_url.encode()).hexdigest()
 
+    def _update_idle(self):
+        if self.pending <= 0:
+            self._idle.set()
+        else:
+            self._idle.clear()
+
+    async def _known_hashes(self, url_hashes):
+        """Return the subset of url_hashes already in the frontier table or named as a canonical URL."""
+        known = set()
+        for i in range(0, len(url_hashes), self.batch_size):
+            chunk = url_hashes[i:i + self.batch_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = await self.db.fetchall(
+                f"SELECT url_hash FROM frontier WHERE url_hash IN ({placeholders}) "
+                f"UNION SELECT canonical_hash FROM canonical_map WHERE canonical_hash IN ({placeholders})",
+                chunk + chunk
+            )
+            known.update(row[0] for row in rows)
+        return known
+
+    async def _rank_bonuses(self, url_hashes):
+        """Priority bonus of each url_hash from its static rank (see pagerank.py), for those that have one."""
+        bonuses = {}
+        for i in range(0, len(url_hashes), self.batch_size):
+            chunk = url_hashes[i:i + self.batch_size]
+            placeholders = ",".join("?" * len(chunk))
+            try:
+                rows = await self.db.fetchall(f"SELECT url_hash, static_rank FROM page_rank WHERE url_hash IN ({placeholders})", chunk)
+            except sqlite3.OperationalError:
+                return bonuses # PageRank hasn't been run on this database yet
+            bonuses.update((url_hash, PRIORITY_WEIGHT * static_rank) for url_hash, static_rank in rows)
+        return bonuses
+
+    def _score(self, url, depth, cash, rank_bonus, penalty=0):
+        return self.policy.priority(url, depth, cash) - rank_bonus + penalty
+
+    def _rediscover(self, conn, found):
+        """
+        Runs on the writer: queued URLs linked to again collect the new cash
+        (and a shorter depth, if any) and are re-scored.
+        """
+        updates = []
+        for i in range(0, len(found), self.batch_size):
+            chunk = found[i:i + self.batch_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT url_hash, url, depth, cash, rank_bonus, penalty FROM frontier WHERE state = ? AND url_hash IN ({placeholders})",
+                (QUEUED, *[url_hash for url_hash, _, _ in chunk])
+            ).fetchall()
+            offered = {url_hash: (depth, cash) for url_hash, depth, cash in chunk}
+            for url_hash, url, depth, cash, rank_bonus, penalty in rows:
+                new_depth, new_cash = offered[url_hash]
+                depth = min(depth, new_depth)
+                cash += new_cash
+                updates.append((depth, cash, self._score(url, depth, cash, rank_bonus or 0, penalty or 0), url_hash))
+        conn.executemany("UPDATE frontier SET depth = ?, cash = ?, priority = ? WHERE url_hash = ?", updates)
+        return len(updates)
+
+    async def _classify(self, candidates):
+        """
+        Run the classifier over the candidates: dropped ones are removed (and
+        logged with their reason), demoted ones are returned with their penalty.
+        """
+        dropped = []
+        penalties = {}
+        for url_hash, url in list(candidates.items()):
+            action, reason = self.classifier.classify(url)
+            if action == DROP:
+                del candidates[url_hash]
+                dropped.append((url_hash, url, urlparse(url).netloc, reason))
+            elif action == DEMOTE:
+                penalties[url_hash] = DEMOTE_PENALTY
+        if dropped:
+            await self.db.executemany("INSERT OR IGNORE INTO dropped_urls (url_hash, url, domain, reason) VALUES (?, ?, ?, ?)", dropped)
+        return penalties
+
+    async def _within_budget(self, url_hashes, candidates):
+        """
+        Drop new URLs whose domain is out of budget. This runs before the seen
+        store claims them, so they can still get in once the domain's queue drains.
+        """
+        maybe_new = [h for h, seen in zip(url_hashes, self.seen.contains_url_hashes(url_hashes)) if not seen]
+        if not maybe_new:
+            return url_hashes
+        admitted = self.budget.admit([urlparse(candidates[h]).netloc for h in maybe_new])
+        rejected = {h for h, ok in zip(maybe_new, admitted) if not ok}
+        if not rejected:
+            return url_hashes
+        counts = Counter(urlparse(candidates[h]).netloc for h in rejected)
+        await self.db.executemany(
+            "INSERT INTO domain_budget (domain, rejected) VALUES (?, ?) ON CONFLICT (domain) DO UPDATE SET rejected = rejected + excluded.rejected",
+            list(counts.items())
+        )
+        return [h for h in url_hashes if h not in rejected]
+
+    async def add_urls(self, urls, priority=1, cash=None):
+        """
+        Add a batch of URLs (e.g. every link on a page) in one transaction.
+        `priority` is the link depth of the URLs (0 for seeds) and `cash` the
+        OPIC cash each one receives (None: estimated from the depth); the
+        policy turns both into the actual priority. URLs that are already
+        queued are re-scored with the extra cash.
+        Returns the normalized URLs that were new to the frontier.
+        """
+        depth = priority
+        if cash is None:
+            cash = self.policy.estimate_cash(depth)
+        candidates = {}
+        rewritten = set() # Hashes of URLs the normalizer had to change
+        for url in urls:
+            try:
+                normalized = self.normalize_url(url)
+                # Only HTTP/HTTPS
+                if not normalized.startswith(("http://", "https://")):
+                    continue
+                url_hash = self.get_url_hash(normalized)
+                if normalized != url:
+                    self.dedup["rewritten"] += 1
+                    if url_hash in candidates:
+                        self.dedup["collapsed"] += 1
+                    else:
+                        rewritten.add(url_hash)
+                candidates.setdefault(url_hash, normalized)
+            except Exception:
+                # URL decoding/parsing failed
+                continue
+        self.dedup["links"] += len(urls)
+        if self.dedup["links"] >= DEDUP_FLUSH_EVERY:
+            await self._flush_dedup()
+
+        penalties = await self._classify(candidates) if candidates else {}
+        if not candidates:
+            return []
+
+        url_hashes = list(candidates)
+        url_hashes = await self._within_budget(url_hashes, candidates)
+
+        # Check the whole link list against the seen store in one vectorized call.
+        # This also claims the new ones, so a concurrent worker won't count them twice.
+        is_new = self.seen.add_url_hashes(url_hashes)
+        fresh = [url_hash for url_hash, new in zip(url_hashes, is_new) if new]
+        seen_before = [url_hash for url_hash, new in zip(url_hashes, is_new) if not new]
+
+        # Confirm against the table: unflushed store entries are lost if we crash
+        known = await self._known_hashes(fresh) if fresh else set()
+        fresh = [url_hash for url_hash in fresh if url_hash not in known]
+        seen_before.extend(known)
+        # A different spelling of a URL we already had: a fetch the normalizer saved
+        self.dedup["collapsed"] += len(rewritten.intersection(seen_before))
+        if seen_before:
+            await self.db.write(self._rediscover, [(url_hash, depth, cash) for url_hash in seen_before])
+        if not fresh:
+            return []
+
+        # Well-linked pages (static rank) jump ahead of others with the same score
+        bonuses = await self._rank_bonuses(fresh)
+        rows = []
+        for url_hash in fresh:
+            url = candidates[url_hash]
+            bonus = bonuses.get(url_hash, 0)
+            penalty = penalties.get(url_hash, 0)
+            rows.append((url_hash, url, urlparse(url).netloc, self._score(url, depth, cash, bonus, penalty), bonus, depth, cash, penalty))
+
+        await self.db.executemany(
+            "INSERT OR IGNORE INTO frontier (url_hash, url, domain, priority, rank_bonus, depth, cash, penalty) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self.budget.queued.update(row[2] for row in rows)
+
+        self.disk_queued += len(rows)
+        self.pending += len(rows)
+        self._update_idle()
+        self._new_work.set()
+        return [row[1] for row in rows]
+
     async def add_url(self, url, priority=1):
-        """Add a URL to the frontier if it hasn't been seen."""
-        # A priority of 0 is highest, 1 is normal, larger numbers are lower priority
+        """Add a URL (at link depth `priority`) to the frontier if it hasn't been seen."""
+        return bool(await self.add_urls([url], priority=priority))
+
+    async def add_canonical(self, url, canonical_url):
+        """
+        Record that the page fetched from `url` names `canonical_url` as its
+        canonical. The canonical then counts as seen, so links to it won't be
+        fetched, and if it's already waiting in the queue it is skipped.
+        Returns whether `url` was an alias of another URL.
+        """
         try:
-            normalized = self.normalize_url(url)
-            # Only HTTP/HTTPS
-            if not normalized.startswith(("http://", "https://")):
-                return False
-                
-            url_hash = self.get_url_hash(normalized)
-            
-            if url_hash in self.seen_urls:
-                return False
-                
-            self.seen_urls.add(url_hash)
-            await self.queue.put((priority, normalized))
-            return True
-        except Exception:
-            # URL decoding/parsing failed
+            url = self.normalize_url(url)
+            canonical = self.normalize_url(canonical_url)
+        except ValueError:
+            return False
+        if canonical == url or not canonical.startswith(("http://", "https://")):
             return False
+
+        canonical_hash = self.get_url_hash(canonical)
+        await self.db.execute(
+            "INSERT OR REPLACE INTO canonical_map (alias_hash, alias_url, canonical_hash, canonical_url) VALUES (?, ?, ?, ?)",
+            (self.get_url_hash(url), url, canonical_hash, canonical)
+        )
+        if not self.seen.add_url_hashes([canonical_hash])[0]:
+            domain = await self.db.write(self._skip_queued, canonical_hash)
+            if domain is not None:
+                self.dedup["canonical_skipped"] += 1
+                self.budget.queued[domain] -= 1
+                self.budget.done[domain] += 1
+                self.disk_queued -= 1
+                self.pending -= 1
+                self._update_idle()
+        return True
+
+    def _skip_queued(self, conn, url_hash):
+        row = conn.execute(
+            "UPDATE frontier SET state = ?, cash = 0 WHERE url_hash = ? AND state = ? RETURNING domain", (DONE, url_hash, QUEUED)
+        ).fetchone()
+        return row[0] if row else None
+
+    async def _flush_dedup(self):
+        if not self.dedup:
+            return
+        counts, self.dedup = self.dedup, Counter()
+        await self.db.executemany(
+            "INSERT INTO dedup_stats (name, count) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET count = count + excluded.count",
+            list(counts.items())
+        )
+
+    async def requeue(self, url_hashes):
+        """
+        Put already crawled URLs back on the queue (e.g. pages due for a revisit).
+        Each is re-scored by the policy from the depth and rank bonus it was
+        queued with, so revisits compete with new links on the same scale.
+        Returns how many were requeued; URLs still queued or in flight are left alone.
+        """
+        if not url_hashes:
+            return 0
             
-    async def get_url(self):
-        """Get the next highest priority URL."""
-        return await self.queue.get()
+        domains = await self.db.write(self._requeue, list(url_hashes))
+        requeued = len(domains)
+        self.budget.done.subtract(domains)
+        self.budget.queued.update(domains)
         
-    def mark_done(self):
-        self.queue.task_done()
+        self.disk_queued += requeued
+        self.pending += requeued
+        self._update_idle()
+        self._new_work.set()
+        return requeued
+
+    def _requeue(self, conn, url_hashes):
+        domains = []
+        for i in range(0, len(url_hashes), self.batch_size):
+            chunk = url_hashes[i:i + self.batch_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT url_hash, url, domain, depth, rank_bonus, penalty FROM frontier WHERE state = ? AND url_hash IN ({placeholders})",
+                (DONE, *chunk)
+            ).fetchall()
+            updates = []
+            for url_hash, url, domain, depth, rank_bonus, penalty in rows:
+                depth = depth or 0
+                cash = self.policy.estimate_cash(depth)
+                updates.append((QUEUED, cash, self._score(url, depth, cash, rank_bonus or 0, penalty or 0), url_hash))
+                domains.append(domain)
+            conn.executemany("UPDATE frontier SET state = ?, cash = ?, priority = ? WHERE url_hash = ?", updates)
+        return domains
+
+    async def adopt(self, entries):
+        """
+        Queue (url, depth) pairs handed over from another node. Unlike add_urls
+        this skips the seen store, which may remember URLs we handed away earlier.
+        Cash doesn't travel between nodes, so it is estimated from the depth.
+        """
+        rows = {}
+        for url, depth in entries:
+            normalized = self.normalize_url(url)
+            if normalized.startswith(("http://", "https://")):
+                rows.setdefault(self.get_url_hash(normalized), (normalized, depth))
+        if not rows:
+            return 0
+
+        self.seen.add_url_hashes(list(rows))
+        known = await self._known_hashes(list(rows))
+        new_rows = []
+        for url_hash, (url, depth) in rows.items():
+            if url_hash not in known:
+                cash = self.policy.estimate_cash(depth)
+                new_rows.append((url_hash, url, urlparse(url).netloc, self._score(url, depth, cash, 0), depth, cash))
+        if new_rows:
+            await self.db.executemany(
+                "INSERT OR IGNORE INTO frontier (url_hash, url, domain, priority, depth, cash) VALUES (?, ?, ?, ?, ?, ?)",
+                new_rows
+            )
+            self.budget.queued.update(row[2] for row in new_rows)
+            self.disk_queued += len(new_rows)
+            self.pending += len(new_rows)
+            self._update_idle()
+            self._new_work.set()
+        return len(new_rows)
+
+    async def remove_hosts(self, should_remove):
+        """
+        Take every queued URL whose host matches should_remove(host) out of the
+        frontier (hot window and disk), e.g. when the host moves to another node.
+        Returns them as (url, depth) pairs. URLs being fetched right now are kept.
+        """
+        async with self._refill_lock:
+            # Under the refill lock, so a refill can't lease a row between our two reads
+            removed = []
+            leased = []
+            for host in [h for h in self.scheduler.queues if should_remove(h)]:
+                for _, url in self.scheduler.drop_host(host):
+                    removed.append((url, self.leases.pop(url, (1, None))[0]))
+                    leased.append((self.get_url_hash(url),))
+
+            rows = await self.db.fetchall("SELECT DISTINCT domain FROM frontier WHERE state = ?", (QUEUED,))
+            hosts = [row[0] for row in rows if should_remove(row[0])]
+            on_disk = []
+            for i in range(0, len(hosts), self.batch_size):
+                chunk = hosts[i:i + self.batch_size]
+                placeholders = ",".join("?" * len(chunk))
+                on_disk.extend(await self.db.fetchall(
+                    f"SELECT url_hash, url, depth FROM frontier WHERE state = ? AND domain IN ({placeholders})",
+                    (QUEUED, *chunk)
+                ))
+
+            removed.extend((url, depth) for _, url, depth in on_disk)
+            await self.db.executemany("DELETE FROM frontier WHERE url_hash = ?", leased + [(row[0],) for row in on_disk])
+
+            self.disk_queued -= len(on_disk)
+            self.pending -= len(removed)
+            self.budget.queued.subtract(urlparse(url).netloc for url, _ in removed)
+            self._update_idle()
+        return removed
+
+    def _host_window(self, host):
+        """A host's share of the hot window, scaled by its budget weight."""
+        return max(1, min(int(self.per_host_window * self.budget.weight(host)), self.hot_window))
+
+    async def _refill(self, starved=False):
+        """
+        Lease the best queued rows from disk into the hot window.
+        Normally this waits until the window is half empty, but when no host in
+        memory is eligible (`starved`) we top up immediately to find more hosts.
+        """
+        async with self._refill_lock:
+            room = self.hot_window - len(self.scheduler)
+            if self.disk_queued <= 0 or room <= 0:
+                return
+            if room < self.hot_window // 2 and not starved:
+                return
+
+            # Skip hosts that already have a full share of the window, and parked ones
+            saturated = [host for host, queue in self.scheduler.queues.items() if len(queue) >= self._host_window(host)]
+            parked = self.health.open_hosts()
+            skipped = saturated + parked
+            placeholders = ",".join("?" * len(skipped))
+            rows = await self.db.fetchall(
+                f"SELECT url_hash, url, domain, priority, depth, cash FROM frontier WHERE state = ? AND domain NOT IN ({placeholders}) ORDER BY priority LIMIT ?",
+                (QUEUED, *skipped, room)
+            )
+
+            if not rows and not skipped:
+                self.disk_queued = 0
+                return
+
+            leased = []
+            for url_hash, url, domain, priority, depth, cash in rows:
+                if self.scheduler.host_size(domain) >= self._host_window(domain) or self.health.is_open(domain):
+                    continue # Leave it on disk for a later refill
+                self.scheduler.push(priority, url)
+                # Rows from before OPIC (and requeued revisits) have no cash yet
+                self.leases[url] = (depth, cash or self.policy.estimate_cash(depth))
+                leased.append((LEASED, url_hash))
+
+            if leased:
+                await self.db.executemany("UPDATE frontier SET state = ? WHERE url_hash = ?", leased)
+                self.disk_queued -= len(leased)
+
+    async def get_url(self):
+        """
+        Get the best URL whose host may be fetched right now, paging more in
+        from disk when the window runs low. The caller must hand the host back
+        with release() once its fetch has finished.
+        """
+        starved = False
+        while True:
+            await self._refill(starved)
+            item = self.scheduler.pop_ready()
+            if item is not None:
+                return item
+
+            # Every host in memory is inside its crawl-delay (or nothing is queued at all):
+            # sleep until the next host becomes eligible, a parked host may be probed,
+            # or a worker adds/releases work
+            starved = True
+            self._new_work.clear()
+            waits = [t for t in (self.scheduler.next_ready_in(), self.health.next_reopen_in()) if t is not None]
+            try:
+                await asyncio.wait_for(self._new_work.wait(), timeout=min(waits) if waits else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, url, crawl_delay=None):
+        """
+        Let the scheduler hand out this URL's host again once crawl_delay has
+        passed (and a jittered backoff, if the host has been failing).
+        """
+        self.scheduler.release(url, crawl_delay, self.health.retry_after(urlparse(url).netloc))
+        self._new_work.set()
+
+    async def record_result(self, url, status, latency_ms):
+        """
+        Report how a fetch went, before release(). If it trips the host's
+        circuit breaker, the host's URLs in the hot window are parked on disk
+        (or, for a host that keeps failing, given up on). Returns whether it tripped.
+        """
+        host = urlparse(url).netloc
+        if not self.health.record(host, status, latency_ms):
+            return False
+        if self.health.is_dead(host):
+            given_up = await self._give_up_host(host)
+            print(f"[Frontier] {host} keeps failing, gave up on its {given_up} queued URLs", flush=True)
+        else:
+            parked = await self._park_host(host)
+            print(f"[Frontier] Circuit open for {host} ({self.health.reopens_in(host):.0f}s), parked {parked} URLs", flush=True)
+        return True
+
+    async def _park_host(self, host):
+        """Move a host's URLs from the hot window back to disk; refills skip it while its breaker is open."""
+        async with self._refill_lock:
+            parked = []
+            for _, url in self.scheduler.drop_host(host):
+                self.leases.pop(url, None) # Its depth and cash are on disk
+                parked.append((QUEUED, self.get_url_hash(url)))
+            if parked:
+                await self.db.executemany("UPDATE frontier SET state = ? WHERE url_hash = ?", parked)
+                self.disk_queued += len(parked)
+        return len(parked)
+
+    async def _give_up_host(self, host):
+        """Mark every queued URL of a dead host done, in the hot window and on disk."""
+        async with self._refill_lock:
+            dropped = [url for _, url in self.scheduler.drop_host(host)]
+            for url in dropped:
+                self.leases.pop(url, None)
+            on_disk = await self.db.write(self._finish_host, host)
+            if dropped:
+                await self.db.executemany(
+                    "UPDATE frontier SET state = ?, cash = 0 WHERE url_hash = ?", [(DONE, self.get_url_hash(url)) for url in dropped]
+                )
+            given_up = len(dropped) + on_disk
+            self.disk_queued -= on_disk
+            self.pending -= given_up
+            self.budget.queued[host] -= given_up
+            self.budget.done[host] += given_up
+            self._update_idle()
+        return given_up
+
+    def _finish_host(self, conn, host):
+        return conn.execute("UPDATE frontier SET state = ?, cash = 0 WHERE domain = ? AND state = ?", (DONE, host, QUEUED)).rowcount
+
+    async def retry(self, url):
+        """
+        Handle a fetch that failed in a way worth retrying (timeout, 5xx, ...).
+        Returns True if the URL will be tried again: put back in the hot window
+        (its host's backoff spaces the attempt) or parked with its host. False
+        once MAX_RETRIES is used up, and the caller should mark it done.
+        """
+        attempts = self.attempts.get(url, 0) + 1
+        if attempts > MAX_RETRIES or self.health.is_dead(urlparse(url).netloc):
+            self.attempts.pop(url, None)
+            return False
+        self.attempts[url] = attempts
+        host = urlparse(url).netloc
+        self.release(url)
+        if self.health.is_open(host):
+            self.leases.pop(url, None)
+            await self.db.execute("UPDATE frontier SET state = ? WHERE url_hash = ?", (QUEUED, self.get_url_hash(url)))
+            self.disk_queued += 1
+        else:
+            row = await self.db.fetchone("SELECT priority FROM frontier WHERE url_hash = ?", (self.get_url_hash(url),))
+            self.scheduler.push(row[0] if row else 0, url)
+            self._new_work.set()
+        return True
+
+    def lease_info(self, url):
+        """(depth, cash) of a leased URL: its links go one level deeper and split its cash."""
+        return self.leases.get(url, (1, self.policy.estimate_cash(1)))
+
+    def record_fetch(self, host, useful):
+        """Tell the policy whether a fetch from `host` produced an indexable page."""
+        self.policy.record_fetch(host, useful)
+
+    async def mark_done(self, url):
+        """Record that a leased URL has been fully processed (its cash has been handed to its links)."""
+        self.release(url) # No-op if the worker already released the host after fetching
+        self.leases.pop(url, None)
+        self.attempts.pop(url, None)
+        domain = urlparse(url).netloc
+        self.budget.queued[domain] -= 1
+        self.budget.done[domain] += 1
+        await self.db.execute("UPDATE frontier SET state = ?, cash = 0 WHERE url_hash = ?", (DONE, self.get_url_hash(url)))
+        self.pending -= 1
+        self._update_idle()
+
+    async def join(self):
+        """Block until every queued URL has been processed."""
+        await self._idle.wait()
+
+def dropped_report(conn, limit=20):
+    """URLs the classifier dropped, per reason and for the busiest domains, on a sqlite3 connection."""
+    reasons = conn.execute("SELECT reason, COUNT(*) FROM dropped_urls GROUP BY reason ORDER BY 2 DESC").fetchall()
+    domains = conn.execute(
+        "SELECT domain, reason, COUNT(*) FROM dropped_urls GROUP BY domain, reason ORDER BY 3 DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return {
+        "total": sum(count for _, count in reasons),
+        "reasons": [{"reason": reason, "count": count} for reason, count in reasons],
+        "domains": [{"domain": domain, "reason": reason, "count": count} for domain, reason, count in domains],
+    }
+
+def dedup_report(conn):
+    """
+    How much duplicate fetching URL normalization and canonical URLs saved, on
+    a sqlite3 connection. Of the links offered to the frontier, `rewritten`
+    were changed by the normalizer and `collapsed` of those turned out to be a
+    URL already known; `canonical_skipped` queued URLs were dropped because a
+    fetched page named them as its canonical.
+    """
+    counts = dict(conn.execute("SELECT name, count FROM dedup_stats").fetchall())
+    links = counts.get("links", 0)
+    collapsed = counts.get("collapsed", 0)
+    skipped = counts.get("canonical_skipped", 0)
+    return {
+        "links": links,
+        "rewritten": counts.get("rewritten", 0),
+        "collapsed": collapsed,
+        "canonical_aliases": conn.execute("SELECT COUNT(*) FROM canonical_map").fetchone()[0],
+        "canonical_skipped": skipped,
+        "rewrite_rate": round(counts.get("rewritten", 0) / links, 4) if links else 0.0,
+        "dedup_rate": round((collapsed + skipped) / links, 4) if links else 0.0,
+    }
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from whoosh.index import open_dir
+
+from .db import INDEX_DIR
+
+class IndexWriterService:
+    """
+    The single owner of the Whoosh writer for a crawl process.
+
+    Workers hand documents over through an asyncio queue instead of opening,
+    writing and committing the index once per page. Documents are written on a
+    dedicated thread into one long-lived writer, which is committed every
+    `batch_docs` documents or `flush_interval` seconds, whichever comes first.
+    That yields one segment per batch instead of one per page, and only this
+    service ever contends for the index write lock.
+    Partial updates (update_fields) go through the same queue, so they are
+    applied in order with the documents they modify.
+    """
+    def __init__(self, index_dir=INDEX_DIR, batch_docs=500, flush_interval=5.0, max_pending=5000, lock_timeout=30.0):
+        self.index_dir = index_dir
+        self.batch_docs = batch_docs
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending # Bounded queue: producers wait instead of piling up memory
+        self.lock_timeout = lock_timeout
+        self.queue = None
+        self.task = None
+        self.executor = None
+        self.ix = None
+        self.writer = None
+        self.uncommitted = 0
+        self.written = {} # url_hash -> fields written since the last commit (not visible to a searcher yet)
+        self.deferred = {} # url_hash -> updated fields of documents in `written`, rewritten right after the commit
+        self.stats = {"docs": 0, "commits": 0, "errors": 0, "commit_seconds": 0.0}
+
+    async def start(self):
+        if self.task is not None:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        # Whoosh writers aren't meant to hop between threads, so all writer calls go through one
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whoosh-writer")
+        self.task = asyncio.create_task(self._run())
+
+    async def add_document(self, **fields):
+        """Queue a document for indexing (replaces any existing document with the same url_hash)."""
+        await self.start()
+        await self.queue.put(("doc", fields))
+
+    async def update_fields(self, url_hash, **fields):
+        """Queue a change to some fields of an indexed document; the rest are kept. Missing documents are skipped."""
+        await self.start()
+        await self.queue.put(("update", (url_hash, fields)))
+
+    async def flush(self):
+        """Commit everything queued so far and wait until it is searchable."""
+        if self.task is None:
+            return
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put(("flush", done))
+        await done
+
+    async def close(self):
+        """Flush pending documents and release the writer and its thread."""
+        if self.task is None:
+            return
+        await self.flush()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._commit_sync)
+        self.executor.shutdown(wait=True)
+        self.task = None
+        self.executor = None
+
+    def _write_sync(self, docs):
+        if self.writer is None:
+            if self.ix is None:
+                self.ix = open_dir(self.index_dir)
+            self.writer = self.ix.writer(timeout=self.lock_timeout)
+        searcher = None
+        for kind, payload in docs:
+            url_hash = payload[0] if kind == "update" else payload.get("url_hash")
+            if url_hash in self.written:
+                # update_document can't replace a document that isn't committed yet, so it's rewritten after the commit
+                if kind == "update":
+                    self.deferred[url_hash] = {**self.deferred.get(url_hash, self.written[url_hash]), **payload[1]}
+                else:
+                    self.deferred[url_hash] = payload
+                continue
+            if kind == "update":
+                changes = payload[1]
+                # Rebuild the document from its stored fields
+                if searcher is None:
+                    searcher = self.ix.searcher()
+                fields = searcher.document(url_hash=url_hash)
+                if fields is None:
+                    continue # Not indexed (yet); it picks up current values when it is
+                fields = {**fields, **changes}
+            else:
+                fields = payload
+            try:
+                self.writer.update_document(**fields)
+                self.written[fields["url_hash"]] = fields
+                self.uncommitted += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Index error for {fields.get('url')}: {e}")
+        if searcher is not None:
+            searcher.close()
+
+    def _commit_sync(self):
+        self._commit_once()
+        if self.deferred:
+            deferred, self.deferred = self.deferred, {}
+            self._write_sync([("doc", fields) for fields in deferred.values()])
+            self._commit_once()
+
+    def _commit_once(self):
+        if self.writer is None:
+            return
+        start = time.perf_counter()
+        try:
+            self.writer.commit()
+            self.stats["docs"] += self.uncommitted
+            self.stats["commits"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Index commit failed, dropping {self.uncommitted} documents: {e}")
+            try:
+                self.writer.cancel()
+            except Exception:
+                pass
+        finally:
+            self.stats["commit_seconds"] += time.perf_counter() - start
+            self.writer = None
+            self.uncommitted = 0
+            self.written = {}
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = None # When the oldest uncommitted document must be committed by
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await loop.run_in_executor(self.executor, self._commit_sync)
+                deadline = None
+                continue
+
+            # Drain whatever else is already waiting so the thread hop is paid once per burst
+            docs, flushes = [], []
+            while True:
+                kind, payload = item
+                if kind == "flush":
+                    flushes.append(payload)
+                else:
+                    docs.append(item)
+                if self.queue.empty() or len(docs) >= self.batch_docs:
+                    break
+                item = self.queue.get_nowait()
+
+            if docs:
+                try:
+                    await loop.run_in_executor(self.executor, self._write_sync, docs)
+                except Exception as e:
+                    self.stats["errors"] += len(docs)
+                    print(f"Index writer unavailable, dropping {len(docs)} documents: {e}")
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+
+            if flushes or self.uncommitted >= self.batch_docs:
+                await loop.run_in_executor(self.executor, self._commit_sync)
+                deadline = None
+            for done in flushes:
+                done.set_result(True)
+
+def update_fields(index_dir, updates, batch_docs=5000, lock_timeout=30.0):
+    """
+    Change some fields of already indexed documents, e.g. [(url_hash, {"static_rank": 42})].
+
+    Whoosh can't update a field in place, so each document is re-added from
+    its stored fields with the changes merged in. Commits every `batch_docs`
+    documents so a running crawl only waits on the write lock briefly.
+    Returns how many documents were rewritten.
+    """
+    ix = open_dir(index_dir)
+    updated = 0
+    for i in range(0, len(updates), batch_docs):
+        writer = ix.writer(timeout=lock_timeout)
+        try:
+            with ix.searcher() as searcher:
+                for url_hash, changes in updates[i:i + batch_docs]:
+                    fields = searcher.document(url_hash=url_hash)
+                    if fields is None:
+                        continue # Deleted since the caller looked
+                    fields.update(changes)
+                    writer.update_document(**fields)
+                    updated += 1
+            writer.commit()
+        except Exception as e:
+            writer.cancel()
+            print(f"Error updating indexed fields: {e}")
+            break
+    return updated
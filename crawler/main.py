@@ -1,19 +1,33 @@
 import asyncio
+import sys
 from urllib.parse import urlparse
 from .frontier import URLFrontier
 from .fetcher import Fetcher
-from .parser import parse_html, simhash
+from .parser import parse_page
+from .sitemap import SitemapLoader
 from .storage import StorageHelper
+from infrastructure.host_health import is_failure
+from infrastructure.parse_pool import ParsePool
 
 class CrawlerManager:
-    def __init__(self, seed_urls, db_path="crawler_data.db", concurrency=5):
+    def __init__(self, seed_urls, db_path="crawler_data.db", concurrency=5, recrawl=False, parse_pool=None, policy=None, budget=None, classifier=None, health=None,
+                 sitemaps=True):
         self.seed_urls = seed_urls
         self.db_path = db_path
         self.concurrency = concurrency
+        self.recrawl = recrawl # Incremental mode: also revisit pages whose next_crawl_at has passed
+        self.sitemaps = sitemaps # Also queue the seed hosts' sitemap URLs (new crawls and recrawls)
+        self.resumed = False
         
-        self.frontier = URLFrontier(db_path)
-        self.fetcher = Fetcher()
+        # Defaults: OPICPolicy crawl order (priority.py), DomainBudget caps (budget.py),
+        # URLClassifier trap filter and HostHealth limits/breakers (infrastructure/)
+        self.frontier = URLFrontier(db_path, policy=policy, budget=budget, classifier=classifier, health=health)
+        self.fetcher = Fetcher(db_path=db_path)
         self.storage = StorageHelper(db_path)
+        # HTML parsing is CPU-bound, so it runs in worker processes instead of on the event loop
+        self.parse_pool = parse_pool or ParsePool.shared()
+        self.stats = {"fetched": 0, "not_modified": 0, "indexed": 0, "duplicates": 0, "errors": 0, "retried": 0,
+                      "sitemap_urls": 0, "sitemap_requeued": 0}
         
     async def initialize(self):
         # We only need to initialize the db connections once
@@ -21,30 +35,66 @@ class CrawlerManager:
             await self.frontier.initialize()
             await self.fetcher.initialize()
             self._initialized = True
+            
+        if self.recrawl:
+            due = await self.storage.get_due_pages()
+            requeued = await self.frontier.requeue([url_hash for url_hash, _ in due])
+            print(f"Recrawl: {requeued} pages are due for a revisit.")
         
-        for url in self.seed_urls:
-            await self.frontier.add_url(url, priority=0)
+        # A frontier with unfinished work (a crashed/stopped crawl or due revisits): work through it, don't re-seed
+        if self.frontier.pending:
+            print(f"Resuming crawl with {self.frontier.pending} URLs pending in the frontier.")
+            self.resumed = True
+            return
             
+        await self.frontier.add_urls(self.seed_urls, priority=0)
+
+    async def load_sitemaps(self):
+        """Queue every page listed in the seed hosts' sitemaps (see sitemap.py), a batch at a time."""
+        loader = SitemapLoader(self.fetcher)
+        sites = {urlparse(url).netloc: url for url in self.seed_urls}
+        await asyncio.gather(*(self._load_sitemaps(loader, site_url) for site_url in sites.values()))
+
+    async def _load_sitemaps(self, loader, site_url):
+        try:
+            added, requeued = await loader.load(self.frontier, site_url, self.storage)
+            self.stats["sitemap_urls"] += added
+            self.stats["sitemap_requeued"] += requeued
+            print(f"Sitemaps: {added} new URLs from {site_url}, {requeued} changed pages requeued.")
+        except Exception as e:
+            print(f"Error loading sitemaps for {site_url}: {e}")
+
     async def run(self):
         await self.initialize()
         
+        # Sitemaps stream into the frontier while the workers are already crawling
+        sitemaps = None
+        if self.sitemaps and self.seed_urls and (self.recrawl or not self.resumed):
+            sitemaps = asyncio.create_task(self.load_sitemaps())
+        
         workers = [
             asyncio.create_task(self.worker(i))
             for i in range(self.concurrency)
         ]
         
         try:
-            # We run until the queue is exhausted,
-            await self.frontier.queue.join()
+            if sitemaps:
+                await sitemaps
+            # We run until the frontier is exhausted,
+            await self.frontier.join()
         except asyncio.CancelledError:
             pass
         finally:
+            if sitemaps:
+                sitemaps.cancel()
             for w in workers:
                 w.cancel()
             
             # Since this is an MVP designed for short bursts or background firing,
             # we close the fetcher here. A strict daemon design would leave this open forever.
             await self.fetcher.close()
+            await self.frontier.close()
+            await self.storage.close()
 
     async def crawl_single(self, url):
         """A lightweight method to trigger a targeted single-url descent, useful for the API."""
@@ -57,11 +107,13 @@ class CrawlerManager:
             # Start a temporary worker pool that dies when the queue empties
             workers = [asyncio.create_task(self.worker(i)) for i in range(2)]
             try:
-                await self.frontier.queue.join()
+                await self.frontier.join()
             finally:
                 for w in workers:
                     w.cancel()
                 await self.fetcher.close()
+                await self.frontier.close()
+                await self.storage.close()
                 # Un-set initialized so the next request re-opens HTTP sessions
                 if hasattr(self, '_initialized'):
                     delattr(self, '_initialized')
@@ -71,11 +123,26 @@ class CrawlerManager:
             print(f"CRITICAL ERROR in crawl_single: {e}")
             traceback.print_exc()
 
+    async def add_links(self, links, priority, cash=None):
+        """Queue a page's outlinks at link depth `priority`, each with `cash`. Returns the normalized URLs that were new to the crawl."""
+        return await self.frontier.add_urls(links, priority=priority, cash=cash)
+
+    def link_hashes(self, links):
+        """Return (links, their normalized url_hashes), leaving out links that fail to normalize."""
+        kept, hashes = [], []
+        for link in links:
+            try:
+                hashes.append(self.frontier.get_url_hash(self.frontier.normalize_url(link)))
+            except ValueError:
+                continue
+            kept.append(link)
+        return kept, hashes
+
     async def worker(self, worker_id):
         while True:
             try:
                 # 1. Get next URL
-                priority, url = await self.frontier.get_url()
+                _, url = await self.frontier.get_url()
             except asyncio.CancelledError:
                 break
                 
@@ -85,23 +152,50 @@ class CrawlerManager:
                 url_hash = self.frontier.get_url_hash(url)
                 domain = urlparse(url).netloc
                 
-                # 2. Fetch the page (handles robots.txt & politeness internally)
-                html, status, headers, fetch_time_ms = await self.fetcher.fetch(url)
+                # Validators from the last visit turn a revisit into a conditional GET
+                etag, last_modified = await self.storage.get_validators(url_hash)
+                
+                # 2. Fetch the page (robots.txt is checked here, crawl-delay is enforced by the frontier's scheduler)
+                try:
+                    html, status, headers, fetch_time_ms, body_info = await self.fetcher.fetch(url, etag, last_modified)
+                    # Feeds the host's AIMD limit and circuit breaker (see HostHealth)
+                    await self.frontier.record_result(url, status, fetch_time_ms)
+                finally:
+                    # Free the host right away so other workers can use it while we parse
+                    self.frontier.release(url, self.fetcher.get_crawl_delay(url))
                 print(f"[Worker {worker_id}] Fetched {url} - Status: {status} - Content: {'Yes' if html else 'No'}", flush=True)
+                self.stats["fetched"] += 1
                 
                 # Always log the attempt
-                response_size = len(html.encode('utf-8')) if html else 0
-                await self.storage.save_log(url_hash, fetch_time_ms, status, response_size)
+                await self.storage.save_log(
+                    url_hash, fetch_time_ms, status, body_info["bytes"],
+                    truncated=body_info["truncated"], aborted=body_info["aborted"], domain=domain
+                )
+
+                # Timeouts and server errors get another go later, after the host's backoff
+                if is_failure(status) and await self.frontier.retry(url):
+                    self.stats["retried"] += 1
+                    continue
                 
-                if html and status == 200:
-                    # 3. Parse & Extract
-                    title, text, canonical_url, links, thumbnail_url, page_type = parse_html(html, url)
-                    content_hash = simhash(text)
+                useful = False # Whether this fetch produced an indexable page, for host quality
+                if status == 304:
+                    # Unchanged since the last crawl: skip parsing and indexing entirely
+                    await self.storage.mark_not_modified(url_hash, headers.get("ETag"), headers.get("Last-Modified"))
+                    self.stats["not_modified"] += 1
+                    useful = True
+                    print(f"  -> Not modified since last crawl.")
+                elif html and status == 200:
+                    # 3. Parse & Extract (in the parse pool, so other workers keep fetching)
+                    title, text, canonical_url, links, thumbnail_url, page_type, content_hash, anchors = \
+                        await self.parse_pool.run(parse_page, html, url)
+                    # If the page names another URL as canonical, that one is the same page: don't fetch it again
+                    await self.frontier.add_canonical(url, canonical_url)
                     
                     # 4. Content Deduplication Detection
-                    is_duplicate = await self.storage.check_content_duplicate(content_hash)
+                    is_duplicate = await self.storage.check_content_duplicate(content_hash, url_hash)
                     if is_duplicate:
                         print(f"  -> Duplicate content detected (Near Duplicate). Skipping indexing.")
+                        self.stats["duplicates"] += 1
                     else:
                         # 5. Save Page Metadata
                         success = await self.storage.save_page(
@@ -111,32 +205,40 @@ class CrawlerManager:
                             title=title,
                             canonical_url=canonical_url,
                             content_hash=content_hash,
-                            language="en"
+                            language="en",
+                            etag=headers.get("ETag"),
+                            last_modified=headers.get("Last-Modified")
                         )
                         
                         if success:
                             # 6. Index Full Text for Search
                             await self.storage.index_document(url_hash, url, title, text, thumbnail_url, page_type)
                             print(f"  -> Indexed: {title}")
+                            self.stats["indexed"] += 1
+                            useful = True
                             
-                            # 7. Add discovered links to frontier 
-                            # (Lower priority deeper in the crawl)
-                            link_hashes = []
-                            for link in links:
-                                if await self.frontier.add_url(link, priority=priority + 1):
-                                    link_hashes.append(
-                                        self.frontier.get_url_hash(self.frontier.normalize_url(link))
-                                    )
+                            # Links the normalizer can't make sense of (e.g. a broken IPv6 host) are skipped
+                            links, link_hashes = self.link_hashes(links)
                             
-                            # 8. Save Graph Edges (source -> target links)
-                            await self.storage.save_links(url_hash, link_hashes)
+                            # 7. Add discovered links to frontier, one level deeper,
+                            # splitting this page's OPIC cash between them
+                            depth, cash = self.frontier.lease_info(url)
+                            await self.add_links(links, priority=depth + 1, cash=cash / len(links) if links else 0)
+                            
+                            # 8. Save Graph Edges (source -> target links) for every outlink, with its anchor text
+                            await self.storage.save_links(url_hash, link_hashes, [anchors[link] for link in links])
+                
+                self.frontier.record_fetch(domain, useful)
                             
             except asyncio.CancelledError:
+                # Leave the URL leased so the next run picks it up again
                 break
             except Exception as e:
                 print(f"[Worker {worker_id}] Error processing {url}: {e}")
-            finally:
-                self.frontier.mark_done()
+                self.stats["errors"] += 1
+                self.frontier.record_fetch(urlparse(url).netloc, False)
+                
+            await self.frontier.mark_done(url)
 
     @classmethod
     def get_manager(cls, db_path="crawler_data.db"):
@@ -152,7 +254,17 @@ if __name__ == "__main__":
         "https://www.cricbuzz.com/robots.txt"
     ]
     
-    crawler = CrawlerManager(seeds, concurrency=5)
+    # Pass --recrawl to also revisit already crawled pages that are due
+    recrawl = "--recrawl" in sys.argv
+    # Pass --no-sitemaps to find pages by following links only
+    sitemaps = "--no-sitemaps" not in sys.argv
+    if "--shards" in sys.argv:
+        # Pass --shards N to run N crawler processes, each owning a slice of the host space
+        from .sharding import ShardedCrawler
+        crawler = ShardedCrawler(seeds, shards=int(sys.argv[sys.argv.index("--shards") + 1]), concurrency=5, recrawl=recrawl,
+                                 sitemaps=sitemaps)
+    else:
+        crawler = CrawlerManager(seeds, concurrency=5, recrawl=recrawl, sitemaps=sitemaps)
     
     print("Starting Web Crawler... Press Ctrl+C to gracefully stop.")
     try:
@@ -0,0 +1,291 @@
+import argparse
+import bisect
+import sqlite3
+import time
+
+import numpy as np
+from scipy import sparse
+from whoosh.scoring import BM25F
+
+from .db import DB_PATH, INDEX_DIR, CREATE_PAGE_RANK_TABLE, STATIC_RANK_SCALE
+
+# Frontier priority bonus for a static_rank of 1.0: about one link level under the default
+# OPICPolicy (log2(ASSUMED_FANOUT) = 4 for the cash split plus 0.5 depth_weight, see priority.py)
+PRIORITY_WEIGHT = 4.5
+SEARCH_BOOST = 1.0 # BM25F scores are multiplied by (1 + SEARCH_BOOST * static_rank)
+
+def fingerprints(url_hashes):
+    """Map sha256 hex url_hashes to 64-bit ints (their leading 16 hex digits), vectorized."""
+    return np.frombuffer(bytes.fromhex("".join(h[:16] for h in url_hashes)), dtype=">u8").astype(np.uint64)
+
+class LinkGraph:
+    """
+    The crawl graph as CSR arrays over dense int32 node ids.
+
+    Nodes are url_hash fingerprints, kept sorted so a url_hash maps to its id
+    with one searchsorted. Edges are streamed out of discovered_links in
+    chunks, so memory is a few numpy arrays of E entries, never E Python
+    strings or tuples.
+    """
+    def __init__(self, nodes, src, dst):
+        self.nodes = nodes # Sorted uint64 fingerprints; a node's id is its position
+        n = len(nodes)
+        self.out_degree = np.bincount(src, minlength=n).astype(np.float64)
+        # Column-stochastic transition matrix: rank flows from src to dst, split over src's out-links
+        weights = (1.0 / self.out_degree[src]).astype(np.float32)
+        self.matrix = sparse.csr_matrix((weights, (dst, src)), shape=(n, n), dtype=np.float32)
+        self.dangling = self.out_degree == 0 # Mostly frontier URLs we haven't crawled yet
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def edges(self):
+        return self.matrix.nnz
+
+    @classmethod
+    def from_db(cls, db, chunk=100_000):
+        src_parts, dst_parts = [], []
+        cursor = db.execute("SELECT source_url_hash, target_url_hash FROM discovered_links")
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            src = fingerprints([row[0] for row in rows])
+            dst = fingerprints([row[1] for row in rows])
+            keep = src != dst # Self-links say nothing about importance
+            src_parts.append(src[keep])
+            dst_parts.append(dst[keep])
+        src = np.concatenate(src_parts) if src_parts else np.zeros(0, dtype=np.uint64)
+        dst = np.concatenate(dst_parts) if dst_parts else np.zeros(0, dtype=np.uint64)
+        del src_parts, dst_parts
+
+        nodes = np.unique(np.concatenate([src, dst]))
+        src_ids = np.searchsorted(nodes, src).astype(np.int32)
+        del src
+        dst_ids = np.searchsorted(nodes, dst).astype(np.int32)
+        del dst
+        return cls(nodes, src_ids, dst_ids)
+
+    def ids(self, url_hashes):
+        """Node ids of url_hashes, -1 for those not in the graph."""
+        fps = fingerprints(url_hashes)
+        idx = np.minimum(np.searchsorted(self.nodes, fps), max(len(self.nodes) - 1, 0))
+        found = self.nodes[idx] == fps if len(self.nodes) else np.zeros(len(fps), dtype=bool)
+        return np.where(found, idx, -1)
+
+    def pagerank(self, damping=0.85, tol=1e-6, max_iter=100, start=None):
+        """
+        Power iteration. Rank from dangling nodes is spread uniformly, like the
+        teleport term. `start` warm-starts from a previous run's scores, so an
+        incremental run over a slightly grown graph converges in a few steps.
+        Returns (scores summing to 1, iterations, final L1 change).
+        """
+        n = len(self)
+        if n == 0:
+            return np.zeros(0), 0, 0.0
+        x = np.full(n, 1.0 / n) if start is None else start / start.sum()
+        delta = 0.0
+        for iteration in range(1, max_iter + 1):
+            leaked = x[self.dangling].sum()
+            new = damping * self.matrix.dot(x.astype(np.float32)).astype(np.float64)
+            new += (damping * leaked + 1.0 - damping) / n
+            new /= new.sum() # Guard against float32 drift
+            delta = np.abs(new - x).sum()
+            x = new
+            if delta < tol:
+                break
+        return x, iteration, delta
+
+def static_ranks(scores):
+    """Scale PageRank to [0, 1] on a log scale: 0 is the floor every page gets, 1 the top page."""
+    if not len(scores):
+        return scores
+    relative = np.log1p(scores * len(scores)) # 1.0 * n is an average page
+    top = relative.max()
+    return relative / top if top > 0 else np.zeros_like(scores)
+
+def _previous_scores(db, graph, chunk):
+    """Last run's scores mapped onto the current node ids (None without a previous run)."""
+    try:
+        cursor = db.execute("SELECT url_hash, score FROM page_rank")
+    except sqlite3.OperationalError:
+        return None
+    start = None
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            return start
+        if start is None:
+            start = np.full(len(graph), 1.0 / len(graph))
+        ids = graph.ids([row[0] for row in rows])
+        known = ids >= 0
+        start[ids[known]] = np.array([row[1] for row in rows])[known]
+
+def _distinct_url_hashes(db, chunk):
+    cursor = db.execute("SELECT source_url_hash FROM discovered_links UNION SELECT target_url_hash FROM discovered_links")
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            return
+        yield [row[0] for row in rows]
+
+def _write_scores(db, graph, scores, ranks, chunk):
+    """Swap in a freshly written page_rank table in one transaction, so readers never see a partial one."""
+    db.execute("DROP TABLE IF EXISTS page_rank_new")
+    db.execute(CREATE_PAGE_RANK_TABLE.replace("page_rank (", "page_rank_new (", 1))
+    for url_hashes in _distinct_url_hashes(db, chunk):
+        ids = graph.ids(url_hashes)
+        # One transaction per chunk: the crawler only waits on the write lock briefly
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany(
+            "INSERT OR REPLACE INTO page_rank_new (url_hash, score, static_rank) VALUES (?, ?, ?)",
+            [(h, float(scores[i]), float(ranks[i])) for h, i in zip(url_hashes, ids) if i >= 0]
+        )
+        db.execute("COMMIT")
+    db.execute("BEGIN IMMEDIATE")
+    db.execute("DROP TABLE IF EXISTS page_rank")
+    db.execute("ALTER TABLE page_rank_new RENAME TO page_rank")
+    db.execute("COMMIT")
+
+def _update_frontier(db):
+    """Re-apply the static_rank bonus to queued frontier URLs (the old bonus is taken back out first)."""
+    try:
+        cursor = db.execute(
+            """
+            UPDATE frontier SET
+                priority = priority + rank_bonus - ? * COALESCE((SELECT static_rank FROM page_rank p WHERE p.url_hash = frontier.url_hash), 0),
+                rank_bonus = ? * COALESCE((SELECT static_rank FROM page_rank p WHERE p.url_hash = frontier.url_hash), 0)
+            WHERE state = 0
+            """,
+            (PRIORITY_WEIGHT, PRIORITY_WEIGHT)
+        )
+        return cursor.rowcount
+    except sqlite3.OperationalError:
+        return 0 # No frontier table in this database
+
+def _update_index(db, index_dir, chunk, min_change=0.01):
+    """Push changed static ranks into the Whoosh index, rewriting only the documents whose rank moved."""
+    from whoosh.index import open_dir
+    from .index_writer import update_fields
+
+    ix = open_dir(index_dir)
+    changed = []
+    with ix.searcher() as searcher:
+        reader = StaticRankReader(searcher)
+        cursor = db.execute("SELECT url_hash, static_rank FROM page_rank")
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            for url_hash, static_rank in rows:
+                docnum = searcher.document_number(url_hash=url_hash)
+                if docnum is None:
+                    continue # Linked to but not indexed
+                new = int(round(static_rank * STATIC_RANK_SCALE))
+                if abs(new - reader[docnum]) >= min_change * STATIC_RANK_SCALE:
+                    changed.append((url_hash, {"static_rank": new}))
+    return update_fields(index_dir, changed)
+
+def run(db_path=DB_PATH, index_dir=INDEX_DIR, damping=0.85, tol=1e-6, max_iter=100, force=False,
+        update_index=True, chunk=100_000):
+    """
+    Recompute PageRank over discovered_links and publish it: the page_rank
+    table, the queued frontier's priorities and the index's static_rank field.
+    Skips the work if no link was added since the last run, unless `force`.
+    """
+    started = time.time()
+    db = sqlite3.connect(db_path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA busy_timeout=30000") # The crawler may be writing
+    try:
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS page_rank_runs (
+                run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                edges INTEGER, max_link_rowid INTEGER, nodes INTEGER,
+                iterations INTEGER, delta REAL, seconds REAL
+            )
+        """)
+        edge_count, max_rowid = db.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM discovered_links").fetchone()
+        last = db.execute("SELECT edges, max_link_rowid FROM page_rank_runs ORDER BY rowid DESC LIMIT 1").fetchone()
+        if not force and last == (edge_count, max_rowid):
+            print("[PageRank] No new links since the last run, nothing to do.")
+            return None
+
+        t = time.time()
+        graph = LinkGraph.from_db(db, chunk)
+        load_seconds = time.time() - t
+        print(f"[PageRank] Loaded {graph.edges} edges over {len(graph)} URLs in {load_seconds:.1f}s")
+
+        t = time.time()
+        start = _previous_scores(db, graph, chunk)
+        scores, iterations, delta = graph.pagerank(damping, tol, max_iter, start)
+        print(f"[PageRank] {'Warm' if start is not None else 'Cold'} start converged to {delta:.2e} "
+              f"in {iterations} iterations ({time.time() - t:.1f}s)")
+
+        ranks = static_ranks(scores)
+        _write_scores(db, graph, scores, ranks, chunk)
+        requeued = _update_frontier(db)
+        indexed = _update_index(db, index_dir, chunk) if update_index else 0
+
+        seconds = time.time() - started
+        db.execute(
+            "INSERT INTO page_rank_runs (edges, max_link_rowid, nodes, iterations, delta, seconds) VALUES (?, ?, ?, ?, ?, ?)",
+            (edge_count, max_rowid, len(graph), iterations, delta, seconds)
+        )
+        stats = {"edges": graph.edges, "nodes": len(graph), "iterations": iterations, "delta": float(delta),
+                 "frontier_updated": requeued, "index_updated": indexed, "seconds": round(seconds, 1)}
+        print(f"[PageRank] Done: {stats}")
+        return stats
+    finally:
+        db.close()
+
+class StaticRankReader:
+    """
+    Per-document static_rank lookups for a searcher.
+
+    Reads each segment's column directly: Whoosh's multi-segment column reader
+    misplaces documents when older segments predate the field.
+    """
+    def __init__(self, searcher):
+        self.offsets = []
+        self.columns = []
+        for segment_reader, offset in searcher.reader().leaf_readers():
+            self.offsets.append(offset)
+            self.columns.append(segment_reader.column_reader("static_rank") if "static_rank" in searcher.schema else None)
+
+    def __getitem__(self, docnum):
+        i = bisect.bisect_right(self.offsets, docnum) - 1
+        column = self.columns[i]
+        return column[docnum - self.offsets[i]] if column is not None else 0
+
+class StaticRankBM25F(BM25F):
+    """BM25F with each document's score scaled up by its static rank (PageRank)."""
+    use_final = True
+
+    def __init__(self, boost=SEARCH_BOOST, **kwargs):
+        super().__init__(**kwargs)
+        self.boost = boost
+        self._readers = {}
+
+    def final(self, searcher, docnum, score):
+        reader = self._readers.get(id(searcher))
+        if reader is None:
+            reader = self._readers[id(searcher)] = StaticRankReader(searcher)
+        return score * (1.0 + self.boost * reader[docnum] / STATIC_RANK_SCALE)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute PageRank over the crawl graph and publish it as static rank.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--damping", type=float, default=0.85)
+    parser.add_argument("--tol", type=float, default=1e-6, help="stop once the L1 change per iteration is below this")
+    parser.add_argument("--max-iter", type=int, default=100)
+    parser.add_argument("--force", action="store_true", help="recompute even if no links were added")
+    parser.add_argument("--no-index", action="store_true", help="don't rewrite static_rank in the search index")
+    args = parser.parse_args()
+    run(args.db, args.index_dir, args.damping, args.tol, args.max_iter, args.force, not args.no_index)
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,70 @@
 import hashlib
-from bs4 import BeautifulSoup
+from collections import Counter
+
+import numpy as np
 from urllib.parse import urlparse, urljoin
 import re
 
-def simhash(text):
+from infrastructure.html_extractor import collect
+
+def _tokens(text, weighted):
+    """Unique words of the text, with their term frequencies as weights if `weighted`."""
+    words = re.findall(r'\w+', text.lower())
+    if weighted:
+        counts = Counter(words)
+        return list(counts), np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    unique = list(set(words))
+    return unique, np.ones(len(unique), dtype=np.int64)
+
+def _word_bits(words):
+    """
+    (n_words, 64) 0/1 matrix; column i is bit i of each word's 64-bit MD5 prefix.
+    The first 8 digest bytes are the big-endian prefix, so reversing them gives
+    little-endian bytes that unpack straight into bit columns.
+    """
+    digests = b"".join(hashlib.md5(word.encode('utf-8')).digest()[:8] for word in words)
+    raw = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8)[:, ::-1]
+    return np.unpackbits(raw, axis=1, bitorder='little')
+
+def _fingerprint(bits, weights):
+    # Each word votes +w where its bit is set and -w where it isn't
+    v = 2 * (weights @ bits) - weights.sum()
+    packed = np.packbits(v > 0, bitorder='little')
+    return f"{int.from_bytes(packed.tobytes(), 'little'):016x}"
+
+def simhash(text, weighted=False):
     """
     A 64-bit SimHash implementation for content deduplication.
     This creates a fingerprint of the text where near-identical
     documents will have near-identical hashes.
+    Every unique word counts once, or by its term frequency when `weighted`.
+    Returned as a 16-character hex string for easy SQLite storage.
     """
-    words = re.findall(r'\w+', text.lower())
+    words, weights = _tokens(text, weighted)
     if not words:
         return "0" * 16
+    return _fingerprint(_word_bits(words), weights)
 
-    v = [0] * 64
-    for word in set(words):
-        # Create a 64-bit MD5 hash of the word
-        h = int(hashlib.md5(word.encode('utf-8')).hexdigest()[:16], 16)
-        for i in range(64):
-            if h & (1 << i):
-                v[i] += 1
-            else:
-                v[i] -= 1
-    
-    fingerprint = 0
-    for i in range(64):
-        if v[i] > 0:
-            fingerprint |= (1 << i)
-            
-    # Return as a 16-character hex string for easy SQLite storage
-    return f"{fingerprint:016x}"
+def simhash_many(texts, weighted=False):
+    """
+    Fingerprint a batch of documents; same output as calling simhash() on each.
+    Words shared between documents are only hashed once.
+    """
+    docs = [_tokens(text, weighted) for text in texts]
+    vocab = {}
+    for words, _ in docs:
+        for word in words:
+            vocab.setdefault(word, len(vocab))
+    bits = _word_bits(list(vocab)) if vocab else None
+
+    fingerprints = []
+    for words, weights in docs:
+        if not words:
+            fingerprints.append("0" * 16)
+            continue
+        rows = np.fromiter((vocab[word] for word in words), dtype=np.int64, count=len(words))
+        fingerprints.append(_fingerprint(bits[rows], weights))
+    return fingerprints
 
 def hamming_distance(hash1, hash2):
     """Calculate the number of differing bits between two SimHashes."""
@@ -39,39 +74,32 @@ def hamming_distance(hash1, hash2):
     except (ValueError, TypeError):
         return 64
 
-def parse_html(html, base_url):
+MAX_ANCHOR_CHARS = 200 # Per link; longer "anchors" are usually whole cards or paragraphs
+
+def parse_html(html, base_url, with_anchors=False):
     """
     Parses HTML content, removes boilerplate, and extracts semantic metadata.
+    All fields come from a single pass of the lxml extractor (no soup tree is built).
     Returns: title, cleaned_text, canonical_url, list_of_links, thumbnail_url, page_type
+    With `with_anchors`, links is a dict of link -> its anchor text instead of a list.
     """
     try:
-        soup = BeautifulSoup(html, 'lxml')
+        page = collect(html)
         
-        # Remove massive boilerplate elements
-        for element in soup(["script", "style", "nav", "footer", "aside", "header", "noscript", "iframe"]):
-            element.decompose()
-            
-        title = soup.title.string.strip() if soup.title and soup.title.string else "No Title"
+        title = page.title.strip() if page.title else "No Title"
         
         # Determine Canonical URL (prevents indexing URL parameters/session IDs when not needed)
-        canonical_tag = soup.find('link', rel='canonical')
         canonical_url = base_url
-        if canonical_tag and canonical_tag.has_attr('href'):
+        if page.canonical is not None:
             # Sometimes canonicals are relative
-            canonical_url = urljoin(base_url, canonical_tag['href'].strip())
+            canonical_url = urljoin(base_url, page.canonical.strip())
             
-        # Extract thumbnail and page type from OpenGraph
-        og_image = soup.find('meta', property='og:image')
-        thumbnail_url = og_image['content'] if og_image and og_image.has_attr('content') else ""
-        
-        # Fallback to first large image
-        if not thumbnail_url:
-            img = soup.find('img', src=True)
-            if img:
-                thumbnail_url = urljoin(base_url, img['src'])
+        # Extract thumbnail from OpenGraph, falling back to the first image
+        thumbnail_url = page.og_image or ""
+        if not thumbnail_url and page.first_img_src is not None:
+            thumbnail_url = urljoin(base_url, page.first_img_src)
                 
-        og_type_tag = soup.find('meta', property='og:type')
-        page_type = og_type_tag['content'] if og_type_tag and og_type_tag.has_attr('content') else "website"
+        page_type = page.og_type if page.og_type is not None else "website"
         
         # Hardcode youtube/video heuristics
         if 'youtube.com/watch' in base_url or 'vimeo.com' in base_url or 'video' in page_type.lower():
@@ -80,12 +108,12 @@ def parse_html(html, base_url):
             page_type = "article"
         
         # Extract main text
-        text = soup.get_text(separator=' ', strip=True)
+        text = page.visible_text()
         
         # Extract and normalize links
-        links = set()
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href'].strip()
+        links = {}
+        for href, anchor in zip(page.links, page.anchors):
+            href = href.strip()
             
             # Skip empty links or anchor jumps on the same page
             if not href or href.startswith('#') or href.startswith('javascript:'):
@@ -101,9 +129,25 @@ def parse_html(html, base_url):
                 if parsed.query:
                     # Don't strip queries here, they might be important for page resolution
                     clean_url += f"?{parsed.query}"
-                links.add(clean_url)
+                # The same target linked several times: keep each distinct text once
+                texts = links.setdefault(clean_url, [])
+                if anchor and anchor not in texts:
+                    texts.append(anchor)
                 
-        return title, text, canonical_url, list(links), thumbnail_url, page_type
+        if with_anchors:
+            links = {url: " ".join(texts)[:MAX_ANCHOR_CHARS] for url, texts in links.items()}
+        else:
+            links = list(links)
+        return title, text, canonical_url, links, thumbnail_url, page_type
     except Exception as e:
         print(f"Parser error for {base_url}: {e}")
-        return "", "", base_url, [], "", "website"
+        return "", "", base_url, {} if with_anchors else [], "", "website"
+
+def parse_page(html, base_url):
+    """
+    parse_html plus the SimHash of the extracted text, so a parse worker does both.
+    Returns: title, cleaned_text, canonical_url, list_of_links, thumbnail_url, page_type, content_hash, anchors
+    where anchors maps each link to its anchor text.
+    """
+    title, text, canonical_url, anchors, thumbnail_url, page_type = parse_html(html, base_url, with_anchors=True)
+    return title, text, canonical_url, list(anchors), thumbnail_url, page_type, simhash(text), anchors
@@ -0,0 +1,118 @@
+import math
+import os
+from urllib.parse import urlparse
+
+SEED_CASH = 1.0 # OPIC cash a seed starts with
+ASSUMED_FANOUT = 16 # For URLs whose cash we don't know (e.g. handed over by another node): cash ~ FANOUT ** -depth
+MIN_CASH = 2.0 ** -30
+
+# Links to these are almost never pages worth indexing (the fetcher aborts most of them anyway)
+NON_HTML_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".bmp", ".tif", ".tiff",
+    ".mp3", ".mp4", ".avi", ".mov", ".wmv", ".webm", ".ogg", ".wav", ".flac",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".rar", ".7z", ".tar", ".iso", ".dmg", ".exe", ".msi", ".apk", ".bin",
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".csv",
+    ".css", ".js", ".json", ".xml", ".rss", ".woff", ".woff2", ".ttf", ".eot",
+}
+
+class PriorityPolicy:
+    """
+    Decides a frontier URL's priority (lower is fetched first).
+
+    The frontier calls priority() when a URL is queued and again when a queued
+    URL is rediscovered, and reports every finished fetch through
+    record_fetch(). Subclass to plug in a different crawl order.
+    """
+    def priority(self, url, depth, cash):
+        raise NotImplementedError
+
+    def estimate_cash(self, depth):
+        """Cash assumed for a URL at `depth` that arrived without any (seeds, links from other nodes)."""
+        return max(SEED_CASH * ASSUMED_FANOUT ** -depth, MIN_CASH)
+
+    def record_fetch(self, host, useful):
+        pass
+
+    def load_history(self, fetches, indexed):
+        """Seed host statistics from earlier crawls: host -> fetch count, host -> indexed page count."""
+        pass
+
+class DepthPolicy(PriorityPolicy):
+    """Breadth-first by link depth, the original crawl order."""
+    def priority(self, url, depth, cash):
+        return depth
+
+class HostQuality:
+    """
+    How often fetches from each host produced an indexable page, as a
+    smoothed ratio: (useful + 1) / (fetched + 2). Unknown hosts score 0.5.
+    """
+    def __init__(self):
+        self.useful = {}
+        self.fetched = {}
+
+    def record(self, host, useful):
+        self.fetched[host] = self.fetched.get(host, 0) + 1
+        if useful:
+            self.useful[host] = self.useful.get(host, 0) + 1
+
+    def load(self, fetches, indexed):
+        for host, count in indexed.items():
+            fetched = max(fetches.get(host, 0), count)
+            self.fetched[host] = self.fetched.get(host, 0) + fetched
+            self.useful[host] = self.useful.get(host, 0) + count
+        for host, count in fetches.items():
+            if host not in indexed:
+                self.fetched[host] = self.fetched.get(host, 0) + count
+
+    def __getitem__(self, host):
+        return (self.useful.get(host, 0) + 1) / (self.fetched.get(host, 0) + 2)
+
+    def __len__(self):
+        return len(self.fetched)
+
+class OPICPolicy(PriorityPolicy):
+    """
+    Best-first order from online page importance plus cheap URL and host signals.
+
+    OPIC: every crawled page splits its cash evenly over its outlinks, and a
+    queued URL accumulates cash from every page that links to it, so URLs
+    many (important) pages link to rise even if they were discovered late.
+    Cash enters the priority as -log2(cash): 0 for a seed, ~log2(fanout) per
+    link level below it, minus a step for every doubling from rediscoveries.
+    On top of that come penalties for link depth, query strings, deep paths,
+    non-HTML extensions and hosts whose fetches rarely yield indexable pages.
+    Host quality changes only apply to URLs queued (or rediscovered) afterwards.
+    """
+    def __init__(self, cash_weight=1.0, depth_weight=0.5, query_weight=1.0, path_weight=0.25,
+                 extension_penalty=20.0, host_weight=4.0):
+        self.cash_weight = cash_weight
+        self.depth_weight = depth_weight
+        self.query_weight = query_weight # Per query parameter, up to 4
+        self.path_weight = path_weight # Per path segment beyond the second
+        self.extension_penalty = extension_penalty
+        self.host_weight = host_weight # Times (1 - host quality)
+        self.hosts = HostQuality()
+
+    def url_penalty(self, url):
+        parsed = urlparse(url)
+        penalty = 0.0
+        if parsed.query:
+            penalty += self.query_weight * min(parsed.query.count("&") + 1, 4)
+        segments = [s for s in parsed.path.split("/") if s]
+        penalty += self.path_weight * max(len(segments) - 2, 0)
+        if os.path.splitext(parsed.path)[1].lower() in NON_HTML_EXTENSIONS:
+            penalty += self.extension_penalty
+        return penalty
+
+    def priority(self, url, depth, cash):
+        priority = self.cash_weight * -math.log2(max(cash, MIN_CASH)) + self.depth_weight * depth
+        priority += self.url_penalty(url)
+        priority += self.host_weight * (1.0 - self.hosts[urlparse(url).netloc])
+        return round(priority, 4)
+
+    def record_fetch(self, host, useful):
+        self.hosts.record(host, useful)
+
+    def load_history(self, fetches, indexed):
+        self.hosts.load(fetches, indexed)
@@ -0,0 +1,27 @@
+import math
+
+DEFAULT_REVISIT_INTERVAL = 24 * 3600
+MIN_REVISIT_INTERVAL = 3600
+MAX_REVISIT_INTERVAL = 30 * 24 * 3600
+
+def next_revisit_interval(crawl_count, change_count, last_interval=None,
+                          min_interval=MIN_REVISIT_INTERVAL, max_interval=MAX_REVISIT_INTERVAL):
+    """
+    Estimate how long to wait before revisiting a page, from its change history.
+
+    crawl_count is how many revisits we have compared against the previous
+    content_hash, and change_count how many of those found new content. Treating
+    changes as a Poisson process, the smoothed fraction of changed revisits gives
+    a change rate for the interval we have been using, and we pick the next
+    interval so that a change since the last visit is about as likely as not.
+    Pages that never change drift towards max_interval, busy pages towards min_interval.
+    """
+    last_interval = last_interval or DEFAULT_REVISIT_INTERVAL
+
+    # Laplace-smoothed probability that a revisit finds changed content
+    p_change = (change_count + 0.5) / (crawl_count + 1)
+    p_change = min(max(p_change, 1e-6), 0.99)
+
+    change_rate = -math.log(1 - p_change) / last_interval
+    interval = math.log(2) / change_rate
+    return max(min_interval, min(interval, max_interval))
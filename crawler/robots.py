@@ -0,0 +1,167 @@
+import asyncio
+import re
+import time
+import urllib.robotparser
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from infrastructure.database import Database
+
+from .db import CREATE_ROBOTS_TABLE
+
+def robots_ttl(status, headers, default_ttl, error_ttl, min_ttl, max_ttl):
+    """
+    Work out how long a robots.txt response may be cached, following its HTTP caching headers.
+    Server errors and network failures get a short TTL so we retry them soon.
+    """
+    if status is None or status >= 500:
+        return error_ttl
+
+    ttl = default_ttl
+    cache_control = headers.get("Cache-Control", "").lower() if headers else ""
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        ttl = min_ttl
+    elif max_age:
+        ttl = int(max_age.group(1))
+    elif headers and headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if headers.get("Date") else time.time()
+            ttl = expires - date
+        except (TypeError, ValueError):
+            pass
+    return max(min_ttl, min(ttl, max_ttl))
+
+def build_parser(status, body):
+    """Rebuild a RobotFileParser from a cached (status, body) pair."""
+    rp = urllib.robotparser.RobotFileParser()
+    if status == 200 and body is not None:
+        rp.parse(body.splitlines())
+    else:
+        # Missing, forbidden or unreachable robots.txt: default to allow all
+        rp.allow_all = True
+        rp.modified()
+    return rp
+
+class RobotsCache:
+    """
+    robots.txt cache shared by all fetch workers.
+
+    Parsed rules are kept in a bounded LRU in memory and persisted to the
+    `robots_cache` table, so restarts don't refetch every host's robots.txt.
+    Entries expire according to the response's Cache-Control/Expires headers.
+    Concurrent misses for the same host are coalesced into a single fetch.
+    """
+    def __init__(self, db_path=None, max_parsers=10000, default_ttl=86400,
+                 error_ttl=600, min_ttl=300, max_ttl=7 * 86400):
+        self.db_path = db_path # None keeps the cache in memory only
+        self._db = None # Shared Database reference, taken on first use and given back by close()
+        self.max_parsers = max_parsers
+        self.default_ttl = default_ttl
+        self.error_ttl = error_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.parsers = OrderedDict() # domain -> (RobotFileParser, expires_at)
+        self.inflight = {} # domain -> Task shared by every waiter for that host
+        self._table_ready = False
+
+    @property
+    def db(self):
+        if self._db is None and self.db_path:
+            self._db = Database.shared(self.db_path)
+        return self._db
+
+    async def close(self):
+        """Give back the database reference (the parsed rules stay cached in memory)."""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def peek(self, domain):
+        """Return the in-memory parser for a domain without fetching or touching the LRU order."""
+        entry = self.parsers.get(domain)
+        return entry[0] if entry else None
+
+    def _remember(self, domain, rp, expires_at):
+        self.parsers[domain] = (rp, expires_at)
+        self.parsers.move_to_end(domain)
+        while len(self.parsers) > self.max_parsers:
+            self.parsers.popitem(last=False)
+
+    async def get(self, url, session):
+        """Return the parser for the URL's host, fetching robots.txt at most once per host at a time."""
+        parsed = urlparse(url)
+        domain = parsed.netloc
+
+        entry = self.parsers.get(domain)
+        if entry and entry[1] > time.time():
+            self.parsers.move_to_end(domain)
+            return entry[0]
+
+        task = self.inflight.get(domain)
+        if task is None:
+            task = asyncio.ensure_future(self._load(parsed.scheme, domain, session))
+            self.inflight[domain] = task
+            task.add_done_callback(lambda _: self.inflight.pop(domain, None))
+        # Shield so one cancelled worker doesn't cancel the shared fetch for everyone else
+        return await asyncio.shield(task)
+
+    async def _ensure_table(self):
+        if not self._table_ready:
+            await self.db.execute(CREATE_ROBOTS_TABLE)
+            self._table_ready = True
+
+    async def _load(self, scheme, domain, session):
+        now = time.time()
+        if self.db_path:
+            try:
+                await self._ensure_table()
+                row = await self.db.fetchone(
+                    "SELECT status, body, expires_at FROM robots_cache WHERE domain = ?", (domain,)
+                )
+                if row and row[2] > now:
+                    rp = build_parser(row[0], row[1])
+                    self._remember(domain, rp, row[2])
+                    return rp
+            except Exception as e:
+                print(f"[Robots] Cache read failed for {domain}: {e}")
+
+        status, body, headers = await self._fetch(scheme, domain, session)
+        expires_at = now + robots_ttl(status, headers, self.default_ttl, self.error_ttl, self.min_ttl, self.max_ttl)
+
+        if self.db_path:
+            try:
+                await self._ensure_table()
+                await self.db.execute(
+                    """
+                    INSERT INTO robots_cache (domain, status, body, fetched_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(domain) DO UPDATE SET
+                        status=excluded.status,
+                        body=excluded.body,
+                        fetched_at=excluded.fetched_at,
+                        expires_at=excluded.expires_at
+                    """,
+                    (domain, status, body, now, expires_at)
+                )
+            except Exception as e:
+                print(f"[Robots] Cache write failed for {domain}: {e}")
+
+        rp = build_parser(status, body)
+        self._remember(domain, rp, expires_at)
+        return rp
+
+    async def _fetch(self, scheme, domain, session):
+        """Fetch robots.txt, returning (status, body, headers). status is None if the host was unreachable."""
+        robots_url = f"{scheme}://{domain}/robots.txt"
+        try:
+            async with session.get(robots_url, timeout=5) as resp:
+                if resp.status == 200:
+                    return resp.status, await resp.text(), resp.headers
+                print(f"[Robots] {domain} returned {resp.status} for robots.txt")
+                return resp.status, None, resp.headers
+        except Exception as e:
+            print(f"[Robots] Exception fetching {robots_url}: {e}")
+            return None, None, None
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import time
+from urllib.parse import urlparse
+
+class HostScheduler:
+    """
+    Politeness scheduler for the frontier's hot window.
+    URLs are kept in per-host priority queues, and hosts sit in a heap keyed by
+    the next time they may be fetched. Workers are only handed URLs whose host
+    is eligible right now, so a slow or crawl-delayed host never parks a worker.
+    Each host has at most `limit(host)` fetches in flight (one by default; see
+    HostHealth for the adaptive limit), and fetches start no closer together
+    than its crawl_delay, so a higher limit only lets slow responses overlap.
+    """
+    def __init__(self, default_delay=0.5, limit=None):
+        self.default_delay = default_delay
+        self.limit = limit or (lambda host: 1)
+        self.queues = {} # host -> heap of (priority, seq, url)
+        self.ready_at = {} # host -> earliest time.monotonic() the next fetch may start
+        self.delays = {} # host -> crawl_delay given at its last release
+        self.busy = {} # host -> {url: start time} of the fetches in flight
+        self.waiting = [] # heap of (ready_at, host) for idle hosts with queued URLs
+        self.ready = [] # heap of (head priority, seq, host) for hosts eligible now
+        self.size = 0
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return self.size
+
+    def host_size(self, host):
+        return len(self.queues.get(host, ()))
+
+    def push(self, priority, url):
+        """Queue a URL under its host."""
+        host = urlparse(url).netloc
+        queue = self.queues.get(host)
+        if queue is None:
+            queue = self.queues[host] = []
+            if self._has_slot(host):
+                heapq.heappush(self.waiting, (self.ready_at.get(host, 0), host))
+        heapq.heappush(queue, (priority, next(self._seq), url))
+        self.size += 1
+
+    def _has_slot(self, host):
+        return len(self.busy.get(host, ())) < self.limit(host)
+
+    def _promote(self, now):
+        """Move every host whose crawl-delay has elapsed into the ready heap."""
+        while self.waiting and self.waiting[0][0] <= now:
+            _, host = heapq.heappop(self.waiting)
+            queue = self.queues.get(host)
+            if queue:
+                heapq.heappush(self.ready, (queue[0][0], next(self._seq), host))
+
+    def pop_ready(self, now=None):
+        """Return (priority, url) for the best URL on an eligible host, or None if every host is waiting."""
+        now = time.monotonic() if now is None else now
+        self._promote(now)
+        while self.ready:
+            _, _, host = heapq.heappop(self.ready)
+            queue = self.queues.get(host)
+            if not queue or not self._has_slot(host):
+                continue # Stale entry (host dropped and re-queued); release() reschedules full hosts
+            if self.ready_at.get(host, 0) > now:
+                heapq.heappush(self.waiting, (self.ready_at[host], host)) # Duplicate entry, a fetch just started
+                continue
+            priority, _, url = heapq.heappop(queue)
+            if not queue:
+                del self.queues[host]
+            self.size -= 1
+            self.busy.setdefault(host, {})[url] = now
+            self.ready_at[host] = now + self.delays.get(host, self.default_delay)
+            if queue and self._has_slot(host):
+                heapq.heappush(self.waiting, (self.ready_at[host], host))
+            return priority, url
+        return None
+
+    def drop_host(self, host):
+        """Remove every queued URL of a host and return them as (priority, url). A fetch in flight is left alone."""
+        queue = self.queues.pop(host, [])
+        self.size -= len(queue)
+        return [(priority, url) for priority, _, url in queue]
+
+    def next_ready_in(self, now=None):
+        """Seconds until the next waiting host becomes eligible, or None if nothing is queued."""
+        now = time.monotonic() if now is None else now
+        if self.ready:
+            return 0
+        if not self.waiting:
+            return None
+        return max(0.0, self.waiting[0][0] - now)
+
+    def release(self, url, crawl_delay=None, backoff=0.0):
+        """
+        Mark the fetch for url as finished so its host can be scheduled again,
+        no sooner than crawl_delay after the fetch started and `backoff`
+        seconds from now (for a host that has been failing).
+        """
+        host = urlparse(url).netloc
+        in_flight = self.busy.get(host)
+        if not in_flight or url not in in_flight:
+            return # Already released
+
+        started = in_flight.pop(url)
+        if not in_flight:
+            del self.busy[host]
+        delay = self.default_delay if crawl_delay is None else crawl_delay
+        self.delays[host] = delay
+        self.ready_at[host] = max(self.ready_at.get(host, 0), started + delay, time.monotonic() + backoff)
+        if host in self.queues:
+            heapq.heappush(self.waiting, (self.ready_at[host], host))
+
+        # Forget delays that have already elapsed so idle hosts don't accumulate forever
+        if len(self.ready_at) > 2 * len(self.queues) + 1024:
+            now = time.monotonic()
+            self.ready_at = {
+                h: t for h, t in self.ready_at.items()
+                if t > now or h in self.queues or h in self.busy
+            }
+            self.delays = {h: d for h, d in self.delays.items() if h in self.ready_at}
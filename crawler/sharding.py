@@ -0,0 +1,318 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing as mp
+import os
+import queue
+import time
+
+from .db import DB_PATH
+from .fetcher import Fetcher
+from .frontier import URLFrontier
+from .main import CrawlerManager
+from .storage import StorageHelper
+from infrastructure.parse_pool import ParsePool
+from infrastructure.url_normalizer import URLNormalizer
+
+_normalizer = URLNormalizer()
+
+def host_key(url):
+    """The host a URL is sharded by, normalized the same way URLFrontier.normalize_url does (with the default rules)."""
+    return _normalizer.host(url)
+
+class HashRing:
+    """
+    Consistent hash ring mapping hosts to shards.
+    Each shard owns `vnodes` points on the ring, so hosts spread evenly and
+    changing the shard count only moves about 1/N of them.
+    """
+    def __init__(self, shard_ids, vnodes=160):
+        self.points = []
+        for shard_id in shard_ids:
+            for i in range(vnodes):
+                self.points.append((self._hash(f"{shard_id}#{i}"), shard_id))
+        self.points.sort()
+        self.keys = [point for point, _ in self.points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def shard_for(self, host):
+        i = bisect.bisect(self.keys, self._hash(host)) % len(self.points)
+        return self.points[i][1]
+
+    def shard_for_url(self, url):
+        return self.shard_for(host_key(url))
+
+def shard_db_path(db_path, shard_id, num_shards):
+    """Per-shard database holding that shard's frontier, seen store and robots cache."""
+    base, ext = os.path.splitext(db_path)
+    return f"{base}_shard{shard_id}of{num_shards}{ext or '.db'}"
+
+class StorageProxy(StorageHelper):
+    """
+    StorageHelper for a shard process. Reads go straight to SQLite, but every
+    write is forwarded to the parent, which is the single writer of the shared
+    database and Whoosh index.
+    """
+    def __init__(self, db_path, shard_id, results):
+        super().__init__(db_path)
+        self.shard_id = shard_id
+        self.results = results
+
+    def _forward(self, method, *args, **kwargs):
+        self.results.put(("call", self.shard_id, method, args, kwargs))
+
+    async def save_page(self, *args, **kwargs):
+        # Applied by the parent in order, ahead of this page's index_document
+        self._forward("save_page", *args, **kwargs)
+        return True
+
+    async def mark_not_modified(self, *args, **kwargs):
+        self._forward("mark_not_modified", *args, **kwargs)
+
+    async def save_log(self, *args, **kwargs):
+        self._forward("save_log", *args, **kwargs)
+
+    async def save_links(self, *args, **kwargs):
+        self._forward("save_links", *args, **kwargs)
+
+    async def index_document(self, *args, **kwargs):
+        self._forward("index_document", *args, **kwargs)
+
+    async def flush_anchors(self, drain=False):
+        pass # The parent owns the anchor queue and the index
+
+class ShardCrawlerManager(CrawlerManager):
+    """
+    A CrawlerManager that only crawls the hosts its shard owns. Links to other
+    hosts are sent to the owning shard's inbox instead of the local frontier.
+    seed_urls are the seeds on those hosts, and their sitemaps are loaded here.
+    """
+    def __init__(self, shard_id, num_shards, db_path, inboxes, results, concurrency=5, recrawl=False,
+                 seed_urls=(), sitemaps=True):
+        local_path = shard_db_path(db_path, shard_id, num_shards)
+        parse_pool = ParsePool(workers=max(1, (os.cpu_count() or 1) // num_shards))
+        super().__init__(list(seed_urls), db_path=db_path, concurrency=concurrency, recrawl=recrawl,
+                         parse_pool=parse_pool, sitemaps=sitemaps)
+        self.shard_id = shard_id
+        self.ring = HashRing(range(num_shards))
+        self.inbox = inboxes[shard_id]
+        self.inboxes = inboxes
+        self.results = results
+        self.frontier = URLFrontier(local_path)
+        self.fetcher = Fetcher(db_path=local_path) # Hosts are sharded, so robots.txt entries are too
+        self.storage = StorageProxy(db_path, shard_id, results)
+        self.sent = 0 # Link batches sent to / received from other shards, for termination detection
+        self.received = 0
+        self.stopping = None
+        self.sitemap_task = None
+
+    async def add_links(self, links, priority, cash=None):
+        local, remote = [], {}
+        for link in links:
+            owner = self.ring.shard_for_url(link)
+            if owner == self.shard_id:
+                local.append(link)
+            else:
+                remote.setdefault(owner, []).append(link)
+
+        for owner, urls in remote.items():
+            self.sent += 1
+            self.inboxes[owner].put(("links", urls, priority, cash))
+        added = await self.frontier.add_urls(local, priority=priority, cash=cash)
+        # We can't know whether another shard had already seen its links, so count them as added
+        return added + [self.frontier.normalize_url(url) for urls in remote.values() for url in urls]
+
+    def _next_message(self):
+        # Poll with a timeout so the executor thread never outlives the shard
+        try:
+            return self.inbox.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    async def read_inbox(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._next_message)
+            if message is None:
+                continue
+            if message[0] == "stop":
+                self.stopping.set()
+                return
+            _, urls, priority, cash = message
+            await self.frontier.add_urls(urls, priority=priority, cash=cash)
+            self.received += 1
+
+    async def report_status(self, interval=0.2):
+        """Tell the parent whenever this shard goes idle/busy or exchanges links."""
+        last = None
+        while True:
+            # Not idle while sitemaps are still being read: they may queue more URLs
+            idle = self.frontier.pending == 0 and (self.sitemap_task is None or self.sitemap_task.done())
+            status = (idle, self.sent, self.received)
+            if status != last:
+                self.results.put(("status", self.shard_id, *status))
+                last = status
+            await asyncio.sleep(interval)
+
+    async def run(self):
+        self.stopping = asyncio.Event()
+        await self.initialize()
+
+        tasks = []
+        if self.sitemaps and self.seed_urls and (self.recrawl or not self.resumed):
+            self.sitemap_task = asyncio.create_task(self.load_sitemaps())
+            tasks.append(self.sitemap_task)
+        tasks += [asyncio.create_task(self.worker(i)) for i in range(self.concurrency)]
+        tasks.append(asyncio.create_task(self.read_inbox()))
+        tasks.append(asyncio.create_task(self.report_status()))
+        try:
+            # Idle is not enough, another shard may still send us links: wait for the parent's stop
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.fetcher.close()
+            await self.frontier.close()
+            self.parse_pool.close()
+
+def run_shard(shard_id, num_shards, db_path, inboxes, results, concurrency, recrawl, seed_urls, sitemaps):
+    """Entry point of a shard process."""
+    manager = ShardCrawlerManager(shard_id, num_shards, db_path, inboxes, results, concurrency, recrawl,
+                                  seed_urls, sitemaps)
+    try:
+        asyncio.run(manager.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        results.put(("exited", shard_id))
+
+class ShardedCrawler:
+    """
+    Runs the crawl as `shards` processes, each owning the hosts a consistent
+    hash ring assigns it, with its own frontier and fetcher. Parsing and
+    fetching scale with cores; this process routes the seeds (each shard
+    loads the sitemaps of the seed hosts it owns), applies every shard's
+    writes to the shared database and index as the single writer, and stops
+    the shards once all of them are idle with no links in transit.
+    """
+    def __init__(self, seed_urls, db_path=DB_PATH, shards=None, concurrency=5, recrawl=False, quiet_period=1.0,
+                 sitemaps=True):
+        self.seed_urls = seed_urls
+        self.db_path = db_path
+        self.num_shards = shards or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.recrawl = recrawl
+        self.sitemaps = sitemaps
+        # Shards report changes every 0.2s, so a balanced, all-idle state that holds this long is final
+        self.quiet_period = quiet_period
+        self.ring = HashRing(range(self.num_shards))
+        self.storage = StorageHelper(db_path)
+        self.stats = {"writes": 0, "write_errors": 0}
+
+    async def apply(self, method, args, kwargs):
+        try:
+            await getattr(self.storage, method)(*args, **kwargs)
+            self.stats["writes"] += 1
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            print(f"Error applying {method} from a shard: {e}")
+
+    async def run(self):
+        ctx = mp.get_context("spawn")
+        inboxes = [ctx.Queue() for _ in range(self.num_shards)]
+        results = ctx.Queue()
+
+        # Each shard queues its own seeds before it first reports, so it can't be stopped before they're crawled
+        seeds = {}
+        for url in self.seed_urls:
+            seeds.setdefault(self.ring.shard_for_url(url), []).append(url)
+
+        processes = [
+            ctx.Process(
+                target=run_shard, name=f"crawler-shard-{i}",
+                args=(i, self.num_shards, self.db_path, inboxes, results, self.concurrency, self.recrawl,
+                      seeds.get(i, []), self.sitemaps)
+            )
+            for i in range(self.num_shards)
+        ]
+        for process in processes:
+            process.start()
+        print(f"Started {self.num_shards} crawler shards.")
+
+        def next_result():
+            try:
+                return results.get(timeout=0.5)
+            except queue.Empty:
+                return None
+
+        loop = asyncio.get_running_loop()
+        status = {}
+        exited = set()
+        dead = set() # Shards that stopped before the parent told them to
+        stopping = False
+        last_change = loop.time()
+        start = time.time()
+        try:
+            while len(exited) < self.num_shards:
+                message = await loop.run_in_executor(None, next_result)
+                gone = []
+                if message is None:
+                    # A shard that died without saying so would otherwise hang the crawl
+                    for i, process in enumerate(processes):
+                        if i not in exited and not process.is_alive():
+                            print(f"Shard {i} died with exit code {process.exitcode}.")
+                            exited.add(i)
+                            gone.append(i)
+                elif message[0] == "call":
+                    _, shard_id, method, args, kwargs = message
+                    await self.apply(method, args, kwargs)
+                elif message[0] == "status":
+                    _, shard_id, idle, sent, received = message
+                    status[shard_id] = (idle, sent, received)
+                    last_change = loop.time()
+                elif message[0] == "exited":
+                    exited.add(message[1])
+                    if not stopping:
+                        print(f"Shard {message[1]} stopped on its own.")
+                        gone.append(message[1])
+
+                for i in gone:
+                    # It does no more work, but its last counts still balance the links it exchanged
+                    _, sent, received = status.get(i, (True, 0, 0))
+                    status[i] = (True, sent, received)
+                    dead.add(i)
+                    last_change = loop.time()
+
+                if not stopping and len(status) == self.num_shards:
+                    all_idle = all(idle for idle, _, _ in status.values())
+                    sent = sum(s for _, s, _ in status.values())
+                    received = sum(r for _, _, r in status.values())
+                    # Links sent to a dead shard are never received, so then only idleness counts
+                    balanced = sent == received or bool(dead)
+                    # Wait out the quiet period so a stale report can't end the crawl early
+                    if all_idle and balanced and loop.time() - last_change >= self.quiet_period:
+                        stopping = True
+                        for inbox in inboxes:
+                            inbox.put(("stop",))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if not stopping:
+                for inbox in inboxes:
+                    inbox.put(("stop",))
+            # Writes sent before a shard's "exited" are already applied; drain any stragglers
+            while True:
+                message = next_result()
+                if message is None:
+                    break
+                if message[0] == "call":
+                    await self.apply(*message[2:])
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+            await self.storage.close()
+            print(f"Sharded crawl finished in {time.time() - start:.1f}s: {self.stats}")
@@ -0,0 +1,70 @@
+from itertools import combinations
+
+from .parser import hamming_distance
+
+EMPTY_SIMHASH = "0000000000000000"
+
+class SimHashIndex:
+    """
+    Finds pages whose 64-bit SimHash is within `max_distance` bits of a given one.
+
+    The fingerprint is split into max_distance + 2 blocks. If two fingerprints
+    differ in at most max_distance bits, at least two of those blocks are
+    identical (pigeonhole), so we keep one table per pair of blocks, keyed on
+    the pair's bits. A lookup is then one indexed probe per table, and only the
+    few pages sharing a key get an exact Hamming check, however many pages exist.
+    The tables live in the `simhash_bands` table next to `pages`.
+    """
+    def __init__(self, max_distance=3, bits=64):
+        self.max_distance = max_distance
+        n_blocks = max_distance + 2
+        sizes = [bits // n_blocks + (i < bits % n_blocks) for i in range(n_blocks)]
+        self.blocks = [] # (shift, mask) for each block, most significant first
+        shift = bits
+        for size in sizes:
+            shift -= size
+            self.blocks.append((shift, (1 << size) - 1))
+        self.tables = list(combinations(range(n_blocks), 2))
+
+    def band_keys(self, content_hash):
+        """Return one (table_id, band_key) per table for a hex SimHash."""
+        fp = int(content_hash, 16)
+        keys = []
+        for table_id, (a, b) in enumerate(self.tables):
+            shift_a, mask_a = self.blocks[a]
+            shift_b, mask_b = self.blocks[b]
+            key = ((fp >> shift_a) & mask_a) * (mask_b + 1) + ((fp >> shift_b) & mask_b)
+            keys.append((table_id, key))
+        return keys
+
+    def band_rows(self, url_hash, content_hash):
+        """Rows to insert into simhash_bands for one page."""
+        return [(table_id, key, url_hash, content_hash) for table_id, key in self.band_keys(content_hash)]
+
+    def add(self, conn, url_hash, content_hash):
+        """(Re)index a page's fingerprint on a sqlite3 connection. The caller commits."""
+        conn.execute("DELETE FROM simhash_bands WHERE url_hash = ?", (url_hash,))
+        if content_hash and content_hash != EMPTY_SIMHASH:
+            conn.executemany(
+                "INSERT OR IGNORE INTO simhash_bands (table_id, band_key, url_hash, fingerprint) VALUES (?, ?, ?, ?)",
+                self.band_rows(url_hash, content_hash)
+            )
+
+    def find_near(self, conn, content_hash, exclude=None, limit=1):
+        """Return up to `limit` (url_hash, distance) pairs within max_distance of content_hash, closest first."""
+        keys = self.band_keys(content_hash)
+        query = " UNION ".join(
+            "SELECT url_hash, fingerprint FROM simhash_bands WHERE table_id = ? AND band_key = ?" for _ in keys
+        )
+        params = [value for key in keys for value in key]
+        candidates = conn.execute(query, params).fetchall()
+
+        matches = []
+        for url_hash, fingerprint in candidates:
+            if url_hash == exclude:
+                continue
+            distance = hamming_distance(content_hash, fingerprint)
+            if distance <= self.max_distance:
+                matches.append((url_hash, distance))
+        matches.sort(key=lambda m: m[1])
+        return matches[:limit]
@@ -0,0 +1,252 @@
+import asyncio
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from lxml import etree
+
+GZIP_MAGIC = b"\x1f\x8b"
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024 # Uncompressed size cap from the sitemaps.org protocol
+# (age in seconds, doublings of OPIC cash): the fresher a page's lastmod, the sooner it is fetched
+FRESHNESS_STEPS = ((86400, 4), (7 * 86400, 3), (30 * 86400, 2), (365 * 86400, 1))
+
+def parse_lastmod(text):
+    """
+    Parse a sitemap <lastmod> (W3C datetime: 2024, 2024-05, 2024-05-17 or a full
+    timestamp, with or without a zone) into a Unix timestamp. None if it isn't one.
+    """
+    if not text:
+        return None
+    text = text.strip()
+    if len(text) == 4:
+        text += "-01-01"
+    elif len(text) == 7:
+        text += "-01"
+    try:
+        when = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+def freshness(lastmod, now=None):
+    """How many times to double a sitemap URL's cash, from how recently it changed (0 if unknown or old)."""
+    if lastmod is None:
+        return 0
+    age = (time.time() if now is None else now) - lastmod
+    for max_age, steps in FRESHNESS_STEPS:
+        if age <= max_age:
+            return steps
+    return 0
+
+class SitemapParser:
+    """
+    Incremental parser for one sitemap or sitemap index. feed() it the body
+    as it arrives and it returns the (kind, loc, lastmod) entries completed
+    so far, kind being "url" or "sitemap". Gzipped bodies (.xml.gz served
+    without Content-Encoding) are recognised from their first bytes and
+    inflated chunk by chunk. Parsed elements are freed as soon as they are
+    read, so memory stays flat however big the file is; anything past
+    max_bytes of XML is ignored (`truncated`).
+    """
+    def __init__(self, max_bytes=MAX_SITEMAP_BYTES):
+        self.max_bytes = max_bytes
+        self.parser = etree.XMLPullParser(events=("end",), resolve_entities=False, no_network=True, recover=True)
+        self.inflate = None
+        self.head = b"" # First bytes, held back until we know whether the body is gzipped
+        self.size = 0 # XML bytes fed to the parser so far
+        self.truncated = False
+
+    def feed(self, data):
+        if self.truncated:
+            return []
+        if self.size == 0 and self.inflate is None:
+            self.head += data
+            if len(self.head) < len(GZIP_MAGIC):
+                return []
+            data, self.head = self.head, b""
+            if data.startswith(GZIP_MAGIC):
+                self.inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.inflate is not None:
+            # Never inflate more than we're willing to parse, so a zip bomb costs nothing
+            data = self.inflate.decompress(data, self.max_bytes - self.size + 1)
+        if self.size + len(data) > self.max_bytes:
+            data = data[:self.max_bytes - self.size]
+            self.truncated = True
+        self.size += len(data)
+        if data:
+            self.parser.feed(data)
+        return self._entries()
+
+    def close(self):
+        """Finish parsing and return the last entries."""
+        if self.head:
+            self.parser.feed(self.head)
+            self.head = b""
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            pass # Empty or cut-off body: keep whatever was read
+        return self._entries()
+
+    def _entries(self):
+        entries = []
+        for _, element in self.parser.read_events():
+            kind = etree.QName(element).localname
+            if kind not in ("url", "sitemap"):
+                continue
+            loc = lastmod = None
+            for child in element:
+                name = etree.QName(child).localname if isinstance(child.tag, str) else None
+                if name == "loc":
+                    loc = (child.text or "").strip()
+                elif name == "lastmod":
+                    lastmod = parse_lastmod(child.text)
+            if loc:
+                entries.append((kind, loc, lastmod))
+            # Drop the finished entry and everything before it
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+        return entries
+
+class SitemapLoader:
+    """
+    Seeds the frontier from a site's sitemaps instead of waiting for link
+    following to find every page. Sitemaps are discovered from robots.txt
+    (Sitemap: lines, falling back to /sitemap.xml), sitemap indexes are
+    followed, and every sitemap is streamed through a SitemapParser, so
+    even 50 MB files never sit in memory. URLs go to the frontier in
+    batches of batch_size:
+      - a fresher <lastmod> means more OPIC cash, so recently changed pages
+        are fetched first (see FRESHNESS_STEPS)
+      - a page we already crawled whose <lastmod> is newer than our copy is
+        put back on the queue straight away instead of waiting for its
+        revisit time
+    Sitemap fetches are spaced by the host's crawl delay, and reading a
+    host's sitemaps stops once its domain budget is used up.
+    """
+    def __init__(self, fetcher, batch_size=5000, max_sitemaps=1000, max_urls=1_000_000,
+                 max_bytes=MAX_SITEMAP_BYTES, guess=True):
+        self.fetcher = fetcher
+        self.batch_size = batch_size
+        self.max_sitemaps = max_sitemaps # Per site, counting index files
+        self.max_urls = max_urls # Per site
+        self.max_bytes = max_bytes
+        self.guess = guess # Try /sitemap.xml when robots.txt doesn't list any
+
+    async def discover(self, site_url):
+        """Sitemap URLs for the site's host, from its robots.txt."""
+        parsed = urlparse(site_url)
+        rp = await self.fetcher.get_robot_parser(site_url)
+        sitemaps = rp.site_maps() or []
+        if not sitemaps and self.guess:
+            sitemaps = [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+        return sitemaps
+
+    async def _read(self, url):
+        """Yield a sitemap's entries as its body streams in."""
+        parser = SitemapParser(self.max_bytes)
+        async with self.fetcher.session.get(url, allow_redirects=True) as resp:
+            if resp.status != 200:
+                print(f"[Sitemap] {url} returned {resp.status}")
+                return
+            async for chunk in resp.content.iter_chunked(self.fetcher.chunk_size):
+                for entry in parser.feed(chunk):
+                    yield entry
+                if parser.truncated:
+                    print(f"[Sitemap] {url} is over {self.max_bytes} bytes, reading no further")
+                    break
+        for entry in parser.close():
+            yield entry
+
+    async def entries(self, site_url, full=None):
+        """
+        Yield (url, lastmod) for every page in the site's sitemaps, up to
+        max_urls. full(), if given, is awaited before each sitemap fetch and
+        stops the walk once it returns True.
+        """
+        queue = await self.discover(site_url)
+        visited = set(queue)
+        fetched = urls = 0
+        while queue and fetched < self.max_sitemaps:
+            if full and await full():
+                return
+            sitemap_url = queue.pop(0)
+            if not await self.fetcher.enforce_politeness(sitemap_url):
+                continue
+            if fetched:
+                await asyncio.sleep(self.fetcher.get_crawl_delay(sitemap_url))
+            fetched += 1
+            try:
+                async for kind, loc, lastmod in self._read(sitemap_url):
+                    if kind == "sitemap":
+                        if loc not in visited:
+                            visited.add(loc)
+                            queue.append(loc)
+                        continue
+                    yield loc, lastmod
+                    urls += 1
+                    if urls >= self.max_urls:
+                        return
+            except Exception as e:
+                print(f"[Sitemap] Error reading {sitemap_url}: {e}")
+
+    async def load(self, frontier, site_url, storage=None, depth=1):
+        """
+        Queue every page in the site's sitemaps at link depth `depth`. Pass
+        the crawl's StorageHelper to also requeue crawled pages the sitemap
+        says have changed. Returns (new URLs queued, pages requeued).
+        """
+        # Budgets are counted per normalized host (no www., no default port), as add_urls keys them
+        domain = frontier.normalizer.host(site_url)
+        added = requeued = 0
+        batch = []
+
+        async def flush():
+            nonlocal added, requeued, batch
+            if batch:
+                new, changed = await self._add(frontier, storage, batch, depth)
+                added += new
+                requeued += changed
+                batch = []
+
+        async def full():
+            # Queue what the earlier sitemaps listed first, so the budget counts it
+            await flush()
+            return not frontier.budget.room(domain)
+
+        async for entry in self.entries(site_url, full):
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                await flush()
+        await flush()
+        return added, requeued
+
+    async def _add(self, frontier, storage, batch, depth):
+        now = time.time()
+        by_freshness = defaultdict(list)
+        for loc, lastmod in batch:
+            by_freshness[freshness(lastmod, now)].append(loc)
+        cash = frontier.policy.estimate_cash(depth)
+        added = 0
+        for steps, urls in by_freshness.items():
+            added += len(await frontier.add_urls(urls, priority=depth, cash=cash * 2 ** steps))
+
+        if storage is None:
+            return added, 0
+        lastmods = {}
+        for loc, lastmod in batch:
+            if lastmod is None:
+                continue
+            try:
+                lastmods[frontier.get_url_hash(frontier.normalize_url(loc))] = lastmod
+            except ValueError:
+                continue
+        changed = await storage.get_changed_pages(lastmods) if lastmods else []
+        return added, await frontier.requeue(changed) if changed else 0
@@ -1,7 +1,15 @@
-import aiosqlite
 import asyncio
+import sqlite3
 from datetime import datetime
-from whoosh.index import open_dir
+
+from infrastructure.database import Database
+
+from .anchors import aggregate_anchors, save_anchor_edges
+from .db import STATIC_RANK_SCALE
+from .index_writer import IndexWriterService
+from .revisit import next_revisit_interval
+from .simhash_index import SimHashIndex, EMPTY_SIMHASH
+from .telemetry import TelemetryStore, telemetry_dir
 
 import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -9,93 +17,228 @@ DB_PATH = os.path.join(BASE_DIR, "crawler_data.db")
 INDEX_DIR = os.path.join(BASE_DIR, "whoosh_index")
 
 class StorageHelper:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, index_dir=INDEX_DIR, anchor_batch=500):
         self.db_path = db_path
+        self._db = None # Shared Database reference, taken on first use and given back by close()
+        self.index_writer = IndexWriterService(index_dir)
+        self.simhash_index = SimHashIndex()
+        self.telemetry = TelemetryStore(telemetry_dir(db_path))
+        self.anchor_batch = anchor_batch
+        self.anchor_backlog = 0 # Pages queued in anchor_queue by this process since the last flush
+        self._anchor_lock = asyncio.Lock()
+        
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = Database.shared(self.db_path)
+        return self._db
+
+    def _save_page(self, conn, url_hash, url, domain, title, canonical_url, content_hash, language, etag, last_modified):
+        # Compare against the previous visit to learn how often this page changes
+        previous = conn.execute(
+            "SELECT content_hash, crawl_count, change_count, revisit_interval FROM pages WHERE url_hash = ?",
+            (url_hash,)
+        ).fetchone()
+            
+        if previous:
+            old_hash, crawl_count, change_count, last_interval = previous
+            crawl_count = (crawl_count or 0) + 1
+            change_count = (change_count or 0) + (old_hash != content_hash)
+        else:
+            crawl_count, change_count, last_interval = 0, 0, None
+        interval = next_revisit_interval(crawl_count, change_count, last_interval)
         
-    async def save_page(self, url_hash, url, domain, title, canonical_url, content_hash, language=None):
+        conn.execute(
+            """
+            INSERT INTO pages (url_hash, url, domain, title, canonical_url, content_hash, language, last_crawled_at,
+                               etag, last_modified, crawl_count, change_count, revisit_interval, next_crawl_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, datetime('now', ?))
+            ON CONFLICT(url_hash) DO UPDATE SET 
+                title=excluded.title, 
+                content_hash=excluded.content_hash, 
+                last_crawled_at=CURRENT_TIMESTAMP,
+                etag=excluded.etag,
+                last_modified=excluded.last_modified,
+                crawl_count=excluded.crawl_count,
+                change_count=excluded.change_count,
+                revisit_interval=excluded.revisit_interval,
+                next_crawl_at=excluded.next_crawl_at
+            """,
+            (url_hash, url, domain, title, canonical_url, content_hash, language,
+             etag, last_modified, crawl_count, change_count, interval, f"+{int(interval)} seconds")
+        )
+        if not previous or previous[0] != content_hash:
+            self.simhash_index.add(conn, url_hash, content_hash)
+
+    async def save_page(self, url_hash, url, domain, title, canonical_url, content_hash, language=None,
+                        etag=None, last_modified=None):
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    """
-                    INSERT INTO pages (url_hash, url, domain, title, canonical_url, content_hash, language, last_crawled_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    ON CONFLICT(url_hash) DO UPDATE SET 
-                        title=excluded.title, 
-                        content_hash=excluded.content_hash, 
-                        last_crawled_at=CURRENT_TIMESTAMP
-                    """,
-                    (url_hash, url, domain, title, canonical_url, content_hash, language)
-                )
-                await db.commit()
-                return True
+            await self.db.write(self._save_page, url_hash, url, domain, title, canonical_url, content_hash,
+                                language, etag, last_modified)
+            return True
         except Exception as e:
             print(f"Error saving page {url}: {e}")
             return False
 
-    async def check_content_duplicate(self, content_hash):
-        """Check if a SimHash already exists to prevent duplicate indexing."""
-        if content_hash == "0000000000000000":
+    def _mark_not_modified(self, conn, url_hash, etag, last_modified):
+        previous = conn.execute(
+            "SELECT crawl_count, change_count, revisit_interval FROM pages WHERE url_hash = ?", (url_hash,)
+        ).fetchone()
+        if not previous:
+            return
+            
+        crawl_count = (previous[0] or 0) + 1
+        change_count = previous[1] or 0
+        interval = next_revisit_interval(crawl_count, change_count, previous[2])
+        conn.execute(
+            """
+            UPDATE pages SET
+                last_crawled_at=CURRENT_TIMESTAMP,
+                etag=COALESCE(?, etag),
+                last_modified=COALESCE(?, last_modified),
+                crawl_count=?,
+                revisit_interval=?,
+                next_crawl_at=datetime('now', ?)
+            WHERE url_hash = ?
+            """,
+            (etag, last_modified, crawl_count, interval, f"+{int(interval)} seconds", url_hash)
+        )
+
+    async def mark_not_modified(self, url_hash, etag=None, last_modified=None):
+        """Record a 304 revisit: the content is unchanged, so only the schedule moves forward."""
+        try:
+            await self.db.write(self._mark_not_modified, url_hash, etag, last_modified)
+        except Exception as e:
+            print(f"Error recording 304 for {url_hash}: {e}", flush=True)
+
+    async def get_validators(self, url_hash):
+        """Return the (etag, last_modified) stored from the last fetch, for a conditional GET."""
+        try:
+            row = await self.db.fetchone("SELECT etag, last_modified FROM pages WHERE url_hash = ?", (url_hash,))
+            return (row[0], row[1]) if row else (None, None)
+        except Exception as e:
+            print(f"Error loading validators for {url_hash}: {e}", flush=True)
+            return None, None
+
+    async def get_due_pages(self, limit=10000):
+        """Return (url_hash, url) for pages whose next_crawl_at has passed, most overdue first."""
+        try:
+            return await self.db.fetchall(
+                """
+                SELECT url_hash, url FROM pages
+                WHERE next_crawl_at IS NOT NULL AND next_crawl_at <= CURRENT_TIMESTAMP
+                ORDER BY next_crawl_at LIMIT ?
+                """,
+                (limit,)
+            )
+        except Exception as e:
+            print(f"Error loading due pages: {e}", flush=True)
+            return []
+
+    async def get_changed_pages(self, lastmods, batch_size=500):
+        """Given url_hash -> last modified (Unix time, e.g. a sitemap's lastmod), return the crawled pages changed since our copy."""
+        url_hashes = list(lastmods)
+        changed = []
+        try:
+            for i in range(0, len(url_hashes), batch_size):
+                chunk = url_hashes[i:i + batch_size]
+                placeholders = ",".join("?" * len(chunk))
+                rows = await self.db.fetchall(
+                    f"SELECT url_hash, CAST(strftime('%s', last_crawled_at) AS INTEGER) FROM pages "
+                    f"WHERE last_crawled_at IS NOT NULL AND url_hash IN ({placeholders})",
+                    chunk
+                )
+                changed.extend(url_hash for url_hash, crawled_at in rows if int(lastmods[url_hash]) > crawled_at)
+        except Exception as e:
+            print(f"Error checking pages for changes: {e}", flush=True)
+        return changed
+
+    async def check_content_duplicate(self, content_hash, url_hash=None):
+        """Check if another page's SimHash is within a few bits of this one, to prevent near-duplicate indexing."""
+        if content_hash == EMPTY_SIMHASH:
             return False 
             
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                async with db.execute("SELECT 1 FROM pages WHERE content_hash = ? LIMIT 1", (content_hash,)) as cursor:
-                    result = await cursor.fetchone()
-                    return result is not None
+            # A revisit of the same page is not a duplicate of itself
+            matches = await self.db.read(self.simhash_index.find_near, content_hash, url_hash)
+            return bool(matches)
         except Exception as e:
             print(f"Error checking duplicate for {content_hash}: {e}", flush=True)
             return False
 
-    async def save_log(self, url_hash, fetch_time_ms, http_status, response_size_bytes):
+    async def save_log(self, url_hash, fetch_time_ms, http_status, response_size_bytes, truncated=False, aborted=False,
+                       domain=None):
+        """Record a fetch in the telemetry store, which lives outside the crawl database."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    """
-                    INSERT INTO crawl_logs (url_hash, fetch_time_ms, http_status, response_size_bytes)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (url_hash, fetch_time_ms, http_status, response_size_bytes)
-                )
-                await db.commit()
+            await self.telemetry.record(url_hash, domain, fetch_time_ms, http_status, response_size_bytes, truncated, aborted)
         except Exception as e:
             print(f"Error saving log for {url_hash}: {e}", flush=True)
 
-    async def save_links(self, source_url_hash, target_url_hashes):
+    async def save_links(self, source_url_hash, target_url_hashes, anchor_texts=None):
+        """Record a page's outgoing edges; anchor_texts (same order as target_url_hashes) is each link's text."""
         if not target_url_hashes:
             return
             
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                links_data = [(source_url_hash, target_hash, "") for target_hash in set(target_url_hashes)]
-                await db.executemany(
-                    """
-                    INSERT OR IGNORE INTO discovered_links (source_url_hash, target_url_hash, anchor_text)
-                    VALUES (?, ?, ?)
-                    """,
-                    links_data
-                )
-                await db.commit()
+            edges = dict(zip(target_url_hashes, anchor_texts or [""] * len(target_url_hashes)))
+            edges.pop(source_url_hash, None)
+            self.anchor_backlog += await self.db.write(save_anchor_edges, source_url_hash, edges)
         except Exception as e:
             print(f"Error saving links for {source_url_hash}: {e}", flush=True)
+            return
+            
+        # Targets whose anchor text changed are re-indexed in batches, not one update per link
+        if self.anchor_backlog >= self.anchor_batch and not self._anchor_lock.locked():
+            await self.flush_anchors()
 
-    def _index_document_sync(self, url_hash, url, title, text, thumbnail_url="", page_type="website"):
-        """Synchronous whoosh update."""
-        try:
-            ix = open_dir(INDEX_DIR)
-            writer = ix.writer()
-            writer.update_document(
-                url_hash=url_hash,
-                url=url,
-                title=title,
-                content=text,
-                thumbnail_url=thumbnail_url,
-                page_type=page_type,
-                crawled_at=datetime.utcnow()
-            )
-            writer.commit()
-        except Exception as e:
-            print(f"Index error for {url}: {e}")
+    async def flush_anchors(self, drain=False):
+        """Rewrite the anchor field of queued pages (one batch, or all of them with `drain`)."""
+        async with self._anchor_lock:
+            while True:
+                try:
+                    rows = await self.db.fetchall("SELECT url_hash FROM anchor_queue LIMIT ?", (self.anchor_batch,))
+                    url_hashes = [row[0] for row in rows]
+                    if not url_hashes:
+                        self.anchor_backlog = 0
+                        return
+                    anchors = await self.db.read(aggregate_anchors, url_hashes)
+                    for url_hash in url_hashes:
+                        await self.index_writer.update_fields(url_hash, anchor=anchors[url_hash])
+                    await self.db.executemany("DELETE FROM anchor_queue WHERE url_hash = ?", [(h,) for h in url_hashes])
+                except Exception as e:
+                    print(f"Error updating anchor text: {e}", flush=True)
+                    return
+                self.anchor_backlog = max(0, self.anchor_backlog - len(url_hashes))
+                if len(url_hashes) < self.anchor_batch:
+                    self.anchor_backlog = 0 # Queue is empty now (the count double-counts pages queued twice)
+                    return
+                if not drain:
+                    return
 
     async def index_document(self, url_hash, url, title, text, thumbnail_url="", page_type="website"):
-        """Add a document to Whoosh without blocking the asyncio event loop."""
-        await asyncio.to_thread(self._index_document_sync, url_hash, url, title, text, thumbnail_url, page_type)
+        """Queue a document for the shared Whoosh writer; it is committed in batches."""
+        try:
+            row = await self.db.fetchone("SELECT static_rank FROM page_rank WHERE url_hash = ?", (url_hash,))
+        except sqlite3.OperationalError:
+            row = None # PageRank hasn't been run on this database yet
+        anchors = await self.db.read(aggregate_anchors, [url_hash])
+        await self.index_writer.add_document(
+            url_hash=url_hash,
+            url=url,
+            title=title,
+            content=text,
+            anchor=anchors[url_hash],
+            thumbnail_url=thumbnail_url,
+            page_type=page_type,
+            crawled_at=datetime.utcnow(),
+            static_rank=int(round(row[0] * STATIC_RANK_SCALE)) if row else 0
+        )
+
+    async def close(self):
+        """Commit any queued index documents, anchor updates, database writes and telemetry."""
+        await self.flush_anchors(drain=True)
+        await self.index_writer.close()
+        await self.telemetry.close()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
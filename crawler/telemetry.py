@@ -0,0 +1,356 @@
+import asyncio
+import glob
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+MINUTE, HOUR = 60, 3600
+
+# Latency histogram buckets: log-spaced upper edges from 1 ms to 5 min (~17% wide each).
+# Histograms add up, so any window or host set can be rolled up from stored rollups exactly.
+LATENCY_EDGES = np.geomspace(1, 300_000, 80)
+STATUS_CLASSES = ("2xx", "3xx", "4xx", "5xx", "error") # "error": the fetch got no HTTP status at all
+
+RAW_COLUMNS = ("ts", "host", "url_hash", "fetch_ms", "status", "bytes", "truncated", "aborted")
+ROLLUP_COLUMNS = ("bucket", "host", "count", "bytes", "truncated", "aborted", "status", "latency")
+
+def telemetry_dir(db_path):
+    """Telemetry lives next to the crawl database, not in it."""
+    return os.path.splitext(db_path)[0] + "_telemetry"
+
+def status_class(status):
+    status = np.asarray(status)
+    classes = np.full(status.shape, 4, dtype=np.int8)
+    ok = (status >= 200) & (status < 600)
+    classes[ok] = status[ok] // 100 - 2
+    return classes
+
+def _merge_hosts(segments):
+    """Concatenate segments column by column, remapping their host ids onto one shared host table."""
+    hosts, inverse = np.unique(np.concatenate([seg["hosts"] for seg in segments]), return_inverse=True)
+    merged = {"hosts": hosts}
+    offset = 0
+    remapped = []
+    for seg in segments:
+        n = len(seg["hosts"])
+        remapped.append(inverse[offset:offset + n][seg["host"]] if n else seg["host"])
+        offset += n
+    for name in segments[0]:
+        if name == "hosts":
+            continue
+        merged[name] = np.concatenate(remapped if name == "host" else [seg[name] for seg in segments])
+    return merged
+
+def _select(columns, keep):
+    """The rows of a segment where `keep` is true (the host table is shared, not filtered)."""
+    return {name: (values if name == "hosts" else values[keep]) for name, values in columns.items()}
+
+def _group(bucket, host, n_hosts):
+    """Group ids for (bucket, host) pairs, plus the bucket and host of each group."""
+    keys, inverse = np.unique(bucket.astype(np.int64) * max(n_hosts, 1) + host, return_inverse=True)
+    return inverse, keys // max(n_hosts, 1), keys % max(n_hosts, 1)
+
+def rollup_raw(raw, resolution=MINUTE):
+    """Aggregate raw fetch rows into per-(bucket, host) rollups."""
+    groups, buckets, hosts = _group((raw["ts"] // resolution) * resolution, raw["host"], len(raw["hosts"]))
+    n = len(buckets)
+    status = np.zeros((n, len(STATUS_CLASSES)), dtype=np.int64)
+    np.add.at(status, (groups, status_class(raw["status"])), 1)
+    latency = np.zeros((n, len(LATENCY_EDGES) + 1), dtype=np.int64)
+    np.add.at(latency, (groups, np.searchsorted(LATENCY_EDGES, raw["fetch_ms"], side="right")), 1)
+    return {
+        "hosts": raw["hosts"],
+        "bucket": buckets,
+        "host": hosts,
+        "count": np.bincount(groups, minlength=n),
+        "bytes": np.bincount(groups, weights=raw["bytes"], minlength=n).astype(np.int64),
+        "truncated": np.bincount(groups, weights=raw["truncated"], minlength=n).astype(np.int64),
+        "aborted": np.bincount(groups, weights=raw["aborted"], minlength=n).astype(np.int64),
+        "status": status,
+        "latency": latency,
+    }
+
+def merge_rollups(rollup, resolution):
+    """Re-aggregate rollups onto a coarser bucket size (or the same one, to merge duplicate keys)."""
+    groups, buckets, hosts = _group((rollup["bucket"] // resolution) * resolution, rollup["host"], len(rollup["hosts"]))
+    merged = {"hosts": rollup["hosts"], "bucket": buckets, "host": hosts}
+    for name in ROLLUP_COLUMNS[2:]:
+        values = rollup[name]
+        out = np.zeros((len(buckets),) + values.shape[1:], dtype=np.int64)
+        np.add.at(out, groups, values)
+        merged[name] = out
+    return merged
+
+def percentiles(histogram, qs=(0.5, 0.95, 0.99)):
+    """Estimate latency percentiles (ms) from a latency histogram, interpolating within the bucket."""
+    total = histogram.sum()
+    if not total:
+        return [None] * len(qs)
+    cumulative = np.cumsum(histogram)
+    values = []
+    for q in qs:
+        i = int(np.searchsorted(cumulative, q * total))
+        low = LATENCY_EDGES[i - 1] if i > 0 else 0.0
+        high = LATENCY_EDGES[min(i, len(LATENCY_EDGES) - 1)]
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (q * total - before) / histogram[i] if histogram[i] else 0.0
+        values.append(round(float(low + (high - low) * fraction), 1))
+    return values
+
+class TelemetryStore:
+    """
+    Append-only, columnar store for per-fetch crawl telemetry, kept out of the
+    crawl database so logging never competes with page writes.
+
+    record() appends to in-memory columns. Every `flush_rows` fetches or
+    `flush_interval` seconds the buffer is written out as a segment of numpy
+    columns under raw/, together with its per-minute, per-host rollup under
+    minute/: fetch count, bytes, status classes and a latency histogram.
+    Histograms merge by addition, so p50/p95/p99 for any window or host come
+    from the rollups alone, without touching raw rows.
+
+    maintain() keeps the file count and disk use bounded. It compacts closed
+    hours into one segment each, downsamples minute rollups older than
+    `minute_retention` into hour/, and drops raw rows and hour rollups past
+    their retention. One process writes a store; any number may read it.
+    """
+    def __init__(self, path, flush_rows=5000, flush_interval=60, raw_retention=7 * 86400,
+                 minute_retention=14 * 86400, hour_retention=365 * 86400, maintain_interval=600):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.raw_retention = raw_retention
+        self.minute_retention = minute_retention
+        self.hour_retention = hour_retention
+        self.maintain_interval = maintain_interval
+        self._buffer = self._empty_buffer()
+        self._last_flush = time.time()
+        self._last_maintain = 0
+        self._flush_lock = asyncio.Lock()
+
+    @staticmethod
+    def _empty_buffer():
+        return {name: [] for name in RAW_COLUMNS}
+
+    # --- Writing ---
+
+    async def record(self, url_hash, host, fetch_time_ms, http_status, response_size_bytes, truncated=False, aborted=False):
+        """Buffer one fetch; writes a segment (off the event loop) once enough has accumulated."""
+        buf = self._buffer
+        buf["ts"].append(time.time())
+        buf["host"].append(host or "")
+        buf["url_hash"].append(url_hash or "")
+        buf["fetch_ms"].append(fetch_time_ms or 0)
+        buf["status"].append(http_status or 0)
+        buf["bytes"].append(response_size_bytes or 0)
+        buf["truncated"].append(bool(truncated))
+        buf["aborted"].append(bool(aborted))
+        due = len(buf["ts"]) >= self.flush_rows or time.time() - self._last_flush >= self.flush_interval
+        if due and not self._flush_lock.locked(): # Others keep buffering while one worker flushes
+            await self.flush()
+
+    @staticmethod
+    def _columns(buf):
+        hosts, host_ids = np.unique(np.array(buf["host"], dtype=str), return_inverse=True)
+        return {
+            "hosts": hosts,
+            "ts": np.array(buf["ts"], dtype=np.float64),
+            "host": host_ids.astype(np.int32),
+            "url_hash": np.array(buf["url_hash"], dtype="S64"),
+            "fetch_ms": np.array(buf["fetch_ms"], dtype=np.float32),
+            "status": np.array(buf["status"], dtype=np.int16),
+            "bytes": np.array(buf["bytes"], dtype=np.int64),
+            "truncated": np.array(buf["truncated"], dtype=bool),
+            "aborted": np.array(buf["aborted"], dtype=bool),
+        }
+
+    def _take_buffer(self):
+        buf, self._buffer = self._buffer, self._empty_buffer()
+        self._last_flush = time.time()
+        return self._columns(buf) if buf["ts"] else None
+
+    async def flush(self):
+        """Write buffered fetches out as a raw segment plus its minute rollup."""
+        async with self._flush_lock:
+            raw = self._take_buffer()
+            if raw is not None:
+                await asyncio.to_thread(self._write_segments, raw)
+            if time.time() - self._last_maintain >= self.maintain_interval:
+                self._last_maintain = time.time()
+                await asyncio.to_thread(self.maintain)
+
+    def import_rows(self, rows):
+        """Write already-timestamped fetches, tuples in RAW_COLUMNS order, straight out as one segment."""
+        if rows:
+            self._write_segments(self._columns(dict(zip(RAW_COLUMNS, map(list, zip(*rows))))))
+
+    def _write_segments(self, raw):
+        self._save("raw", raw["ts"].min(), raw["ts"].max(), raw)
+        rollup = rollup_raw(raw, MINUTE)
+        self._save("minute", rollup["bucket"].min(), rollup["bucket"].max() + MINUTE, rollup)
+
+    def _save(self, kind, start, end, columns):
+        directory = os.path.join(self.path, kind)
+        os.makedirs(directory, exist_ok=True)
+        # The name carries the time range so readers can skip segments without opening them
+        name = f"{int(start)}-{int(np.ceil(end))}-{time.time_ns()}.npz"
+        tmp = os.path.join(directory, f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp, os.path.join(directory, name)) # Readers never see a half-written segment
+
+    async def close(self):
+        await self.flush()
+
+    # --- Reading ---
+
+    def _segments(self, kind, since=None, until=None):
+        """(start, end, path) of the segments of one kind overlapping [since, until), oldest first."""
+        found = []
+        for path in glob.glob(os.path.join(self.path, kind, "*.npz")):
+            try:
+                start, end = map(int, os.path.basename(path).split("-")[:2])
+            except ValueError:
+                continue
+            if (since is None or end >= since) and (until is None or start < until):
+                found.append((start, end, path))
+        return sorted(found)
+
+    @staticmethod
+    def _load(path):
+        try:
+            with np.load(path) as data:
+                return {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None # Compacted or expired by the writer while we were listing
+
+    def _load_rollups(self, since, until):
+        """Every rollup row whose bucket overlaps [since, until), merged onto one host table."""
+        segments = []
+        for kind, resolution in (("hour", HOUR), ("minute", MINUTE)):
+            for _, _, path in self._segments(kind, since, until):
+                segment = self._load(path)
+                if segment is not None:
+                    segments.append(_select(segment, (segment["bucket"] + resolution > since) & (segment["bucket"] < until)))
+        # Fetches still in this process's buffer
+        if self._buffer["ts"]:
+            rollup = rollup_raw(self._columns(self._buffer), MINUTE)
+            segments.append(_select(rollup, (rollup["bucket"] + MINUTE > since) & (rollup["bucket"] < until)))
+        segments = [segment for segment in segments if len(segment["bucket"])]
+        return _merge_hosts(segments) if segments else None
+
+    def summary(self, window=3600, by="minute", host=None, until=None, limit=None) -> List[Dict]:
+        """
+        Rollups over the last `window` seconds, one row per minute, hour or host
+        (by="minute" | "hour" | "host" | "total"), optionally for a single host.
+        Rows have fetch count, p50/p95/p99 latency, bytes and status classes.
+        Minutes that were downsampled show up as whole hours.
+        """
+        until = until or time.time()
+        since = until - window
+        rollup = self._load_rollups(since, until)
+        if rollup is None:
+            return []
+        if host is not None:
+            rollup = _select(rollup, np.isin(rollup["host"], np.flatnonzero(rollup["hosts"] == host)))
+
+        if by == "host":
+            keys = rollup["host"]
+        elif by == "hour":
+            keys = (rollup["bucket"] // HOUR) * HOUR
+        elif by == "total":
+            keys = np.zeros(len(rollup["bucket"]), dtype=np.int64)
+        else:
+            keys = rollup["bucket"]
+        unique_keys, groups = np.unique(keys, return_inverse=True)
+        totals = {}
+        for name in ROLLUP_COLUMNS[2:]:
+            values = rollup[name]
+            out = np.zeros((len(unique_keys),) + values.shape[1:], dtype=np.int64)
+            np.add.at(out, groups, values)
+            totals[name] = out
+
+        rows = []
+        for i, key in enumerate(unique_keys):
+            row = {}
+            if by == "host":
+                row["host"] = str(rollup["hosts"][key])
+            elif by != "total":
+                row["time"] = int(key)
+            p50, p95, p99 = percentiles(totals["latency"][i])
+            count = int(totals["count"][i])
+            row.update({
+                "fetches": count,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "bytes": int(totals["bytes"][i]),
+                "status": {name: int(n) for name, n in zip(STATUS_CLASSES, totals["status"][i])},
+                "error_rate": round(float(totals["status"][i][2:].sum()) / count, 4) if count else None, # 4xx, 5xx and failed fetches
+                "truncated": int(totals["truncated"][i]),
+                "aborted": int(totals["aborted"][i]),
+            })
+            rows.append(row)
+        if by == "host":
+            rows.sort(key=lambda r: r["fetches"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    # --- Retention and compaction ---
+
+    def _replace(self, kind, old_paths, columns, start, end):
+        if columns is not None and len(columns.get("bucket", columns.get("ts", []))):
+            self._save(kind, start, end, columns)
+        for path in old_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def maintain(self, now=None):
+        """Compact closed hours, downsample old minutes into hours and drop expired segments."""
+        now = now or time.time()
+
+        for kind, retention in (("raw", self.raw_retention), ("hour", self.hour_retention)):
+            for _, end, path in self._segments(kind):
+                if end < now - retention:
+                    self._replace(kind, [path], None, 0, 0)
+
+        # Minute rollups past retention become hour rollups
+        expired = [(s, e, p) for s, e, p in self._segments("minute") if e < now - self.minute_retention]
+        if expired:
+            loaded = [seg for seg in map(self._load, [p for _, _, p in expired]) if seg is not None and len(seg["bucket"])]
+            merged = merge_rollups(_merge_hosts(loaded), HOUR) if loaded else None
+            self._replace("hour", [p for _, _, p in expired], merged,
+                          min(s for s, _, _ in expired), max(e for _, e, _ in expired))
+
+        # One segment per closed hour for raw rows and minute rollups, one per day for hour rollups
+        for kind, span in (("raw", HOUR), ("minute", HOUR), ("hour", 86400)):
+            closed = (now // span) * span
+            by_span = defaultdict(list)
+            for start, end, path in self._segments(kind):
+                if end <= closed:
+                    by_span[start // span].append((start, end, path))
+            for group in by_span.values():
+                if len(group) < 2:
+                    continue
+                loaded = [seg for seg in (self._load(p) for _, _, p in group) if seg is not None]
+                if not loaded:
+                    continue
+                merged = _merge_hosts(loaded)
+                if kind != "raw":
+                    merged = merge_rollups(merged, MINUTE if kind == "minute" else HOUR)
+                self._replace(kind, [p for _, _, p in group], merged,
+                              min(s for s, _, _ in group), max(e for _, e, _ in group))
+
+    def disk_usage(self) -> Dict[str, Dict[str, int]]:
+        usage = {}
+        for kind in ("raw", "minute", "hour"):
+            segments = self._segments(kind)
+            usage[kind] = {
+                "segments": len(segments),
+                "bytes": sum(os.path.getsize(p) for _, _, p in segments if os.path.exists(p)),
+            }
+        return usage
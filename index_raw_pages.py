@@ -1,8 +1,7 @@
 import sys
 import os
-import aiosqlite
+import argparse
 import asyncio
-from bs4 import BeautifulSoup
 import hashlib
 
 # Ensure imports work from the root dir
@@ -11,8 +10,30 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from whoosh.index import open_dir
 from crawler.db import DB_PATH, INDEX_DIR
 from crawler.parser import parse_html
+from infrastructure.raw_db import SQLiteRawDB
+from infrastructure.warc_archive import WarcArchive
 
-async def migrate_raw_pages():
+async def pages_from_db():
+    print("Reading raw pages from SQLite...")
+    raw_db = SQLiteRawDB(DB_PATH)
+    try:
+        await raw_db.initialize() # Migrates an old uncompressed raw_pages table
+        stats = await raw_db.storage_stats()
+        print(f"Found {stats['pages']} raw pages. Parsing and adding to Whoosh...")
+        async for row in raw_db.iter_pages():
+            yield row['url'], row['html'], row['crawled_at']
+    finally:
+        await raw_db.close()
+
+async def pages_from_archive(archive_dir):
+    # Latest record of every URL, read sequentially from the memory-mapped segments
+    print(f"Reading raw pages from the WARC archive in {archive_dir}...")
+    with WarcArchive(archive_dir) as archive:
+        print(f"Found {archive.stats()['urls']} archived pages. Parsing and adding to Whoosh...")
+        for record in archive.iter_latest():
+            yield record.url, record.text(), record.date.replace("T", " ").rstrip("Z")
+
+async def migrate_raw_pages(archive_dir=None):
     print(f"Opening index at {INDEX_DIR}")
     if not os.path.exists(INDEX_DIR):
         from crawler.db import init_whoosh_index
@@ -21,54 +42,50 @@ async def migrate_raw_pages():
     ix = open_dir(INDEX_DIR)
     writer = ix.writer()
     
-    print("Reading raw pages from SQLite...")
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT url, html, crawled_at FROM raw_pages") as cursor:
-            rows = await cursor.fetchall()
-            
-            print(f"Found {len(rows)} raw pages. Parsing and adding to Whoosh...")
-            
-            count = 0
-            from datetime import datetime
-            
-            for row in rows:
-                url = row['url']
-                html = row['html']
-                crawled_at_str = row['crawled_at']
-                
-                try:
-                    if crawled_at_str:
-                        # Handle fractional seconds if present
-                        if '.' in crawled_at_str:
-                            crawled_at = datetime.strptime(crawled_at_str.split('.')[0], "%Y-%m-%d %H:%M:%S")
-                        else:
-                            crawled_at = datetime.strptime(crawled_at_str, "%Y-%m-%d %H:%M:%S")
+    count = 0
+    from datetime import datetime
+
+    pages = pages_from_archive(archive_dir) if archive_dir else pages_from_db()
+    try:
+        async for url, html, crawled_at_str in pages:
+            try:
+                if crawled_at_str:
+                    # Handle fractional seconds if present
+                    if '.' in crawled_at_str:
+                        crawled_at = datetime.strptime(crawled_at_str.split('.')[0], "%Y-%m-%d %H:%M:%S")
                     else:
-                        crawled_at = datetime.utcnow()
-                except (ValueError, TypeError):
+                        crawled_at = datetime.strptime(crawled_at_str, "%Y-%m-%d %H:%M:%S")
+                else:
                     crawled_at = datetime.utcnow()
-                    
-                title, text, canonical_url, links, thumbnail_url, page_type = parse_html(html, url)
-                url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
-                
-                writer.update_document(
-                    url_hash=str(url_hash),
-                    url=url,
-                    title=title or url,
-                    content=text or title or "",
-                    thumbnail_url=thumbnail_url,
-                    page_type=page_type,
-                    crawled_at=crawled_at
-                )
-                count += 1
-                
-                if count % 100 == 0:
-                    print(f"  Indexed {count} pages...")
-                    
+            except (ValueError, TypeError):
+                crawled_at = datetime.utcnow()
+
+            title, text, canonical_url, links, thumbnail_url, page_type = parse_html(html, url)
+            url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+            writer.update_document(
+                url_hash=str(url_hash),
+                url=url,
+                title=title or url,
+                content=text or title or "",
+                thumbnail_url=thumbnail_url,
+                page_type=page_type,
+                crawled_at=crawled_at
+            )
+            count += 1
+
+            if count % 100 == 0:
+                print(f"  Indexed {count} pages...")
+    finally:
+        # Closes the raw store (and its archive) even if parsing a page fails
+        await pages.aclose()
+
     print("Committing changes to Whoosh...")
     writer.commit()
     print(f"Migrated and re-indexed {count} pages successfully.")
 
 if __name__ == "__main__":
-    asyncio.run(migrate_raw_pages())
+    parser = argparse.ArgumentParser(description="Re-index every stored raw page into Whoosh.")
+    parser.add_argument("--archive", help="read pages from this WARC archive directory instead of the SQLite raw store")
+    args = parser.parse_args()
+    asyncio.run(migrate_raw_pages(args.archive))
@@ -0,0 +1,82 @@
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    zstandard = None
+    HAS_ZSTD = False
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+CODEC_NONE = "none" # Tiny bodies that compression would only grow
+
+class BlobCodec:
+    """
+    Compresses raw page bodies with zstd, optionally with a dictionary trained
+    on pages from the same site (shared templates compress to almost nothing).
+    Falls back to zlib when the zstandard package isn't installed; blobs record
+    their codec, so a store written with one can still be read after switching.
+    """
+    def __init__(self, level: Optional[int] = None, max_dictionaries: int = 128):
+        self.codec = CODEC_ZSTD if HAS_ZSTD else CODEC_ZLIB
+        self.level = level or (3 if HAS_ZSTD else 6)
+        self.max_dictionaries = max_dictionaries
+        self._dictionaries = OrderedDict() # dict_id -> ZstdCompressionDict, least recently used first
+        self._compressors = {}
+        self._decompressors = {}
+
+    def train_dictionary(self, samples: List[bytes], size: int = 64 * 1024) -> Optional[bytes]:
+        """Train a zstd dictionary on sample bodies. Returns None without zstd or if the samples are too few/small."""
+        if not HAS_ZSTD:
+            return None
+        try:
+            return zstandard.train_dictionary(size, samples, level=self.level).as_bytes()
+        except zstandard.ZstdError:
+            return None
+
+    def has_dictionary(self, dict_id: int) -> bool:
+        return dict_id in self._dictionaries
+
+    def load_dictionary(self, dict_id: int, data: bytes):
+        self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+        self._dictionaries.move_to_end(dict_id)
+        while len(self._dictionaries) > self.max_dictionaries:
+            evicted, _ = self._dictionaries.popitem(last=False)
+            self._compressors.pop(evicted, None)
+            self._decompressors.pop(evicted, None)
+
+    def _dictionary(self, dict_id):
+        self._dictionaries.move_to_end(dict_id)
+        return self._dictionaries[dict_id]
+
+    def compress(self, data: bytes, dict_id: Optional[int] = None) -> Tuple[str, bytes]:
+        """Returns (codec, payload). dict_id must have been loaded first."""
+        if self.codec == CODEC_ZLIB:
+            codec, payload = CODEC_ZLIB, zlib.compress(data, self.level)
+        else:
+            compressor = self._compressors.get(dict_id)
+            if compressor is None:
+                dict_data = self._dictionary(dict_id) if dict_id is not None else None
+                compressor = self._compressors[dict_id] = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+            codec, payload = CODEC_ZSTD, compressor.compress(data)
+        if len(payload) >= len(data):
+            return CODEC_NONE, data
+        return codec, payload
+
+    def decompress(self, codec: str, payload: bytes, dict_id: Optional[int] = None) -> bytes:
+        if codec == CODEC_NONE:
+            return payload
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(payload)
+        if codec != CODEC_ZSTD:
+            raise ValueError(f"Unknown codec {codec!r}")
+        if not HAS_ZSTD:
+            raise RuntimeError("This page was stored with zstd; install the zstandard package to read it")
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            dict_data = self._dictionary(dict_id) if dict_id is not None else None
+            decompressor = self._decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return decompressor.decompress(payload)
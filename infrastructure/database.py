@@ -0,0 +1,238 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Applied to every connection. WAL lets readers run while the writer commits;
+# synchronous=NORMAL only fsyncs at checkpoints, which is still crash-safe in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=10000", # Other processes (crawler shards, the API) may hold the write lock briefly
+    "PRAGMA cache_size=-65536", # 64 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+class Database:
+    """
+    Shared SQLite access for everything that uses the crawl database.
+
+    Reads run on a small pool of persistent read-only connections. Writes are
+    functions `fn(conn, *args)` handed to write(): a single writer task
+    collects everything submitted within one tick and applies it on the one
+    write connection as a single transaction, each call inside its own
+    savepoint. By default a tick is one pass of the event loop, so a lone
+    write isn't delayed; under load the calls that queue up while a commit is
+    running make up the next batch. A `tick` in seconds trades latency for
+    bigger transactions. A failing call only rolls back its own statements, and every
+    caller still gets its own return value or exception once the batch is
+    committed.
+
+    Connections are plain sqlite3 connections driven from executor threads, so
+    a whole batch costs one thread hop and one commit instead of one per row.
+    Use Database.shared(path) so every component in a process shares the
+    same writer and pool. Each shared() call takes a reference and each
+    close() gives one back; only the last close() really closes.
+    """
+    _instances: Dict[str, "Database"] = {}
+
+    def __init__(self, db_path: str, readers: int = 4, tick: float = 0, max_batch: int = 1000):
+        self.db_path = db_path
+        self.readers = readers
+        self.tick = tick
+        self.max_batch = max_batch
+        self.stats = {"writes": 0, "transactions": 0, "failed_writes": 0, "failed_transactions": 0}
+        self._writer = None # Single-thread executor owning the write connection
+        self._write_conn = None
+        self._reader_pool = None
+        self._idle_readers = queue.SimpleQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._queue = None
+        self._task = None
+        self._refs = 0 # Owners from shared() that haven't closed yet
+
+    @classmethod
+    def shared(cls, db_path: str, **kwargs) -> "Database":
+        """
+        The process-wide instance for a database file; the first caller's settings win.
+        The caller owns a reference until it calls close().
+        """
+        key = os.path.abspath(db_path)
+        if key not in cls._instances:
+            cls._instances[key] = cls(db_path, **kwargs)
+        instance = cls._instances[key]
+        instance._refs += 1
+        return instance
+
+    def _connect(self, read_only=False) -> sqlite3.Connection:
+        # isolation_level=None: we issue BEGIN/SAVEPOINT/COMMIT ourselves
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    # --- Reads ---
+
+    def _run_read(self, fn, args):
+        try:
+            conn = self._idle_readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect(read_only=True)
+        try:
+            return fn(conn, *args)
+        finally:
+            self._idle_readers.put(conn)
+
+    async def read(self, fn: Callable, *args) -> Any:
+        """Run fn(conn, *args) on a pooled read connection and return its result."""
+        if self._reader_pool is None:
+            self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="sqlite-read")
+        return await asyncio.get_running_loop().run_in_executor(self._reader_pool, self._run_read, fn, args)
+
+    async def fetchone(self, sql: str, params=()) -> Optional[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()) -> List[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    # --- Writes ---
+
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def write(self, fn: Callable, *args) -> Any:
+        """
+        Run fn(conn, *args) in the next write transaction and return its result
+        once that transaction is committed. fn must not commit or roll back itself.
+        """
+        self._ensure_writer()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((fn, args, future))
+        return await future
+
+    async def execute(self, sql: str, params=()) -> int:
+        """Run one write statement; returns the number of rows it changed."""
+        return await self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, rows) -> int:
+        return await self.write(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def _apply(self, batch):
+        """Runs on the writer thread: one transaction, one savepoint per call."""
+        if self._write_conn is None:
+            self._write_conn = self._connect()
+        conn = self._write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        outcomes = []
+        try:
+            for fn, args in batch:
+                conn.execute("SAVEPOINT call")
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO call")
+                    conn.execute("RELEASE call")
+                    outcomes.append((False, e))
+                else:
+                    conn.execute("RELEASE call")
+                    outcomes.append((True, result))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return outcomes
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if self._queue.qsize() < self.max_batch:
+                await asyncio.sleep(self.tick) # Let concurrent writers join this transaction
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # Callers that gave up (cancelled) don't get their write applied
+            batch = [entry for entry in batch if not entry[2].done()]
+
+            if batch:
+                try:
+                    outcomes = await loop.run_in_executor(self._writer, self._apply, [(fn, args) for fn, args, _ in batch])
+                except Exception as e:
+                    self.stats["failed_transactions"] += 1
+                    print(f"Error committing {len(batch)} database writes: {e}")
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    self.stats["transactions"] += 1
+                    for (_, _, future), (ok, value) in zip(batch, outcomes):
+                        self.stats["writes" if ok else "failed_writes"] += 1
+                        if future.done():
+                            continue
+                        if ok:
+                            future.set_result(value)
+                        else:
+                            future.set_exception(value)
+            if stopping:
+                return
+
+    async def close(self):
+        """
+        Give back a reference. The last owner's close applies queued writes, then
+        closes every connection; the instance reopens on next use.
+        """
+        self._refs -= 1
+        if self._refs > 0:
+            return
+        self._refs = 0
+
+        leftover = []
+        if self._task is not None and not self._task.done() and self._task.get_loop() is asyncio.get_running_loop():
+            self._queue.put_nowait(None)
+            await self._task
+            # Writes submitted while we waited queued up behind the sentinel
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None:
+                    leftover.append(item)
+        self._task = None
+        # Unset the pools first, so a read arriving now starts a new pool instead of hitting a closed one
+        pools = (self._writer, self._reader_pool)
+        self._writer = self._reader_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._write_conn = None
+        self._idle_readers = queue.SimpleQueue()
+
+        if leftover:
+            # Their callers are still waiting: run them on a reopened writer
+            self._ensure_writer()
+            for item in leftover:
+                self._queue.put_nowait(item)
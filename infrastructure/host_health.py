@@ -0,0 +1,209 @@
+import asyncio
+import random
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+def is_failure(status):
+    """Whether a fetch status says the host is struggling: timeouts, rate limiting, 5xx and connection errors."""
+    return status is None or status in (408, 429) or status >= 500
+
+def backoff(attempt, base=1.0, cap=300.0):
+    """Exponential backoff with full jitter: a random wait in [0, min(cap, base * 2**attempt)] seconds."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class HostState:
+    __slots__ = ("limit", "in_flight", "latency_ms", "failures", "state", "open_until", "trips")
+
+    def __init__(self, limit):
+        self.limit = limit # AIMD concurrency limit, fractional between increases
+        self.in_flight = 0 # Slots taken through acquire()
+        self.latency_ms = None # EWMA of fetch latency
+        self.failures = 0 # Consecutive failed fetches
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.trips = 0 # Times the breaker opened in a row without a successful probe
+
+class HostHealth:
+    """
+    Per-host fetch health: an AIMD concurrency limit and a circuit breaker.
+
+    Every finished fetch is reported through record(). A fast success raises
+    the host's limit by about one per `limit` successes (additive increase); a
+    failure or a response slower than slow_ms multiplies it by `decrease`.
+    After failure_threshold failures in a row the breaker opens: limit() is 0
+    for open_seconds (doubling with each trip in a row, capped at
+    max_open_seconds, with jitter), then the host is half open and gets a single
+    probe, which closes the breaker on success or reopens it on failure.
+    After max_trips trips in a row is_dead() says to stop waiting for the host.
+
+    limit() is what a scheduler should cap in-flight fetches at. Callers that
+    don't keep their own count can use acquire()/release() instead.
+    """
+    def __init__(self, min_limit=1, max_limit=4, start_limit=1, increase=1.0, decrease=0.5, slow_ms=5000,
+                 failure_threshold=5, open_seconds=30.0, max_open_seconds=1800.0, max_trips=6, retry_base=1.0,
+                 retry_cap=120.0, max_hosts=100_000):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.start_limit = start_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_ms = slow_ms
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.max_trips = max_trips
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.max_hosts = max_hosts
+        self.hosts = {}
+        self._changed = None # asyncio.Condition for acquire(), created on first use
+        self._tasks = set() # Pending wake-ups of acquire() waiters, cancelled by close()
+
+    def _get(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            if len(self.hosts) >= self.max_hosts:
+                self._prune()
+            state = self.hosts[host] = HostState(self.start_limit)
+        return state
+
+    def _prune(self):
+        """Forget healthy idle hosts; they start over from start_limit if they come back."""
+        self.hosts = {
+            host: s for host, s in self.hosts.items()
+            if s.state != CLOSED or s.failures or s.in_flight
+        }
+
+    def _check_open(self, s, now=None):
+        if s.state == OPEN and (time.monotonic() if now is None else now) >= s.open_until:
+            s.state = HALF_OPEN
+        return s.state
+
+    def limit(self, host):
+        """How many fetches may be in flight for the host right now: 0 while its breaker is open, 1 while half open."""
+        s = self.hosts.get(host)
+        if s is None:
+            return max(int(self.start_limit), 1)
+        state = self._check_open(s)
+        if state == OPEN:
+            return 0
+        if state == HALF_OPEN:
+            return 1
+        return max(int(s.limit), 1)
+
+    def is_open(self, host):
+        s = self.hosts.get(host)
+        return s is not None and self._check_open(s) == OPEN
+
+    def open_hosts(self):
+        """Hosts whose breaker is open right now."""
+        now = time.monotonic()
+        return [host for host, s in self.hosts.items() if s.state == OPEN and self._check_open(s, now) == OPEN]
+
+    def is_dead(self, host):
+        """Whether the host's breaker has tripped max_trips times without a successful probe in between."""
+        s = self.hosts.get(host)
+        return s is not None and s.trips >= self.max_trips
+
+    def next_reopen_in(self):
+        """Seconds until the first open host may be probed again, or None if no breaker is open."""
+        now = time.monotonic()
+        waits = [s.open_until - now for s in self.hosts.values() if s.state == OPEN]
+        return max(0.0, min(waits)) if waits else None
+
+    def reopens_in(self, host):
+        """Seconds until an open host may be probed again (0 if it isn't open)."""
+        s = self.hosts.get(host)
+        if s is None or s.state != OPEN:
+            return 0.0
+        return max(0.0, s.open_until - time.monotonic())
+
+    def retry_after(self, host):
+        """Jittered exponential backoff for the host's next fetch after failures in a row (0 if it's healthy)."""
+        s = self.hosts.get(host)
+        if s is None or not s.failures:
+            return 0.0
+        return backoff(s.failures - 1, self.retry_base, self.retry_cap)
+
+    def record(self, host, status, latency_ms):
+        """Report a finished fetch. Returns True if this failure tripped the breaker."""
+        s = self._get(host)
+        state = self._check_open(s)
+        tripped = False
+        if is_failure(status):
+            s.failures += 1
+            s.limit = max(self.min_limit, s.limit * self.decrease)
+            if state == HALF_OPEN or (state == CLOSED and s.failures >= self.failure_threshold):
+                s.trips += 1
+                wait = min(self.max_open_seconds, self.open_seconds * 2 ** (s.trips - 1))
+                s.state = OPEN
+                s.open_until = time.monotonic() + random.uniform(0.5 * wait, wait)
+                tripped = True
+        else:
+            s.failures = 0
+            if state == HALF_OPEN:
+                s.state = CLOSED
+                s.trips = 0
+            s.latency_ms = latency_ms if s.latency_ms is None else 0.8 * s.latency_ms + 0.2 * latency_ms
+            if latency_ms > self.slow_ms:
+                s.limit = max(self.min_limit, s.limit * self.decrease)
+            else:
+                s.limit = min(self.max_limit, s.limit + self.increase / max(s.limit, 1))
+        if self._changed is not None:
+            task = asyncio.ensure_future(self._notify())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return tripped
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def acquire(self, host):
+        """Wait for a fetch slot on the host. Returns False (without a slot) if its breaker is open."""
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        async with self._changed:
+            while True:
+                limit = self.limit(host)
+                if limit == 0:
+                    return False
+                s = self._get(host)
+                if s.in_flight < limit:
+                    s.in_flight += 1
+                    return True
+                await self._changed.wait()
+
+    async def release(self, host):
+        """Give back a slot taken with acquire()."""
+        s = self.hosts.get(host)
+        if s is not None and s.in_flight > 0:
+            s.in_flight -= 1
+        if self._changed is not None:
+            await self._notify()
+
+    def close(self):
+        """Cancel wake-ups still pending from record()."""
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+
+    def report(self, limit=100):
+        """Hosts in trouble first (open, half open, then most failures), with their limits and latency."""
+        order = {OPEN: 0, HALF_OPEN: 1, CLOSED: 2}
+        rows = []
+        for host, s in self.hosts.items():
+            state = self._check_open(s)
+            rows.append({
+                "host": host,
+                "state": state,
+                "limit": self.limit(host),
+                "in_flight": s.in_flight,
+                "latency_ms": round(s.latency_ms) if s.latency_ms is not None else None,
+                "failures": s.failures,
+                "trips": s.trips,
+                "reopens_in": round(self.reopens_in(host), 1),
+            })
+        rows.sort(key=lambda r: (order[r["state"]], -r["failures"], r["host"]))
+        return rows[:limit] if limit else rows
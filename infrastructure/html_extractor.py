@@ -0,0 +1,143 @@
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+# Subtrees that never contribute text, links or images to the cleaned page
+BOILERPLATE_TAGS = {"script", "style", "nav", "footer", "aside", "header", "noscript", "iframe"}
+
+class PageCollector:
+    """
+    lxml parser target that gathers everything the crawler and CleanAgent need
+    from a page in one pass over the parse events, without building a tree.
+
+    Text, links and images inside BOILERPLATE_TAGS are skipped the same way
+    decomposing those elements did. `all_links` and `images` are recorded for
+    the whole document, since CleanAgent collects them before removing boilerplate.
+    """
+    def __init__(self, skip_tags=BOILERPLATE_TAGS):
+        self.skip_tags = skip_tags
+        self.skip_depth = 0 # > 0 while inside a boilerplate subtree
+        self.title: Optional[str] = None
+        self.canonical: Optional[str] = None
+        self.og_image: Optional[str] = None
+        self.og_type: Optional[str] = None
+        self.first_img_src: Optional[str] = None
+        self.links: List[str] = [] # <a href> outside boilerplate, raw
+        self.anchors: List[str] = [] # anchor text of each entry in `links`
+        self.all_links: List[str] = [] # every <a href>, raw
+        self.images: List[Dict[str, str]] = [] # every <img> as {"src", "data-src", "alt"}
+        self.strings: List[str] = [] # visible text nodes, unstripped
+        self.paragraphs: List[str] = []
+
+        self._buffer = [] # pending character data, flushed at the next tag boundary
+        self._in_title = False
+        self._title_parts = None
+        self._paragraph = None # parts of the <p> being read, if any
+        self._anchor = None # parts of the <a href> being read, if any
+        self._seen_meta = set()
+
+    def _flush_text(self):
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        if self.skip_depth:
+            return
+        self.strings.append(text)
+        if self._title_parts is not None and self._in_title:
+            self._title_parts.append(text)
+        if self._paragraph is not None:
+            self._paragraph.append(text)
+        if self._anchor is not None:
+            self._anchor.append(text)
+
+    def _end_anchor(self):
+        self.anchors[-1] = " ".join("".join(self._anchor).split())
+        self._anchor = None
+
+    def start(self, tag, attrib):
+        self._flush_text()
+        if self.skip_depth or tag in self.skip_tags:
+            self.skip_depth += 1
+            # Links and images are still collected for CleanAgent
+            if tag == "a" and "href" in attrib:
+                self.all_links.append(attrib["href"])
+            elif tag == "img":
+                self.images.append({"src": attrib.get("src"), "data-src": attrib.get("data-src"), "alt": attrib.get("alt", "")})
+            return
+
+        if tag == "a":
+            if self._anchor is not None:
+                self._end_anchor() # Unclosed <a>
+            if "href" in attrib:
+                self.links.append(attrib["href"])
+                self.anchors.append("")
+                self.all_links.append(attrib["href"])
+                self._anchor = []
+        elif tag == "img":
+            self.images.append({"src": attrib.get("src"), "data-src": attrib.get("data-src"), "alt": attrib.get("alt", "")})
+            if self._anchor is not None and attrib.get("alt"):
+                self._anchor.append(f" {attrib['alt']} ") # Image links (logos) are named by their alt text
+            if self.first_img_src is None and "src" in attrib:
+                self.first_img_src = attrib["src"]
+        elif tag == "p":
+            self._paragraph = []
+        elif tag == "title" and self._title_parts is None:
+            self._in_title = True
+            self._title_parts = []
+        elif tag == "link" and self.canonical is None and "canonical" in attrib.get("rel", "").lower().split():
+            self.canonical = attrib.get("href", "")
+        elif tag == "meta":
+            # Only the first og:image/og:type tag counts, even if it has no content
+            prop = attrib.get("property")
+            if prop in ("og:image", "og:type") and prop not in self._seen_meta:
+                self._seen_meta.add(prop)
+                if prop == "og:image":
+                    self.og_image = attrib.get("content", "")
+                else:
+                    self.og_type = attrib.get("content")
+
+    def end(self, tag):
+        self._flush_text()
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts)
+        elif tag == "p" and self._paragraph is not None:
+            self.paragraphs.append("".join(self._paragraph))
+            self._paragraph = None
+        elif tag == "a" and self._anchor is not None:
+            self._end_anchor()
+
+    def data(self, data):
+        self._buffer.append(data)
+
+    def comment(self, text):
+        # Comments are not page text; just end the current text node
+        self._flush_text()
+
+    def close(self):
+        self._flush_text()
+        if self._paragraph is not None:
+            self.paragraphs.append("".join(self._paragraph))
+            self._paragraph = None
+        if self._in_title:
+            self.title = "".join(self._title_parts)
+        if self._anchor is not None:
+            self._end_anchor()
+        return self
+
+    def visible_text(self, separator=" "):
+        return separator.join(s.strip() for s in self.strings if s.strip())
+
+def collect(html: str) -> PageCollector:
+    """Run the single-pass extractor over a page and return the filled-in collector."""
+    collector = PageCollector()
+    if not html or not html.strip():
+        # libxml2 refuses to close a parser that never saw an element
+        return collector.close()
+    parser = etree.HTMLParser(target=collector)
+    parser.feed(html)
+    return parser.close()
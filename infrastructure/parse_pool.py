@@ -0,0 +1,62 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+class ParsePool:
+    """
+    Runs CPU-bound HTML parsing in a pool of worker processes, off the event loop.
+
+    Both the crawler (crawler.parser.parse_page) and the agent pipeline
+    (agents.clean_agent.extract_main_content) submit module-level functions
+    here, so a large page no longer stalls every fetch in the process and
+    parsing scales with the number of cores. A semaphore bounds the work in
+    flight: callers wait for a slot instead of queueing unbounded HTML in the
+    executor. Workers are spawned rather than forked: the parent runs
+    database writer threads and an event loop, which a fork would copy mid-use.
+    """
+    def __init__(self, workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.executor = None
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.stats = {"submitted": 0, "completed": 0, "errors": 0}
+
+    @classmethod
+    def shared(cls, workers: Optional[int] = None, max_in_flight: Optional[int] = None) -> "ParsePool":
+        """Returns the process-wide pool; the first caller's settings win."""
+        if not hasattr(cls, "_instance"):
+            cls._instance = cls(workers, max_in_flight)
+        return cls._instance
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in a worker process. fn and its arguments must be picklable."""
+        async with self.semaphore:
+            self.stats["submitted"] += 1
+            executor = self._get_executor()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (OOM, crash in a C parser). Start a fresh pool for the next call.
+                self.stats["errors"] += 1
+                if self.executor is executor:
+                    self.executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            self.stats["completed"] += 1
+            return result
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -1,7 +1,21 @@
 import abc
+import asyncio
+import hashlib
 import json
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any, List
-import aiosqlite
+from urllib.parse import urlparse
+
+from infrastructure.compression import BlobCodec, HAS_ZSTD
+from infrastructure.database import Database
+from infrastructure.warc_archive import WarcArchive
+
+CODEC_WARC = "warc" # The blob lives in the WARC archive; its data is "segment:offset:length"
+
+def _dict_rows(conn, sql, params=()):
+    cursor = conn.execute(sql, params)
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 class RawDB(abc.ABC):
     @abc.abstractmethod
@@ -27,81 +41,354 @@ class RawDB(abc.ABC):
 class SQLiteRawDB(RawDB):
     """
     SQLite implementation of the RawDB for storing crawled HTML pages.
+
+    Bodies are stored once per content hash in `raw_blobs`, compressed with
+    zstd (zlib without the zstandard package). Once a domain has `dict_samples`
+    new pages, a zstd dictionary is trained on them and used for its later
+    pages. Each URL keeps its last `max_versions` distinct bodies in
+    `raw_versions`; `raw_pages` points at the latest one.
+
+    With `archive_dir`, new bodies are appended to a WarcArchive instead and
+    raw_blobs only records where they are, which keeps the database small and
+    lets bulk jobs stream the archive sequentially.
     """
-    def __init__(self, db_path: str = "crawler_data.db"):
+    SAMPLE_BYTES = 64 * 1024 # Dictionary samples only need the template, not the whole page
+    MAX_SAMPLED_DOMAINS = 256
+
+    def __init__(self, db_path: str = "crawler_data.db", max_versions: int = 5,
+                 dict_samples: int = 64, dict_size: int = 64 * 1024, level: Optional[int] = None,
+                 archive_dir: Optional[str] = None):
         self.db_path = db_path
-        
+        self.db = Database.shared(db_path)
+        self.max_versions = max(1, max_versions) # The latest version is always kept
+        self.dict_samples = dict_samples
+        self.dict_size = dict_size
+        self.codec = BlobCodec(level)
+        self._domain_dicts = {} # domain -> dict_id, or None if it has none yet
+        self._samples = {} # domain -> bodies collected for training
+        self.archive = WarcArchive(archive_dir) if archive_dir else None
+
+    def _create_tables(self, conn) -> bool:
+        """Create the schema; returns True if an old uncompressed raw_pages table (renamed raw_pages_legacy) is left to migrate."""
+        if "html" in [row[1] for row in conn.execute("PRAGMA table_info(raw_pages)").fetchall()]:
+            conn.execute("ALTER TABLE raw_pages RENAME TO raw_pages_legacy")
+        # Also true when an earlier migration was interrupted: it picks up where it stopped
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'raw_pages_legacy'").fetchone() is not None
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_blobs (
+                content_hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                dict_id INTEGER,
+                raw_size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_versions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                headers TEXT,
+                crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_versions_url ON raw_versions(url, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_versions_hash ON raw_versions(content_hash)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_pages (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                headers TEXT,
+                crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_dicts (
+                dict_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                domain TEXT NOT NULL,
+                data BLOB NOT NULL,
+                samples INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_dicts_domain ON raw_dicts(domain)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                page_url TEXT,
+                description TEXT,
+                crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        return legacy
+
     async def initialize(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS raw_pages (
-                    url TEXT PRIMARY KEY,
-                    html TEXT NOT NULL,
-                    headers TEXT,
-                    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS images (
-                    url TEXT PRIMARY KEY,
-                    page_url TEXT,
-                    description TEXT,
-                    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            await db.commit()
+        if self.archive:
+            await asyncio.to_thread(self.archive.open)
+        if await self.db.write(self._create_tables):
+            await self._migrate_legacy()
+
+    async def _migrate_legacy(self):
+        """
+        Move pages from the old uncompressed raw_pages table into the blob store.
+        Each batch is deleted from the old table once stored, so a migration cut
+        short resumes with the rows it hadn't reached (storing a batch twice is harmless).
+        """
+        print("Compressing raw_pages into the content-addressed store...")
+        count = 0
+        while True:
+            rows = await self.db.fetchall(
+                "SELECT rowid, url, html, headers, crawled_at FROM raw_pages_legacy ORDER BY rowid LIMIT 500"
+            )
+            if not rows:
+                break
+            writes = []
+            for rowid, url, html, headers_json, crawled_at in rows:
+                headers = json.loads(headers_json) if headers_json else {}
+                writes.append(self.db.write(self._store, url, *await self._prepare(url, html, headers, crawled_at)))
+            await asyncio.gather(*writes) # One transaction per batch
+            await self.db.executemany("DELETE FROM raw_pages_legacy WHERE rowid = ?", [(row[0],) for row in rows])
+            count += len(rows)
+        await self.db.execute("DROP TABLE raw_pages_legacy")
+        print(f"Migrated {count} raw pages. Run VACUUM to give the freed space back to the filesystem.")
+
+    async def _dictionary_for(self, domain: str, body: bytes) -> Optional[int]:
+        """The dictionary to compress a new body of this domain with, training one once enough samples are in."""
+        if domain in self._domain_dicts:
+            return self._domain_dicts[domain]
+        row = await self.db.fetchone("SELECT dict_id, data FROM raw_dicts WHERE domain = ? ORDER BY dict_id DESC LIMIT 1", (domain,))
+        if row:
+            self.codec.load_dictionary(row[0], row[1])
+            self._domain_dicts[domain] = row[0]
+            return row[0]
+        if not HAS_ZSTD or not self.dict_samples:
+            return None
+
+        samples = self._samples.get(domain)
+        if samples is None:
+            if len(self._samples) >= self.MAX_SAMPLED_DOMAINS:
+                return None # Bound the memory spent on samples; this domain gets its turn later
+            samples = self._samples[domain] = []
+        samples.append(body[:self.SAMPLE_BYTES])
+        if len(samples) < self.dict_samples:
+            return None
+
+        del self._samples[domain]
+        data = await asyncio.to_thread(self.codec.train_dictionary, samples, self.dict_size)
+        if data is None:
+            self._domain_dicts[domain] = None # Too little to train on, don't keep retrying
+            return None
+        dict_id = await self.db.write(
+            lambda conn: conn.execute("INSERT INTO raw_dicts (domain, data, samples) VALUES (?, ?, ?)", (domain, data, len(samples))).lastrowid
+        )
+        self.codec.load_dictionary(dict_id, data)
+        self._domain_dicts[domain] = dict_id
+        return dict_id
+
+    async def _ensure_dictionary(self, dict_id: Optional[int]):
+        if dict_id is not None and not self.codec.has_dictionary(dict_id):
+            row = await self.db.fetchone("SELECT data FROM raw_dicts WHERE dict_id = ?", (dict_id,))
+            self.codec.load_dictionary(dict_id, row[0])
+
+    async def _prepare(self, url: str, html: str, headers: Dict[str, Any], crawled_at=None, force_blob=False):
+        """
+        The slow half of saving a page, done before it reaches the writer:
+        compress the body (or append it to the archive) unless its blob is
+        already stored. Returns the arguments for _store().
+        """
+        body = html.encode("utf-8", "surrogatepass")
+        content_hash = hashlib.sha256(body).hexdigest()
+        headers_json = json.dumps(headers)
+        crawled_at = crawled_at or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+        blob = None if force_blob else await self.db.fetchone("SELECT codec, data FROM raw_blobs WHERE content_hash = ?", (content_hash,))
+        latest = await self.db.fetchone("SELECT content_hash FROM raw_pages WHERE url = ?", (url,))
+        changed = not latest or latest[0] != content_hash
+
+        new_blob = None # (codec, dict_id, data) to insert
+        if self.archive and (blob is None or (changed and blob[0] == CODEC_WARC)):
+            try:
+                date = datetime.strptime(crawled_at[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            except ValueError:
+                date = None
+            if blob is None:
+                location = await asyncio.to_thread(self.archive.append, url, body, headers, 200, date)
+                new_blob = (CODEC_WARC, None, ":".join(map(str, location)).encode())
+            else:
+                # Same body as an archived page: a revisit record keeps the archive complete per URL
+                location = tuple(map(int, blob[1].decode().split(":")))
+                await asyncio.to_thread(self.archive.revisit, url, location, headers, 200, date)
+        elif blob is None:
+            dict_id = await self._dictionary_for(urlparse(url).netloc.lower(), body)
+            await self._ensure_dictionary(dict_id)
+            codec, data = self.codec.compress(body, dict_id)
+            new_blob = (codec, dict_id, data)
+        return content_hash, len(body), new_blob, headers_json, crawled_at
+
+    def _store(self, conn, url: str, content_hash: str, raw_size: int, new_blob, headers_json: str, crawled_at: str) -> bool:
+        """Runs in the writer. Returns False if the blob we counted on was pruned in the meantime."""
+        if new_blob is not None:
+            codec, dict_id, data = new_blob
+            conn.execute(
+                "INSERT OR IGNORE INTO raw_blobs (content_hash, codec, dict_id, raw_size, data) VALUES (?, ?, ?, ?, ?)",
+                (content_hash, codec, dict_id, raw_size, data)
+            )
+        elif not conn.execute("SELECT 1 FROM raw_blobs WHERE content_hash = ?", (content_hash,)).fetchone():
+            return False
+
+        latest = conn.execute("SELECT content_hash FROM raw_pages WHERE url = ?", (url,)).fetchone()
+        if latest and latest[0] == content_hash:
+            # Unchanged body: refresh the latest version instead of adding one
+            conn.execute(
+                "UPDATE raw_versions SET headers = ?, crawled_at = ? WHERE id = (SELECT MAX(id) FROM raw_versions WHERE url = ?)",
+                (headers_json, crawled_at, url)
+            )
+        else:
+            conn.execute(
+                "INSERT INTO raw_versions (url, content_hash, headers, crawled_at) VALUES (?, ?, ?, ?)",
+                (url, content_hash, headers_json, crawled_at)
+            )
+            self._prune_versions(conn, url)
+        conn.execute("""
+            INSERT INTO raw_pages (url, content_hash, headers, crawled_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                content_hash=excluded.content_hash,
+                headers=excluded.headers,
+                crawled_at=excluded.crawled_at
+        """, (url, content_hash, headers_json, crawled_at))
+        return True
+
+    def _prune_versions(self, conn, url: str):
+        """Drop versions beyond max_versions, and their blobs once no version references them."""
+        old = conn.execute(
+            "SELECT id, content_hash FROM raw_versions WHERE url = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+            (url, self.max_versions)
+        ).fetchall()
+        if not old:
+            return
+        conn.executemany("DELETE FROM raw_versions WHERE id = ?", [(row[0],) for row in old])
+        conn.executemany(
+            "DELETE FROM raw_blobs WHERE content_hash = ? AND NOT EXISTS (SELECT 1 FROM raw_versions WHERE content_hash = ?)",
+            [(row[1], row[1]) for row in old]
+        )
 
     async def save_html(self, url: str, html: str, headers: Dict[str, Any]) -> bool:
         try:
-            headers_json = json.dumps(headers)
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO raw_pages (url, html, headers) 
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(url) DO UPDATE SET 
-                        html=excluded.html, 
-                        headers=excluded.headers,
-                        crawled_at=CURRENT_TIMESTAMP
-                """, (url, html, headers_json))
-                await db.commit()
+            args = await self._prepare(url, html, headers)
+            if not await self.db.write(self._store, url, *args):
+                # Another page's pruning dropped the blob between our read and write; store it ourselves
+                args = await self._prepare(url, html, headers, args[4], force_blob=True)
+                await self.db.write(self._store, url, *args)
             return True
         except Exception as e:
             print(f"Error saving HTML for {url}: {e}")
             return False
 
-    async def get_html(self, url: str) -> Optional[Dict[str, Any]]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM raw_pages WHERE url = ?", (url,))
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    "url": row["url"],
-                    "html": row["html"],
-                    "headers": json.loads(row["headers"]) if row["headers"] else {},
-                    "crawled_at": row["crawled_at"]
-                }
-            return None
+    async def _decode(self, codec: str, dict_id: Optional[int], data: bytes) -> str:
+        if codec == CODEC_WARC:
+            if self.archive is None:
+                raise RuntimeError("This page is in the WARC archive; open SQLiteRawDB with archive_dir to read it")
+            segment, offset, length = map(int, data.decode().split(":"))
+            return self.archive.read(segment, offset, length).text()
+        await self._ensure_dictionary(dict_id)
+        return self.codec.decompress(codec, data, dict_id).decode("utf-8", "surrogatepass")
+
+    async def _page(self, row) -> Dict[str, Any]:
+        # Rows are decoded here rather than on the reader threads: the codec caches aren't thread-safe
+        return {
+            "url": row[0],
+            "html": await self._decode(row[4], row[5], row[6]),
+            "headers": json.loads(row[1]) if row[1] else {},
+            "crawled_at": row[2],
+            "content_hash": row[3]
+        }
+
+    async def get_html(self, url: str, version_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """The latest stored version of a page, or a specific one from get_versions()."""
+        if version_id is None:
+            query = """
+                SELECT p.url, p.headers, p.crawled_at, p.content_hash, b.codec, b.dict_id, b.data
+                FROM raw_pages p JOIN raw_blobs b ON b.content_hash = p.content_hash WHERE p.url = ?
+            """
+            params = (url,)
+        else:
+            query = """
+                SELECT v.url, v.headers, v.crawled_at, v.content_hash, b.codec, b.dict_id, b.data
+                FROM raw_versions v JOIN raw_blobs b ON b.content_hash = v.content_hash WHERE v.url = ? AND v.id = ?
+            """
+            params = (url, version_id)
+        row = await self.db.fetchone(query, params)
+        return await self._page(row) if row else None
+
+    async def get_versions(self, url: str) -> List[Dict[str, Any]]:
+        """Stored versions of a page, newest first (without the HTML)."""
+        return await self.db.read(_dict_rows, """
+            SELECT v.id, v.content_hash, v.crawled_at, b.raw_size, length(b.data) AS stored_size
+            FROM raw_versions v JOIN raw_blobs b ON b.content_hash = v.content_hash
+            WHERE v.url = ? ORDER BY v.id DESC
+        """, (url,))
+
+    async def iter_pages(self, batch_size: int = 200, limit: Optional[int] = None):
+        """Yield the latest version of every page (or the first `limit`) as get_html() dicts, reading in batches."""
+        last_url = ""
+        while limit is None or limit > 0:
+            if limit is not None:
+                batch_size = min(batch_size, limit)
+                limit -= batch_size
+            rows = await self.db.fetchall("""
+                SELECT p.url, p.headers, p.crawled_at, p.content_hash, b.codec, b.dict_id, b.data
+                FROM raw_pages p JOIN raw_blobs b ON b.content_hash = p.content_hash
+                WHERE p.url > ? ORDER BY p.url LIMIT ?
+            """, (last_url, batch_size))
+            if not rows:
+                return
+            for row in rows:
+                yield await self._page(row)
+            last_url = rows[-1][0]
+
+    async def storage_stats(self) -> Dict[str, Any]:
+        """Page/version/blob counts and raw vs stored bytes."""
+        blobs, raw_bytes, stored_bytes = await self.db.fetchone(
+            "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(length(data)), 0) FROM raw_blobs"
+        )
+        pages, versions, dictionaries = await self.db.fetchone(
+            "SELECT (SELECT COUNT(*) FROM raw_pages), (SELECT COUNT(*) FROM raw_versions), (SELECT COUNT(*) FROM raw_dicts)"
+        )
+        stats = {
+            "pages": pages,
+            "versions": versions,
+            "blobs": blobs,
+            "dictionaries": dictionaries,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None
+        }
+        if self.archive:
+            # Archived blobs only store their location here
+            stats["archive"] = await asyncio.to_thread(self.archive.stats)
+        return stats
+
+    async def close(self):
+        await self.db.close()
+        if self.archive:
+            await asyncio.to_thread(self.archive.close)
+
     async def save_image(self, url: str, page_url: str, description: str) -> bool:
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO images (url, page_url, description) 
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(url) DO UPDATE SET 
-                        page_url=excluded.page_url,
-                        description=excluded.description,
-                        crawled_at=CURRENT_TIMESTAMP
-                """, (url, page_url, description))
-                await db.commit()
+            await self.db.execute("""
+                INSERT INTO images (url, page_url, description) 
+                VALUES (?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET 
+                    page_url=excluded.page_url,
+                    description=excluded.description,
+                    crawled_at=CURRENT_TIMESTAMP
+            """, (url, page_url, description))
             return True
         except Exception as e:
             print(f"Error saving image {url}: {e}")
             return False
 
     async def get_images(self, page_url: str) -> List[Dict[str, Any]]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM images WHERE page_url = ?", (page_url,))
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        return await self.db.read(_dict_rows, "SELECT * FROM images WHERE page_url = ?", (page_url,))
@@ -0,0 +1,166 @@
+import os
+from typing import Iterable, List
+
+import numpy as np
+
+def fingerprints(url_hashes: Iterable[str]) -> np.ndarray:
+    """Map sha256 hex url_hashes to 64-bit fingerprints (their leading 16 hex digits)."""
+    return np.array([int(h[:16], 16) for h in url_hashes], dtype=np.uint64)
+
+class BloomFilter:
+    """
+    Packed bit-array Bloom filter over 64-bit fingerprints.
+    The fingerprints are already uniformly distributed, so the k probe positions
+    are derived from them by double hashing instead of re-hashing each key.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01, bits: np.ndarray = None):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = max(int(-self.capacity * np.log(error_rate) / (np.log(2) ** 2)), 64)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * np.log(2))), 1)
+        self.bits = bits if bits is not None else np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, fps: np.ndarray) -> np.ndarray:
+        h1 = fps >> np.uint64(32)
+        h2 = (fps & np.uint64(0xFFFFFFFF)) | np.uint64(1)
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add_many(self, fps: np.ndarray):
+        if len(fps):
+            pos = self._positions(fps).ravel()
+            np.bitwise_or.at(self.bits, pos >> np.uint64(3), np.left_shift(1, pos & np.uint64(7)).astype(np.uint8))
+
+    def contains_many(self, fps: np.ndarray) -> np.ndarray:
+        if not len(fps):
+            return np.zeros(0, dtype=bool)
+        pos = self._positions(fps)
+        hits = (self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1
+        return hits.all(axis=1)
+
+class SeenURLStore:
+    """
+    Restart-safe set of seen URLs at a near-constant ~10 bits of RAM per URL.
+
+    A Bloom filter answers most lookups for links we have never seen. Anything
+    it flags as possibly seen is confirmed against a sorted array of 64-bit
+    fingerprints that is memory-mapped from `<path>.fp`, so the exact set lives
+    in the page cache instead of the Python heap. New fingerprints are staged in
+    a small in-memory buffer and merged into the sorted file in chunks by flush().
+    """
+    def __init__(self, path: str, capacity: int = 1_000_000, error_rate: float = 0.01,
+                 buffer_size: int = 50_000, merge_chunk: int = 1_000_000):
+        self.path = path
+        self.fp_path = f"{path}.fp"
+        self.bloom_path = f"{path}.bloom"
+        self.error_rate = error_rate
+        self.buffer_size = buffer_size
+        self.merge_chunk = merge_chunk
+        self.buffer = set()
+
+        self._open_base()
+        self.bloom = self._load_bloom(max(capacity, 2 * len(self.base)))
+
+    def __len__(self):
+        return len(self.base) + len(self.buffer)
+
+    def _open_base(self):
+        if os.path.exists(self.fp_path) and os.path.getsize(self.fp_path) > 0:
+            self.base = np.memmap(self.fp_path, dtype=np.uint64, mode="r")
+        else:
+            self.base = np.zeros(0, dtype=np.uint64)
+
+    def _load_bloom(self, capacity: int, rebuild: bool = False) -> BloomFilter:
+        """Load the persisted filter, or rebuild it from the fingerprint file if it is missing or stale."""
+        if not rebuild and os.path.exists(self.bloom_path):
+            with open(self.bloom_path, "rb") as f:
+                header = np.frombuffer(f.read(16), dtype=np.uint64)
+                if len(header) == 2 and header[1] == len(self.base):
+                    bloom = BloomFilter(int(header[0]), self.error_rate)
+                    bloom.bits = np.fromfile(f, dtype=np.uint8, count=len(bloom.bits))
+                    if len(bloom.bits) == (bloom.num_bits + 7) // 8:
+                        return bloom
+
+        bloom = BloomFilter(capacity, self.error_rate)
+        for i in range(0, len(self.base), self.merge_chunk):
+            bloom.add_many(np.asarray(self.base[i:i + self.merge_chunk]))
+        return bloom
+
+    def _save_bloom(self):
+        tmp_path = f"{self.bloom_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.array([self.bloom.capacity, len(self.base)], dtype=np.uint64).tofile(f)
+            self.bloom.bits.tofile(f)
+        os.replace(tmp_path, self.bloom_path)
+
+    def contains_many(self, fps: np.ndarray) -> np.ndarray:
+        """Vectorized membership test for a whole batch of fingerprints."""
+        fps = np.asarray(fps, dtype=np.uint64)
+        found = self.bloom.contains_many(fps)
+        maybe = np.flatnonzero(found)
+        if len(maybe):
+            candidates = fps[maybe]
+            in_base = np.zeros(len(maybe), dtype=bool)
+            if len(self.base):
+                idx = np.searchsorted(self.base, candidates)
+                idx[idx == len(self.base)] = 0
+                in_base = self.base[idx] == candidates
+            in_buffer = np.array([int(fp) in self.buffer for fp in candidates], dtype=bool)
+            found[maybe] = in_base | in_buffer
+        return found
+
+    def add_many(self, fps: np.ndarray) -> np.ndarray:
+        """
+        Insert a batch of fingerprints.
+        Returns a mask that is True for entries not seen before (and not repeated earlier in the batch).
+        """
+        fps = np.asarray(fps, dtype=np.uint64)
+        is_new = ~self.contains_many(fps)
+        # Only the first occurrence of a repeated fingerprint counts as new
+        _, first = np.unique(fps, return_index=True)
+        is_first = np.zeros(len(fps), dtype=bool)
+        is_first[first] = True
+        is_new &= is_first
+
+        new_fps = fps[is_new]
+        if len(new_fps):
+            if len(self) + len(new_fps) > self.bloom.capacity:
+                self.flush()
+                self.bloom = self._load_bloom(2 * (len(self) + len(new_fps)), rebuild=True)
+                self._save_bloom()
+            self.bloom.add_many(new_fps)
+            self.buffer.update(int(fp) for fp in new_fps)
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+        return is_new
+
+    def add_url_hashes(self, url_hashes: List[str]) -> np.ndarray:
+        return self.add_many(fingerprints(url_hashes))
+
+    def contains_url_hashes(self, url_hashes: List[str]) -> np.ndarray:
+        return self.contains_many(fingerprints(url_hashes))
+
+    def flush(self):
+        """Merge the staged fingerprints into the sorted file, chunk by chunk, and persist the filter."""
+        if not self.buffer:
+            return
+
+        staged = np.sort(np.fromiter(self.buffer, dtype=np.uint64, count=len(self.buffer)))
+        tmp_path = f"{self.fp_path}.tmp"
+        with open(tmp_path, "wb") as out:
+            start = 0
+            for i in range(0, len(self.base), self.merge_chunk):
+                chunk = np.asarray(self.base[i:i + self.merge_chunk])
+                end = np.searchsorted(staged, chunk[-1], side="right")
+                merged = np.concatenate([chunk, staged[start:end]])
+                merged.sort(kind="mergesort")
+                merged.tofile(out)
+                start = end
+            staged[start:].tofile(out)
+
+        # Drop the old mapping before replacing the file underneath it
+        self.base = None
+        os.replace(tmp_path, self.fp_path)
+        self.buffer.clear()
+        self._open_base()
+        self._save_bloom()
@@ -0,0 +1,156 @@
+import os
+import re
+import time
+from collections import Counter
+from urllib.parse import urlparse, parse_qsl
+
+DROP = "drop" # Never worth a fetch
+DEMOTE = "demote" # Crawl only once better URLs have run out
+
+# Nothing we could index behind these
+BINARY_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".bmp", ".tif", ".tiff", ".avif",
+    ".mp3", ".mp4", ".m4a", ".m4v", ".avi", ".mov", ".wmv", ".webm", ".ogg", ".wav", ".flac", ".mkv",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".rar", ".7z", ".tar", ".iso", ".dmg", ".exe", ".msi", ".apk", ".bin", ".deb", ".rpm",
+    ".woff", ".woff2", ".ttf", ".eot", ".otf", ".swf", ".jar", ".class", ".dll", ".so",
+}
+
+SESSION_PARAMS = {"sid", "sessionid", "session_id", "phpsessid", "jsessionid", "aspsessionid", "cfid", "cftoken"}
+DATE_PARAMS = {"date", "day", "month", "year", "cal", "calendar"}
+# Also used for offsets (?start=2100), so these only count when the value is a date
+RANGE_PARAMS = {"from", "to", "start", "end"}
+
+DIGITS = re.compile(r"\d+")
+HEX_ID = re.compile(r"^[0-9a-fA-F-]{16,}$")
+YEAR = re.compile(r"(?<!\d)((?:1[89]|2\d)\d{2})(?!\d)")
+PATH_DATE = re.compile(r"(?<!\d)((?:1[89]|2\d)\d{2})[-/](?:0?[1-9]|1[0-2])(?!\d)")
+DATE_VALUE = re.compile(r"^((?:1[89]|2\d)\d{2})-(?:0?[1-9]|1[0-2])(?:-\d{1,2})?(?:[T ].*)?$")
+
+class URLClassifier:
+    """
+    Cheap per-URL checks that catch spider traps and low-value URLs before
+    they are queued, so they never cost a robots check, a fetch or a parse.
+
+    classify() returns (action, reason): (None, None) for a normal URL, DROP
+    for URLs not worth fetching at all and DEMOTE for ones to fetch last.
+      - binary_extension: images, media, archives, executables, fonts
+      - repeated_path: a path segment repeated max_repeats times (/a/b/a/b/a/b)
+      - deep_path: more than max_depth path segments
+      - calendar: a date more than a year in the future or before min_year
+      - session_id: session tokens in the query (demoted; ;jsessionid= path
+        params are already stripped by URLNormalizer)
+      - many_params: more than max_params query parameters (demoted)
+      - param_explosion: a path (numbers generalised) already seen with
+        max_variants distinct query strings (faceted search, sort/filter
+        combinations)
+      - pattern_growth: a host that keeps producing new path templates
+        beyond max_templates (demoted)
+
+    The last two use streaming per-host counts held in memory, bounded by
+    max_variants per path, max_templates templates and paths with queries
+    per host, and max_hosts hosts (the least recently added host is
+    forgotten first). Counts per (action, reason) are kept in `stats`.
+    """
+    def __init__(self, max_repeats=3, max_depth=16, max_params=6, max_variants=500,
+                 max_templates=5000, max_hosts=100_000, min_year=1995):
+        self.max_repeats = max_repeats
+        self.max_depth = max_depth
+        self.max_params = max_params
+        self.max_variants = max_variants
+        self.max_templates = max_templates
+        self.max_hosts = max_hosts
+        self.min_year = min_year
+        self.max_year = time.gmtime().tm_year + 1
+        self.hosts = {} # host -> (set of path templates, {path shape -> set of query string hashes})
+        self.stats = Counter()
+
+    def shape(self, path):
+        """Path with its variable parts generalised: numbers become N and long hex ids X."""
+        shape = []
+        for segment in path.split("/"):
+            if HEX_ID.match(segment) and any(c.isdigit() for c in segment):
+                shape.append("X")
+            else:
+                shape.append(DIGITS.sub("N", segment.lower()))
+        return "/".join(shape)
+
+    def template(self, path):
+        """The path's shape with the last segment (the page itself) as *."""
+        head, _, leaf = self.shape(path).rpartition("/")
+        return f"{head}/*" if leaf else f"{head}/"
+
+    def _static(self, parsed, params):
+        path = parsed.path
+        segments = [s for s in path.lower().split("/") if s]
+        if os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS:
+            return DROP, "binary_extension"
+        if len(segments) > self.max_depth:
+            return DROP, "deep_path"
+        if segments and Counter(segments).most_common(1)[0][1] >= self.max_repeats:
+            return DROP, "repeated_path"
+
+        years = [int(y) for y in PATH_DATE.findall(path)]
+        for key, value in params:
+            key = key.lower()
+            if key in DATE_PARAMS:
+                years += [int(y) for y in YEAR.findall(value)]
+            elif key in RANGE_PARAMS:
+                date = DATE_VALUE.match(value)
+                if date:
+                    years.append(int(date.group(1)))
+        if any(y < self.min_year or y > self.max_year for y in years):
+            return DROP, "calendar"
+
+        if any(key.lower() in SESSION_PARAMS for key, _ in params):
+            return DEMOTE, "session_id"
+        if len(params) > self.max_params:
+            return DEMOTE, "many_params"
+        return None, None
+
+    def _observe(self, host, path, query):
+        counts = self.hosts.get(host)
+        if counts is None:
+            if len(self.hosts) >= self.max_hosts:
+                del self.hosts[next(iter(self.hosts))]
+            counts = self.hosts[host] = (set(), {})
+        templates, paths = counts
+
+        if query:
+            shape = self.shape(path)
+            variants = paths.get(shape)
+            if variants is None and len(paths) < self.max_templates:
+                variants = paths[shape] = set()
+            if variants is not None:
+                key = hash(query)
+                if key not in variants:
+                    if len(variants) >= self.max_variants:
+                        return DROP, "param_explosion"
+                    variants.add(key)
+
+        template = self.template(path)
+        if template not in templates:
+            if len(templates) >= self.max_templates:
+                return DEMOTE, "pattern_growth"
+            templates.add(template)
+        return None, None
+
+    def classify(self, url):
+        """(action, reason) for a normalized http(s) URL; (None, None) if it looks fine."""
+        try:
+            parsed = urlparse(url)
+            params = parse_qsl(parsed.query, keep_blank_values=True)
+        except ValueError:
+            return DROP, "unparseable"
+
+        action, reason = self._static(parsed, params)
+        if action != DROP:
+            observed = self._observe(parsed.netloc.lower(), parsed.path, parsed.query)
+            if observed[0] == DROP or action is None:
+                action, reason = observed
+        if action:
+            self.stats[(action, reason)] += 1
+        return action, reason
+
+    def report(self):
+        """Counts per action and reason since startup, most common first."""
+        return [{"action": action, "reason": reason, "count": count} for (action, reason), count in self.stats.most_common()]
@@ -0,0 +1,114 @@
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Query parameters that only say where a click came from, never what the page shows
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "gclsrc", "dclid", "msclkid", "yclid", "twclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "ref_src", "ref_url", "spm", "vero_id", "oly_enc_id", "oly_anon_id",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+
+# Bump when the default rules change: URLFrontier then aliases the URLs it stored to their new spelling
+RULES_VERSION = 1
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+UNRESERVED = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+PERCENT_ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+
+def _normalize_escape(match):
+    char = chr(int(match.group(1), 16))
+    # %7E -> ~, but %2F stays an escape (it means something different from /)
+    return char if char in UNRESERVED else "%" + match.group(1).upper()
+
+class URLNormalizer:
+    """
+    Maps the many spellings of a URL to one, so the same page is queued and
+    fetched once. Shared by URLFrontier and FrontierAgent; every rule can be
+    switched off:
+      - lowercase scheme and host, drop the fragment and ;params (always)
+      - strip_www: www.example.com -> example.com
+      - default_ports: drop :80 on http and :443 on https
+      - percent_encoding: uppercase escapes and decode unreserved characters (%7e -> ~)
+      - trailing_slash: /docs/ -> /docs (the root path is always /)
+      - tracking: drop utm_*, fbclid, gclid and the like (see TRACKING_PARAMS)
+      - sort_query: order query parameters, dropping empty ones
+    `stats` counts how many URLs each rule rewrote.
+    """
+    def __init__(self, strip_www=True, default_ports=True, percent_encoding=True, trailing_slash=True,
+                 tracking=True, sort_query=True, tracking_params=TRACKING_PARAMS, tracking_prefixes=TRACKING_PREFIXES):
+        self.strip_www = strip_www
+        self.default_ports = default_ports
+        self.percent_encoding = percent_encoding
+        self.trailing_slash = trailing_slash
+        self.tracking = tracking
+        self.sort_query = sort_query
+        self.tracking_params = set(tracking_params)
+        self.tracking_prefixes = tuple(tracking_prefixes)
+        self.stats = Counter()
+
+    def is_tracking(self, param):
+        key = param.split("=", 1)[0].lower()
+        return key in self.tracking_params or key.startswith(self.tracking_prefixes)
+
+    def _host(self, parts, scheme, stats):
+        try:
+            port = parts.port
+        except ValueError:
+            return parts.netloc.lower() # Not a number or out of range, leave it for the fetch to fail on
+        host = parts.hostname or ""
+        if ":" in host:
+            host = f"[{host}]" # IPv6 literal
+        if self.strip_www and host.startswith("www."):
+            host = host[4:]
+            stats["www"] += 1
+        if port is not None:
+            if self.default_ports and DEFAULT_PORTS.get(scheme) == port:
+                stats["default_port"] += 1
+            else:
+                host = f"{host}:{port}"
+        return host
+
+    def host(self, url):
+        """Just the normalized host (with a non-default port), e.g. for sharding by host."""
+        parts = urlsplit(url.strip())
+        return self._host(parts, parts.scheme.lower(), Counter())
+
+    def normalize(self, url):
+        """Normalize an absolute URL. urlsplit's ValueError (e.g. a broken IPv6 host) is passed on."""
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = self._host(parts, scheme, self.stats)
+
+        path = parts.path.split(";", 1)[0]
+        query = parts.query
+        if self.percent_encoding and "%" in url:
+            new_path = PERCENT_ESCAPE.sub(_normalize_escape, path)
+            new_query = PERCENT_ESCAPE.sub(_normalize_escape, query)
+            if (new_path, new_query) != (path, query):
+                self.stats["percent_encoding"] += 1
+            path, query = new_path, new_query
+
+        if not path:
+            path = "/"
+        elif self.trailing_slash and len(path) > 1 and path.endswith("/"):
+            path = path.rstrip("/") or "/"
+            self.stats["trailing_slash"] += 1
+
+        if query:
+            params = query.split("&")
+            if self.tracking:
+                kept = [p for p in params if not self.is_tracking(p)]
+                if len(kept) != len(params):
+                    self.stats["tracking"] += 1
+                params = kept
+            if self.sort_query:
+                params = sorted(p for p in params if p)
+            query = "&".join(params)
+
+        normalized = f"{scheme}://{host}{path}"
+        if query:
+            normalized = f"{normalized}?{query}"
+        return normalized
+
+    __call__ = normalize
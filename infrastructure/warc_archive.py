@@ -0,0 +1,457 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SEGMENT_BYTES = 512 * 2**20
+COMMIT_EVERY = 100 # Index rows per commit; a crash loses nothing, open() re-indexes the tail of the last segment
+
+# Hop-by-hop and encoding headers that no longer describe the stored (decoded) payload
+DROPPED_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection"}
+REVISIT_PROFILE = "http://netpreserve.org/warc/1.1/revisit/identical-payload-digest"
+
+class WarcRecord:
+    """
+    A response (or revisit) record read from the archive. For uncompressed
+    segments `payload` is a memoryview into the mapped segment (no copy); it
+    stays valid until the archive is closed. Revisits have an empty payload.
+    """
+    __slots__ = ("kind", "url", "date", "status", "headers", "payload", "digest", "location")
+
+    def __init__(self, kind, url, date, status, headers, payload, digest, location):
+        self.kind = kind
+        self.url = url
+        self.date = date
+        self.status = status
+        self.headers = headers
+        self.payload = payload
+        self.digest = digest
+        self.location = location # (segment, offset, length)
+
+    def text(self) -> str:
+        return str(self.payload, "utf-8", "replace")
+
+def _clean(value) -> str:
+    # Header values must stay on one line
+    return str(value).replace("\r", " ").replace("\n", " ")
+
+def _warc_record(warc_type: str, fields: Dict[str, str], block: bytes) -> bytes:
+    lines = [
+        "WARC/1.1",
+        f"WARC-Type: {warc_type}",
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+        *(f"{name}: {_clean(value)}" for name, value in fields.items()),
+        f"Content-Length: {len(block)}",
+    ]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + block + b"\r\n\r\n"
+
+def _http_head(status: int, headers: Optional[Dict[str, str]], length: int) -> bytes:
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    lines += [f"{name}: {_clean(value)}" for name, value in (headers or {}).items() if name.lower() not in DROPPED_HEADERS]
+    lines.append(f"Content-Length: {length}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+def _parse_fields(head: bytes) -> Tuple[str, Dict[str, str]]:
+    first, *lines = head.decode("utf-8", "replace").split("\r\n")
+    fields = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        fields[name.strip()] = value.strip()
+    return first, fields
+
+def _parse_record(buf, pos: int, end: int):
+    """
+    Parse the WARC record at buf[pos:end] (buf is an mmap or bytes).
+    Returns (fields, block_start, block_end, next_pos), or None if the record is incomplete.
+    """
+    head_end = buf.find(b"\r\n\r\n", pos, end)
+    if head_end < 0:
+        return None
+    version, fields = _parse_fields(buf[pos:head_end])
+    if not version.startswith("WARC/"):
+        raise ValueError(f"No WARC record at offset {pos}")
+    block_start = head_end + 4
+    block_end = block_start + int(fields["Content-Length"])
+    if block_end + 4 > end:
+        return None
+    return fields, block_start, block_end, block_end + 4
+
+def _gzip_member(buf, pos: int, end: int, chunk_size: int = 1 << 16):
+    """Decompress the gzip member at buf[pos:end]. Returns (data, next_pos), or None if it is truncated."""
+    decompressor = zlib.decompressobj(31)
+    out = []
+    p = pos
+    while not decompressor.eof and p < end:
+        chunk = buf[p:min(p + chunk_size, end)]
+        out.append(decompressor.decompress(chunk))
+        p += len(chunk)
+    if not decompressor.eof:
+        return None
+    return b"".join(out), p - len(decompressor.unused_data)
+
+class WarcArchive:
+    """
+    Append-only archive of crawled pages in WARC 1.1 segment files.
+
+    Each page is a `response` record (HTTP status line, headers, payload)
+    appended to the current segment; segments roll over at `segment_bytes`,
+    and with `compress` every record is its own gzip member, as in .warc.gz.
+    A SQLite index next to the segments maps the url_hash (sha256 of the URL)
+    to (segment, offset, length) of every record, so a lookup is one index
+    probe plus one slice of a memory-mapped segment. Bulk jobs use scan() or
+    iter_latest(), which walk the segments sequentially.
+
+    A URL whose body is already archived gets a small `revisit` record
+    instead (identical-payload-digest profile); its index entry points at the
+    record holding the payload.
+
+    Payloads are stored as the UTF-8 text the fetcher decoded, so the
+    Content-Encoding/Length headers of the original response are dropped.
+    The index can always be rebuilt from the segments with rebuild_index().
+    """
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES, compress: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compress = compress
+        self.extension = ".warc.gz" if compress else ".warc"
+        self.lock = threading.Lock()
+        self.index = None
+        self.segment = None # Number of the segment being appended to
+        self.file = None
+        self.size = 0
+        self._maps = {} # segment -> mmap
+        self._uncommitted = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"crawl-{segment:05d}{self.extension}")
+
+    def segments(self) -> List[int]:
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith("crawl-") and name.endswith(self.extension):
+                number = name[len("crawl-"):-len(self.extension)]
+                if number.isdigit():
+                    found.append(int(number))
+        return sorted(found)
+
+    def open(self):
+        if self.index is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url_hash TEXT NOT NULL,
+                url TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                digest TEXT,
+                date TEXT
+            )
+        """)
+        self.index.execute("CREATE INDEX IF NOT EXISTS idx_records_url ON records(url_hash, id)")
+        self.index.execute("CREATE INDEX IF NOT EXISTS idx_records_location ON records(segment, offset)")
+        self.index.commit()
+
+        segments = self.segments()
+        if segments:
+            self.segment = segments[-1]
+            self._recover(self.segment)
+            self.file = open(self.segment_path(self.segment), "ab")
+            self.size = self.file.tell()
+        else:
+            self._roll(0)
+
+    def _recover(self, segment: int):
+        """Index records written after the last index commit, and cut off a half-written record at the end."""
+        path = self.segment_path(segment)
+        row = self.index.execute("SELECT MAX(offset + length) FROM records WHERE segment = ?", (segment,)).fetchone()
+        pos = row[0] or 0
+        size = os.path.getsize(path)
+        if pos >= size:
+            return
+        with open(path, "rb") as f:
+            f.seek(pos)
+            data = f.read()
+        good = 0
+        payloads = {}
+        try:
+            for offset, length, record in self._records(data, 0, len(data)):
+                if record is not None:
+                    record.location = (segment, pos + offset, length)
+                    self._index_record(record, payloads)
+                good = offset + length
+        except (ValueError, KeyError, zlib.error):
+            pass # Garbage after the last good record, e.g. a torn write
+        if pos + good < size:
+            print(f"Truncating {size - pos - good} bytes of an incomplete record in {path}")
+            with open(path, "r+b") as f:
+                f.truncate(pos + good)
+        self.index.commit()
+
+    def _roll(self, segment: int):
+        if self.file is not None:
+            self.file.close()
+            self.index.commit() # Records of older segments are never re-indexed by _recover
+        self.segment = segment
+        self.file = open(self.segment_path(segment), "ab")
+        self.size = self.file.tell()
+        if self.size == 0:
+            info = f"software: search-engine crawler\r\nformat: WARC File Format 1.1\r\n".encode()
+            self._write(_warc_record("warcinfo", {
+                "WARC-Date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "WARC-Filename": os.path.basename(self.segment_path(segment)),
+                "Content-Type": "application/warc-fields",
+            }, info))
+
+    def _write(self, record: bytes) -> Tuple[int, int]:
+        if self.compress:
+            record = zlib.compress(record, wbits=31) # One gzip member per record
+        offset = self.size
+        self.file.write(record)
+        self.size += len(record)
+        return offset, len(record)
+
+    def append(self, url: str, body: bytes, headers: Optional[Dict[str, str]] = None, status: int = 200,
+               date: Optional[datetime] = None) -> Tuple[int, int, int]:
+        """Append a response record for url. Returns its (segment, offset, length)."""
+        date = (date or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        digest = "sha256:" + hashlib.sha256(body).hexdigest()
+        record = _warc_record("response", {
+            "WARC-Target-URI": url,
+            "WARC-Date": date,
+            "WARC-Payload-Digest": digest,
+            "Content-Type": "application/http; msgtype=response",
+        }, _http_head(status, headers, len(body)) + body)
+        return self._append(record, url, digest, date)
+
+    def revisit(self, url: str, location: Tuple[int, int, int], headers: Optional[Dict[str, str]] = None,
+                status: int = 200, date: Optional[datetime] = None) -> Tuple[int, int, int]:
+        """Record url as serving the payload of the record at `location`. Returns that location."""
+        original = self.read(*location)
+        date = (date or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        record = _warc_record("revisit", {
+            "WARC-Target-URI": url,
+            "WARC-Date": date,
+            "WARC-Profile": REVISIT_PROFILE,
+            "WARC-Refers-To-Target-URI": original.url,
+            "WARC-Refers-To-Date": original.date,
+            "WARC-Payload-Digest": original.digest,
+            "Content-Type": "application/http; msgtype=response",
+        }, _http_head(status, headers, len(original.payload)))
+        self._append(record, url, original.digest, date, location)
+        return location
+
+    def _append(self, record: bytes, url: str, digest: str, date: str, payload_location=None) -> Tuple[int, int, int]:
+        with self.lock:
+            if self.size >= self.segment_bytes:
+                self._roll(self.segment + 1)
+            offset, length = self._write(record)
+            self.file.flush() # Readers map the file, so the bytes must reach the OS before we index them
+            location = payload_location or (self.segment, offset, length)
+            self.index.execute(
+                "INSERT INTO records (url_hash, url, segment, offset, length, digest, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (hashlib.sha256(url.encode()).hexdigest(), url, *location, digest, date)
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_EVERY:
+                self.index.commit()
+                self._uncommitted = 0
+        return location
+
+    def _index_record(self, record: WarcRecord, payloads: Dict[str, Tuple[int, int, int]]):
+        """Index a record found on disk. `payloads` maps digests to the latest response holding them."""
+        if record.kind == "response":
+            location = payloads[record.digest] = record.location
+        else:
+            location = payloads.get(record.digest)
+            if location is None:
+                row = self.index.execute(
+                    "SELECT segment, offset, length FROM records WHERE digest = ? ORDER BY id DESC LIMIT 1", (record.digest,)
+                ).fetchone()
+                if row is None:
+                    return # The payload it refers to is gone
+                location = row
+        self.index.execute(
+            "INSERT INTO records (url_hash, url, segment, offset, length, digest, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (hashlib.sha256(record.url.encode()).hexdigest(), record.url, *location, record.digest, record.date)
+        )
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # The active segment grows, so remap it when a read goes past the old mapping.
+            # The old map is left to the GC, since payload views of it may still be alive.
+            with open(self.segment_path(segment), "rb") as f:
+                mapped = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+    def _response(self, buf, fields, block_start, block_end, location) -> WarcRecord:
+        head_end = buf.find(b"\r\n\r\n", block_start, block_end)
+        if head_end < 0:
+            head_end = block_end - 4 # A revisit's block may end right after the HTTP headers
+        status_line, headers = _parse_fields(buf[block_start:head_end])
+        parts = status_line.split(" ", 2)
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+        payload = memoryview(buf)[min(head_end + 4, block_end):block_end]
+        return WarcRecord(fields.get("WARC-Type"), fields.get("WARC-Target-URI"), fields.get("WARC-Date"), status,
+                          headers, payload, fields.get("WARC-Payload-Digest"), location)
+
+    def _records(self, buf, pos: int, end: int, segment: Optional[int] = None) -> Iterator[Tuple[int, int, Optional[WarcRecord]]]:
+        """Walk the records in buf[pos:end], yielding (offset, length, record), with None for records other than responses/revisits."""
+        while pos < end:
+            if self.compress:
+                member = _gzip_member(buf, pos, end)
+                if member is None:
+                    return
+                data, next_pos = member
+                parsed = _parse_record(data, 0, len(data))
+                if parsed is None:
+                    return
+                source = data
+            else:
+                parsed = _parse_record(buf, pos, end)
+                if parsed is None:
+                    return
+                next_pos = parsed[3]
+                source = buf
+            fields, block_start, block_end, _ = parsed
+            record = None
+            if fields.get("WARC-Type") in ("response", "revisit"):
+                record = self._response(source, fields, block_start, block_end, (segment, pos, next_pos - pos))
+            yield pos, next_pos - pos, record
+            pos = next_pos
+
+    def read(self, segment: int, offset: int, length: int) -> WarcRecord:
+        """The record at a known location: one slice of the mapped segment."""
+        mapped = self._map(segment, offset + length)
+        if self.compress:
+            data = zlib.decompress(mapped[offset:offset + length], wbits=31)
+            fields, block_start, block_end, _ = _parse_record(data, 0, len(data))
+            return self._response(data, fields, block_start, block_end, (segment, offset, length))
+        fields, block_start, block_end, _ = _parse_record(mapped, offset, offset + length)
+        return self._response(mapped, fields, block_start, block_end, (segment, offset, length))
+
+    def get(self, url: str) -> Optional[WarcRecord]:
+        """Latest record for url (with the payload, for revisits), or None."""
+        with self.lock:
+            row = self.index.execute(
+                "SELECT segment, offset, length FROM records WHERE url_hash = ? ORDER BY id DESC LIMIT 1",
+                (hashlib.sha256(url.encode()).hexdigest(),)
+            ).fetchone()
+        if row is None:
+            return None
+        record = self.read(*row)
+        record.url = url
+        return record
+
+    def history(self, url: str) -> List[Dict]:
+        """Index entries of every record for url, newest first."""
+        with self.lock:
+            rows = self.index.execute(
+                "SELECT id, segment, offset, length, digest, date FROM records WHERE url_hash = ? ORDER BY id DESC",
+                (hashlib.sha256(url.encode()).hexdigest(),)
+            ).fetchall()
+        return [
+            {"id": row[0], "location": (row[1], row[2], row[3]), "digest": row[4], "date": row[5]}
+            for row in rows
+        ]
+
+    def scan(self, segments: Optional[List[int]] = None) -> Iterator[WarcRecord]:
+        """Every response record, in the order written, reading the segments sequentially without the index."""
+        with self.lock:
+            self.file.flush()
+        for segment in segments if segments is not None else self.segments():
+            path = self.segment_path(segment)
+            size = os.path.getsize(path)
+            if size == 0:
+                continue
+            mapped = self._map(segment, size)
+            for _, _, record in self._records(mapped, 0, size, segment):
+                if record is not None and record.kind == "response":
+                    yield record
+
+    def iter_latest(self) -> Iterator[WarcRecord]:
+        """The latest record of every URL, in disk order so the segments are still read sequentially."""
+        with self.lock:
+            self.index.commit()
+            rows = self.index.execute("""
+                SELECT url, segment, offset, length FROM records
+                WHERE id IN (SELECT MAX(id) FROM records GROUP BY url_hash)
+                ORDER BY segment, offset
+            """).fetchall()
+        for url, *location in rows:
+            record = self.read(*location)
+            record.url = url
+            yield record
+
+    def rebuild_index(self):
+        """Recreate the index from the segment files."""
+        with self.lock:
+            self.file.flush()
+            self.index.execute("DELETE FROM records")
+            payloads = {}
+            for segment in self.segments():
+                size = os.path.getsize(self.segment_path(segment))
+                if size == 0:
+                    continue
+                for _, _, record in self._records(self._map(segment, size), 0, size, segment):
+                    if record is not None:
+                        self._index_record(record, payloads)
+            self.index.commit()
+            self._uncommitted = 0
+
+    def stats(self) -> Dict:
+        with self.lock:
+            records, urls = self.index.execute("SELECT COUNT(*), COUNT(DISTINCT url_hash) FROM records").fetchone()
+        segments = self.segments()
+        return {
+            "segments": len(segments),
+            "records": records,
+            "urls": urls,
+            "bytes": sum(os.path.getsize(self.segment_path(s)) for s in segments),
+        }
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+            if self.index is not None:
+                self.index.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if self.index is not None:
+                self.index.close()
+                self.index = None
+            for mapped in self._maps.values():
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass # A record's payload view still points into it; the GC closes it later
+            self._maps = {}
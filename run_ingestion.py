@@ -61,6 +61,7 @@ async def process_one_off_url(url: str):
     
     # Force flush embeddings
     await index_agent._flush_batch()
+    crawl_agent.close()
     
     vectors_saved = state["chunks_generated"] if state["clean_hash"] else 0
     chunks_saved = state["chunks_generated"] if state["clean_hash"] else 0
@@ -13,6 +13,30 @@ from agents.index_agent import IndexAgent
 from agents.frontier_agent import FrontierAgent
 from agents.image_agent import ImageAgent
 
+from crawler.fetcher import Fetcher
+from crawler.sitemap import SitemapLoader
+
+async def seed_from_sitemaps(frontier_agent: FrontierAgent, start_urls: list, batch_size: int = 1000):
+    """Feed the seed hosts' sitemap URLs through the frontier agent, a batch at a time."""
+    # crawl_targets has no priorities, so lastmod isn't used here (the crawler/ frontier ranks by it)
+    fetcher = Fetcher()
+    await fetcher.initialize()
+    try:
+        loader = SitemapLoader(fetcher)
+        for url in start_urls:
+            batch = []
+            async for loc, _ in loader.entries(url):
+                batch.append(loc)
+                if len(batch) >= batch_size:
+                    await frontier_agent.process_message({"base_url": url, "links": batch})
+                    batch = []
+            if batch:
+                await frontier_agent.process_message({"base_url": url, "links": batch})
+    except Exception as e:
+        print(f"Error seeding from sitemaps: {e}")
+    finally:
+        await fetcher.close()
+
 async def run_spider(start_urls: list, allowed_domains: list):
     # 1. Init Infra
     mq = MemoryMessageQueue()
@@ -61,6 +85,7 @@ async def run_spider(start_urls: list, allowed_domains: list):
             "base_url": url,
             "links": [url] 
         })
+    await seed_from_sitemaps(frontier_agent, start_urls)
         
     # The architecture will now spin infinitely.
     # The frontier adds to the crawl queue. 
@@ -72,10 +97,16 @@ async def run_spider(start_urls: list, allowed_domains: list):
             # Flush indexes periodically
             if index_agent.current_batch:
                 await index_agent._flush_batch()
+            frontier_agent.maybe_flush()
     except asyncio.CancelledError:
         pass
     except KeyboardInterrupt:
         print("\n=== Stopping Crotal Bot ===")
+    finally:
+        # Keep the seen set, so a restart doesn't queue everything again
+        frontier_agent.close()
+        for ca in crawl_agents:
+            ca.close()
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -6,7 +6,6 @@ from typing import List, Optional
 from whoosh.index import open_dir
 from whoosh.qparser import QueryParser, MultifieldParser
 import os
-import aiosqlite
 import time
 import asyncio
 import json
@@ -119,6 +118,12 @@ import sys
 # We need to add the parent directory to sys.path to easily import the crawler module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from crawler.main import CrawlerManager
+from crawler.anchors import SEARCH_BOOST as ANCHOR_BOOST
+from crawler.budget import budget_report
+from crawler.frontier import dedup_report, dropped_report
+from crawler.pagerank import StaticRankBM25F
+from crawler.telemetry import TelemetryStore, telemetry_dir
+from infrastructure.database import Database
 
 app = FastAPI(title="Nexus Search API")
 
@@ -127,6 +132,8 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 INDEX_DIR = os.path.join(os.path.dirname(BASE_DIR), "whoosh_index")
 DB_PATH = os.path.join(os.path.dirname(BASE_DIR), "crawler_data.db")
+# Held for the app's lifetime, so a background crawl closing its own references never closes it under a request
+crawl_db = Database.shared(DB_PATH)
 
 # Mount the static directory to serve index.html, style.css, script.js
 # This means navigating to http://localhost:8000/ will load index.html
@@ -197,10 +204,12 @@ async def search(q: str, page: int = 1, page_size: int = 15, type: str = "all"):
                 t_pages = 0
                 try:
                     ix = open_dir(INDEX_DIR)
-                    qparser = MultifieldParser(["title", "content"], schema=ix.schema)
+                    # Anchor text (what other pages call this one) is matched too, with a boost
+                    qparser = MultifieldParser(["title", "content", "anchor"], schema=ix.schema, fieldboosts={"anchor": ANCHOR_BOOST})
                     query_obj = qparser.parse(q)
                     
-                    with ix.searcher() as searcher:
+                    # BM25F boosted by each page's static rank (PageRank over the crawl graph)
+                    with ix.searcher(weighting=StaticRankBM25F()) as searcher:
                         corrector = searcher.corrector("content")
                         sug = corrector.suggest(q, limit=1)
                         if sug and sug[0] != q.lower():
@@ -445,12 +454,9 @@ async def suggest(q: str):
 async def get_stats():
     """Return some cool stats for the frontend dashboard."""
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("SELECT COUNT(*) FROM pages") as cursor:
-                pages = await cursor.fetchone()
-            async with db.execute("SELECT COUNT(*) FROM discovered_links") as cursor:
-                links = await cursor.fetchone()
-                
+        pages = await crawl_db.fetchone("SELECT COUNT(*) FROM pages")
+        links = await crawl_db.fetchone("SELECT COUNT(*) FROM discovered_links")
+
         return {
             "indexed_pages": pages[0] if pages else 0,
             "discovered_links": links[0] if links else 0
@@ -459,6 +465,51 @@ async def get_stats():
         print(f"Stats API error: {e}")
         return {"indexed_pages": 0, "discovered_links": 0}
 
+@app.get("/api/telemetry")
+async def get_telemetry(window: int = 3600, by: str = "minute", host: Optional[str] = None, limit: int = 500):
+    """Crawl health from the telemetry rollups: fetches, p50/p95/p99 latency, bytes and status mix."""
+    if by not in ("minute", "hour", "host"):
+        raise HTTPException(status_code=400, detail="by must be minute, hour or host")
+    store = TelemetryStore(telemetry_dir(DB_PATH))
+    window = max(60, min(window, 365 * 86400))
+    try:
+        rows = await asyncio.to_thread(store.summary, window, by, host, None, limit)
+        totals = await asyncio.to_thread(store.summary, window, "total", host)
+    except Exception as e:
+        print(f"Telemetry API error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read telemetry")
+    return {"window": window, "by": by, "host": host, "totals": totals[0] if totals else None, "rows": rows}
+
+@app.get("/api/budget")
+async def get_budget(limit: int = 100):
+    """Per-domain crawl budget use: pages done and queued against their caps, and URLs turned away."""
+    # Use the running crawler's budget (and weights) if this process has one
+    budget = CrawlerManager._instance.frontier.budget if hasattr(CrawlerManager, "_instance") else None
+    try:
+        domains = await crawl_db.read(budget_report, budget, max(1, min(limit, 10000)))
+    except Exception as e:
+        print(f"Budget API error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read crawl budgets")
+    return {"domains": domains}
+
+@app.get("/api/dropped")
+async def get_dropped(limit: int = 20):
+    """URLs the spider-trap classifier kept out of the frontier (each one a fetch saved), by reason and domain."""
+    try:
+        return await crawl_db.read(dropped_report, max(1, min(limit, 1000)))
+    except Exception as e:
+        print(f"Dropped URLs API error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read dropped URLs")
+
+@app.get("/api/dedup")
+async def get_dedup():
+    """URL dedup rate: links the normalizer rewrote into known URLs and queued URLs skipped as canonical aliases."""
+    try:
+        return await crawl_db.read(dedup_report)
+    except Exception as e:
+        print(f"Dedup API error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read dedup stats")
+
 class CrawlRequest(BaseModel):
     url: str
 
@@ -484,14 +535,14 @@ async def websocket_admin_endpoint(websocket: WebSocket):
         while True:
             try:
                 # Fetch live stats from the active crawler schema
-                async with aiosqlite.connect(DB_PATH) as db:
-                    async with db.execute("SELECT COUNT(*) FROM raw_pages") as cursor:
-                        pages = await cursor.fetchone()
+                pages = await crawl_db.fetchone("SELECT COUNT(*) FROM raw_pages")
                         
-                # Get DB file size in MB
+                # Get DB file size in MB (recent writes sit in the WAL until a checkpoint)
                 db_size_mb = 0
-                if os.path.exists(DB_PATH):
-                    db_size_mb = round(os.path.getsize(DB_PATH) / (1024 * 1024), 2)
+                for path in (DB_PATH, DB_PATH + "-wal"):
+                    if os.path.exists(path):
+                        db_size_mb += os.path.getsize(path) / (1024 * 1024)
+                db_size_mb = round(db_size_mb, 2)
                 
                 payload = {
                     "indexed_pages": pages[0] if pages else 0,